@@ -1,38 +1,33 @@
+import re
 import json
-import hashlib
+import time
+import asyncio
 import logging
-import redis
 
 from models import AgentOutput
-from typing import Any, Dict, Optional
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
-from langchain_openai import ChatOpenAI
-from models import AssetSnapshot
+from langchain_core.utils.json import parse_partial_json
+from models import AssetSnapshot, AssetResults
+from agent_cache import agent_cache
+from rule_analyzer import analyze_rules
+from pipeline import CircuitBreaker
+from prompt_encoder import encode_prompt_inputs, count_tokens
 
 from config import (
-    REDIS_HOST,
-    REDIS_PORT, 
-    REDIS_DB,
     OPENAI_API_KEY,
-    AGENT_CACHE_TTL
-)
-
-redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB)
-
-llm = ChatOpenAI(
-    model_name="gpt-4o-mini", 
-    temperature=0.2, 
-    openai_api_key=OPENAI_API_KEY, 
-    max_tokens=800,
-    model_kwargs={"response_format": {"type": "json_object"}}
+    AGENT_BACKEND,
+    AGENT_DEADLINE_SECONDS,
+    AGENT_BREAKER_FAILURES,
+    AGENT_BREAKER_RESET_SECONDS
 )
 
 parser = JsonOutputParser(pydantic_object=AgentOutput)
 
 PROMPT_TEMPLATE = """
 You are a professional quantitative risk analyst. I will provide:
-1) a JSON object "snapshot" containing user's asset fields and numbers,
+1) a JSON object "snapshot" containing user's non-zero asset fields and amounts, grouped by currency,
 2) a JSON object "results" containing computed metrics (total_assets_usd, total_savings_usd, available_liquidity_ratio, gold_ratio, btc_ratio, weighted_risk_score, speculative_ratio),
 3) context info (like dynamic BTC risk factor and recent market notes).
 
@@ -64,61 +59,271 @@ CONTEXT:
 """
 
 prompt = PromptTemplate(
-    input_variables=["snapshot", "results", "context"],
-    partial_variables={"format_instructions": parser.get_format_instructions()},
+    input_variables=["snapshot", "results", "context", "format_instructions"],
     template=PROMPT_TEMPLATE
 )
+TEMPLATE_TOKENS = count_tokens(re.sub(r"\{\w+\}", "", PROMPT_TEMPLATE))
 
-chain = prompt | llm | parser
+_chain = None
 
-def _make_cache_key(snapshot: Dict[str, Any], results: Dict[str, Any]) -> str:
-    payload = json.dumps({"snapshot": snapshot, "results": results}, sort_keys=True, default=str)
-    return "ASSET_AGENT:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+def get_chain():
+    """首次调用时才导入并创建 LLM 客户端, offline 后端不需要 API key"""
+    global _chain
+    if _chain is None:
+        from langchain_openai import ChatOpenAI
+        llm = ChatOpenAI(
+            model_name="gpt-4o-mini", 
+            temperature=0.2, 
+            openai_api_key=OPENAI_API_KEY, 
+            max_tokens=800,
+            timeout=AGENT_DEADLINE_SECONDS,
+            max_retries=0,
+            stream_usage=True,
+            model_kwargs={"response_format": {"type": "json_object"}}
+        )
+        # 不在链中解析, 以便从 AIMessage 读取 token 用量
+        _chain = prompt | llm
+    return _chain
 
-def analyze_snapshot_and_results(snapshot: Dict[str, Any], results: Dict[str, Any], context: Optional[Dict[str, Any]] = None) -> AgentOutput:
+agent_breaker = CircuitBreaker("agent", AGENT_BREAKER_FAILURES, AGENT_BREAKER_RESET_SECONDS)
+
+def _chain_inputs(snapshot: Dict[str, Any], results: Dict[str, Any], context: Dict[str, Any]) -> Tuple[Dict[str, str], int]:
+    """精简编码后的提示词输入(见 prompt_encoder), 以及估计的提示词 token 数"""
+    return encode_prompt_inputs(snapshot, results, context, TEMPLATE_TOKENS)
+
+def _verbose_prompt_tokens(snapshot: Dict[str, Any], results: Dict[str, Any], context: Dict[str, Any]) -> int:
+    """未压缩时(完整 JSON + JSON Schema 格式说明)的提示词 token 数, 用于衡量压缩效果"""
+    return TEMPLATE_TOKENS + sum(
+        count_tokens(json.dumps(part, default=str, ensure_ascii=False))
+        for part in (snapshot, results, context)
+    ) + count_tokens(parser.get_format_instructions())
+
+def _finish_call(message, estimated_tokens: int, verbose_tokens: int, started: float) -> AgentOutput:
+    """解析 LLM 输出并记录 token 用量与耗时"""
+    latency_ms = (time.perf_counter() - started) * 1000
+    usage = getattr(message, "usage_metadata", None) or {}
+    input_tokens = usage.get("input_tokens", estimated_tokens)
+    output_tokens = usage.get("output_tokens", count_tokens(message.content))
+    logging.info(f"Agent LLM call: {input_tokens} input / {output_tokens} output tokens "
+                 f"(uncompressed ~{verbose_tokens}), {latency_ms:.0f} ms")
+    agent_cache.record_call(input_tokens, output_tokens, latency_ms, verbose_tokens)
+    return AgentOutput(**parser.invoke(message))
+
+def _from_cache(cached) -> Optional[AgentOutput]:
+    if not cached:
+        return None
+    try:
+        logging.info("Hitting Redis cache for Agent analysis")
+        return AgentOutput(**json.loads(cached))
+    except Exception:
+        logging.exception("Cached agent output is corrupted")
+        return None
+
+def _rule_fallback(reason: str, snapshot: Dict[str, Any], results: Dict[str, Any], context: Dict[str, Any]) -> AgentOutput:
+    logging.warning(f"Agent LLM skipped ({reason}), using rule-based analysis")
+    return analyze_rules(snapshot, results, context)
+
+async def analyze_snapshot_and_results_async(
+    snapshot: Dict[str, Any],
+    results: Dict[str, Any],
+    context: Optional[Dict[str, Any]] = None,
+    deadline: float = AGENT_DEADLINE_SECONDS
+) -> AgentOutput:
     """
-    Main function to call LLM, parse result, and cache in Redis.
-    Returns AgentOutput (pydantic) or raises Exception on parse error.
+    Async agent call with a hard deadline and a circuit breaker.
+    Cache lookup first; when the breaker is open, the deadline passes or the LLM fails,
+    the deterministic rule-based analyzer answers instead. Never raises.
     """
     context = context or {}
-    cache_key = _make_cache_key(snapshot, results)
+    if AGENT_BACKEND == "offline":
+        return analyze_rules(snapshot, results, context)
+
+    cached, cache_key, features = await asyncio.to_thread(agent_cache.lookup, snapshot, results)
+    agent_out = _from_cache(cached)
+    if agent_out is not None:
+        return agent_out
+
+    ticket = agent_breaker.allow()
+    if ticket is None:
+        return _rule_fallback("circuit open", snapshot, results, context)
+
+    inputs, estimated_tokens = _chain_inputs(snapshot, results, context)
+    started = time.perf_counter()
     try:
-        cached = redis_client.get(cache_key)
-        if cached:
-            logging.info("Hitting Redis cache for Agent analysis")
-            payload = json.loads(cached.decode("utf-8"))
-            return AgentOutput(**payload)
-    except Exception:
-        logging.exception("Redis cache read failed")
+        message = await asyncio.wait_for(get_chain().ainvoke(inputs), timeout=deadline)
+        agent_out = _finish_call(
+            message, estimated_tokens, _verbose_prompt_tokens(snapshot, results, context), started
+        )
+    except asyncio.TimeoutError:
+        agent_breaker.record_failure(ticket)
+        return _rule_fallback(f"deadline {deadline}s exceeded", snapshot, results, context)
+    except Exception as e:
+        agent_breaker.record_failure(ticket)
+        logging.error(f"Agent LLM call or parse failed: {e}")
+        return _rule_fallback("LLM error", snapshot, results, context)
+    else:
+        agent_breaker.record_success(ticket)
+    finally:
+        agent_breaker.release(ticket)
 
-    snapshot_str = json.dumps(snapshot, default=str, ensure_ascii=False)
-    results_str = json.dumps(results, default=str, ensure_ascii=False)
-    context_str = json.dumps(context, default=str, ensure_ascii=False)
+    await asyncio.to_thread(agent_cache.store, cache_key, features, agent_out.model_dump_json())
+    return agent_out
 
+async def _close_stream(stream) -> None:
+    aclose = getattr(stream, "aclose", None)
+    if aclose is None:
+        return
     try:
-        parsed_dict = chain.invoke({
-            "snapshot": snapshot_str,
-            "results": results_str,
-            "context": context_str
-        })
-        agent_out = AgentOutput(**parsed_dict)
-        try:
-            redis_client.setex(cache_key, AGENT_CACHE_TTL, agent_out.model_dump_json())
-        except Exception:
-            logging.exception("Redis cache write failed")
+        await aclose()
+    except Exception as e:
+        logging.warning(f"Failed to close LLM stream: {e}")
+
+async def stream_agent_events(
+    snapshot: Dict[str, Any],
+    results: Dict[str, Any],
+    context: Optional[Dict[str, Any]] = None,
+    deadline: float = AGENT_DEADLINE_SECONDS
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Streaming variant of analyze_snapshot_and_results_async, yields (event, data):
+    - "summary": {"delta": str} as summary tokens arrive
+    - "field":   {"name": str, "value": Any} once an AgentOutput field is complete
+    - "agent":   the final AgentOutput plus "source" (cache / llm / rules)
+    The completion is parsed incrementally with parse_partial_json. Same cache, deadline,
+    circuit breaker and rule-based fallback as the non-streaming call.
+    """
+    context = context or {}
+    if AGENT_BACKEND == "offline":
+        yield "agent", {**analyze_rules(snapshot, results, context).model_dump(), "source": "rules"}
+        return
+
+    cached, cache_key, features = await asyncio.to_thread(agent_cache.lookup, snapshot, results)
+    agent_out = _from_cache(cached)
+    if agent_out is not None:
+        yield "agent", {**agent_out.model_dump(), "source": "cache"}
+        return
+
+    ticket = agent_breaker.allow()
+    if ticket is None:
+        yield "agent", {**_rule_fallback("circuit open", snapshot, results, context).model_dump(), "source": "rules"}
+        return
+
+    inputs, estimated_tokens = _chain_inputs(snapshot, results, context)
+    started = time.perf_counter()
+    expires = time.monotonic() + deadline
+    message = None
+    summary_sent = 0
+    completed = set()
+    stream = None
+    try:
+        stream = get_chain().astream(inputs).__aiter__()
+        while True:
+            try:
+                chunk = await asyncio.wait_for(stream.__anext__(), timeout=max(expires - time.monotonic(), 0.001))
+            except StopAsyncIteration:
+                break
+            message = chunk if message is None else message + chunk
+            partial = parse_partial_json(message.content) if message.content else None
+            if not isinstance(partial, dict):
+                continue
+
+            summary = partial.get("summary")
+            if isinstance(summary, str) and len(summary) > summary_sent:
+                yield "summary", {"delta": summary[summary_sent:]}
+                summary_sent = len(summary)
+
+            # 除最后一个键(可能仍在生成)外, 其余字段都已完整
+            for name in list(partial)[:-1]:
+                if name not in completed and name in AgentOutput.model_fields:
+                    completed.add(name)
+                    yield "field", {"name": name, "value": partial[name]}
+
+        if message is None:
+            raise ValueError("Empty LLM stream")
+        agent_out = _finish_call(
+            message, estimated_tokens, _verbose_prompt_tokens(snapshot, results, context), started
+        )
+    except asyncio.TimeoutError:
+        agent_breaker.record_failure(ticket)
+        await _close_stream(stream)
+        fallback = _rule_fallback(f"deadline {deadline}s exceeded", snapshot, results, context)
+        yield "agent", {**fallback.model_dump(), "source": "rules"}
+        return
+    except Exception as e:
+        agent_breaker.record_failure(ticket)
+        logging.error(f"Agent LLM stream or parse failed: {e}")
+        yield "agent", {**_rule_fallback("LLM error", snapshot, results, context).model_dump(), "source": "rules"}
+        return
+    else:
+        agent_breaker.record_success(ticket)
+    finally:
+        # SSE 客户端断开时 GeneratorExit / CancelledError 会在 yield 处抛出, 不经过上面的 except:
+        # 这里关闭 LLM 流并释放断路器的试探名额
+        await _close_stream(stream)
+        agent_breaker.release(ticket)
+
+    for name, value in agent_out.model_dump().items():
+        if name not in completed:
+            yield "field", {"name": name, "value": value}
+    await asyncio.to_thread(agent_cache.store, cache_key, features, agent_out.model_dump_json())
+    yield "agent", {**agent_out.model_dump(), "source": "llm"}
+
+def analyze_snapshot_and_results(snapshot: Dict[str, Any], results: Dict[str, Any], context: Optional[Dict[str, Any]] = None) -> AgentOutput:
+    """
+    Main function to call LLM, parse result, and cache in Redis.
+    The cache is keyed on a bucketed feature vector (see agent_cache), so nearly identical
+    portfolios reuse the previous analysis.
+    Synchronous variant for the job worker: the request timeout equals the deadline and it shares
+    the circuit breaker and rule-based fallback with the async variant.
+    """
+    context = context or {}
+    if AGENT_BACKEND == "offline":
+        return analyze_rules(snapshot, results, context)
+
+    cached, cache_key, features = agent_cache.lookup(snapshot, results)
+    agent_out = _from_cache(cached)
+    if agent_out is not None:
         return agent_out
+
+    ticket = agent_breaker.allow()
+    if ticket is None:
+        return _rule_fallback("circuit open", snapshot, results, context)
+
+    inputs, estimated_tokens = _chain_inputs(snapshot, results, context)
+    started = time.perf_counter()
+    try:
+        message = get_chain().invoke(inputs)
+        agent_out = _finish_call(
+            message, estimated_tokens, _verbose_prompt_tokens(snapshot, results, context), started
+        )
     except Exception as e:
+        agent_breaker.record_failure(ticket)
         logging.error(f"Agent LLM call or parse failed: {e}")
-    return AgentOutput(
-        verdict="ok", 
-        summary="Agent unavailable; no suggesstion.", 
-        suggested_adjustments={}, 
-        explanations={}, 
-        confidence=0.0
-    )
+        return _rule_fallback("LLM error", snapshot, results, context)
+    else:
+        agent_breaker.record_success(ticket)
+    finally:
+        agent_breaker.release(ticket)
+
+    agent_cache.store(cache_key, features, agent_out.model_dump_json())
+    return agent_out
 
 def snapshot_to_dict(asset_snapshot: AssetSnapshot) -> Dict[str, Any]:
     try:
         return asset_snapshot.model_dump()
     except Exception:
-        return json.loads(asset_snapshot.model_dump_json())
\ No newline at end of file
+        return json.loads(asset_snapshot.model_dump_json())
+def results_to_agent_dict(results: AssetResults, btc_risk_score, strategy_text: str) -> Dict[str, Any]:
+    """Agent 使用的指标字典, 后台任务与流式分析共用, 以便共享语义缓存"""
+    return {
+        "total_assets_usd": float(results.total_assets_usd),
+        "total_savings_usd": float(results.total_savings_usd),
+        "available_liquidity_ratio": float(results.available_liquidity_ratio),
+        "gold_ratio": float(results.gold_ratio),
+        "btc_ratio": float(results.btc_ratio),
+        "weighted_risk_score": float(results.weighted_risk_score),
+        "speculative_ratio": float(results.speculative_ratio),
+        "btc_dynamic_risk": float(btc_risk_score),
+        "currency_distribution": results.currency_distribution,
+        "strategic_advice": strategy_text,
+    }
@@ -0,0 +1,215 @@
+import json
+import math
+import time
+import hashlib
+import logging
+import threading
+import redis
+import numpy as np
+
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+from config import (
+    AGENT_CACHE_TTL,
+    AGENT_CACHE_PRECISION,
+    AGENT_CACHE_AMOUNT_LOG_STEP,
+    AGENT_CACHE_NN_MAX_BUCKETS,
+    AGENT_CACHE_INDEX_MAX
+)
+from redis_pool import get_redis
+
+AGENT_CACHE_REDIS_CLIENT = get_redis()
+
+CACHE_KEY_PREFIX = "ASSET_AGENT:v2:"
+INDEX_KEY = "ASSET_AGENT:index"
+INDEX_VERSION_KEY = "ASSET_AGENT:index_version"      # 索引每次变化加一, 各进程据此刷新本地副本
+METRICS_KEY = "ASSET_AGENT:metrics"
+
+# 每次请求都会变化、与分析结论无关的字段
+IDENTITY_FIELDS = {"id", "snapshot_date", "report_path", "message", "job_id", "rebalance_actions"}
+
+def _flatten(prefix: str, data: Dict[str, Any], out: Dict[str, float]):
+    for key, value in data.items():
+        if key in IDENTITY_FIELDS or value is None:
+            continue
+        name = f"{prefix}.{key}"
+        if isinstance(value, dict):
+            _flatten(name, value, out)
+        elif isinstance(value, (bool, int, float, Decimal)):
+            out[name] = float(value)
+        # 文本字段(如 strategic_advice)由数值特征决定, 不参与缓存键
+
+def _is_amount(name: str) -> bool:
+    return name.startswith("snapshot.") or name.endswith("_usd")
+
+def feature_vector(snapshot: Dict[str, Any], results: Dict[str, Any]) -> Dict[str, float]:
+    """
+    归一化特征向量, 单位为 "分桶":
+    比例 / 评分按 AGENT_CACHE_PRECISION 缩放, 金额取 log10 后按 AGENT_CACHE_AMOUNT_LOG_STEP 缩放。
+    """
+    raw: Dict[str, float] = {}
+    _flatten("snapshot", snapshot, raw)
+    _flatten("results", results, raw)
+
+    features = {}
+    for name, value in raw.items():
+        if _is_amount(name):
+            features[name] = math.copysign(math.log10(1.0 + abs(value)), value) / AGENT_CACHE_AMOUNT_LOG_STEP
+        else:
+            key = name.rsplit(".", 1)[-1]
+            features[name] = value / AGENT_CACHE_PRECISION.get(key, AGENT_CACHE_PRECISION["default"])
+    return features
+
+def make_cache_key(features: Dict[str, float]) -> str:
+    bucketed = sorted((name, int(round(value))) for name, value in features.items())
+    payload = json.dumps(bucketed, separators=(",", ":"))
+    return CACHE_KEY_PREFIX + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class AgentCache:
+    """
+    Agent 输出缓存: 先按分桶后的特征向量精确命中, 未命中时在已缓存的向量中找
+    各维差距都不超过 AGENT_CACHE_NN_MAX_BUCKETS 个分桶的最近邻。命中 / 未命中计数保存在 Redis。
+    近邻索引在进程内保留一份副本(最多 AGENT_CACHE_INDEX_MAX 条, 按特征名分组的矩阵),
+    只在 Redis 中的索引版本号变化时重新读取; 未命中时只多一次 GET 版本号和一次向量化扫描。
+    """
+    def __init__(self, client: redis.Redis = AGENT_CACHE_REDIS_CLIENT):
+        self._client = client
+        self._index_lock = threading.Lock()
+        self._index_version: Optional[int] = None
+        self._index: Dict[Tuple[str, ...], Tuple[List[Any], np.ndarray]] = {}
+
+    def lookup(self, snapshot: Dict[str, Any], results: Dict[str, Any]) -> Tuple[Optional[str], str, Dict[str, float]]:
+        """返回 (缓存的 JSON 或 None, 缓存键, 特征向量)"""
+        features = feature_vector(snapshot, results)
+        cache_key = make_cache_key(features)
+        try:
+            cached = self._client.get(cache_key)
+            if cached:
+                self._record("exact_hit")
+                return cached, cache_key, features
+
+            if AGENT_CACHE_NN_MAX_BUCKETS > 0:
+                neighbour = self._nearest(features)
+                if neighbour is not None:
+                    self._record("nn_hit")
+                    return neighbour, cache_key, features
+            self._record("miss")
+        except Exception:
+            logging.exception("Agent cache read failed")
+            self._record("error")
+        return None, cache_key, features
+
+    def _load_index(self) -> Dict[Tuple[str, ...], Tuple[List[Any], np.ndarray]]:
+        """本地索引副本; 版本号未变时不访问索引哈希"""
+        version = int(self._client.get(INDEX_VERSION_KEY) or 0)
+        with self._index_lock:
+            if version == self._index_version:
+                return self._index
+            entries = [(key, json.loads(raw)) for key, raw in self._client.hgetall(INDEX_KEY).items()]
+            # 与 _prune 相同的上限: 只保留最新的 AGENT_CACHE_INDEX_MAX 条
+            entries.sort(key=lambda e: e[1].get("ts", 0), reverse=True)
+            grouped: Dict[Tuple[str, ...], Tuple[List[Any], List[List[float]]]] = {}
+            for key, entry in entries[:AGENT_CACHE_INDEX_MAX]:
+                names = tuple(sorted(entry["v"]))
+                keys, rows = grouped.setdefault(names, ([], []))
+                keys.append(key)
+                rows.append([entry["v"][n] for n in names])
+            self._index = {names: (keys, np.array(rows)) for names, (keys, rows) in grouped.items()}
+            self._index_version = version
+            return self._index
+
+    def _nearest(self, features: Dict[str, float]) -> Optional[str]:
+        names = tuple(sorted(features))
+        group = self._load_index().get(names)
+        if group is None:
+            return None
+        keys, vectors = group
+
+        # 切比雪夫距离: 每个特征都在阈值内才算近邻
+        distances = np.abs(vectors - np.array([features[n] for n in names])).max(axis=1)
+        candidates = np.flatnonzero(distances <= AGENT_CACHE_NN_MAX_BUCKETS)
+        for i in candidates[np.argsort(distances[candidates])]:
+            cached = self._client.get(keys[i])
+            if cached:
+                return cached
+            # 缓存已过期, 清理索引
+            pipe = self._client.pipeline()
+            pipe.hdel(INDEX_KEY, keys[i])
+            pipe.incr(INDEX_VERSION_KEY)
+            pipe.execute()
+        return None
+
+    def store(self, cache_key: str, features: Dict[str, float], payload_json: str):
+        try:
+            pipe = self._client.pipeline()
+            pipe.setex(cache_key, AGENT_CACHE_TTL, payload_json)
+            pipe.hset(INDEX_KEY, cache_key, json.dumps({"v": features, "ts": time.time()}))
+            pipe.incr(INDEX_VERSION_KEY)
+            pipe.hlen(INDEX_KEY)
+            size = pipe.execute()[-1]
+            if size > AGENT_CACHE_INDEX_MAX:
+                # 多删一成, 避免达到上限后每次写入都要整表排序
+                self._prune(size - AGENT_CACHE_INDEX_MAX + AGENT_CACHE_INDEX_MAX // 10)
+        except Exception:
+            logging.exception("Agent cache write failed")
+
+    def _prune(self, count: int):
+        entries = self._client.hgetall(INDEX_KEY)
+        oldest = sorted(entries, key=lambda k: json.loads(entries[k]).get("ts", 0))[:count]
+        if oldest:
+            pipe = self._client.pipeline()
+            pipe.hdel(INDEX_KEY, *oldest)
+            pipe.incr(INDEX_VERSION_KEY)
+            pipe.execute()
+
+    def _record(self, outcome: str):
+        try:
+            self._client.hincrby(METRICS_KEY, outcome, 1)
+        except Exception:
+            pass
+
+    def record_call(self, input_tokens: int, output_tokens: int, latency_ms: float, verbose_tokens: int):
+        """累计每次 LLM 调用的 token 用量与耗时; verbose_tokens 为未压缩提示词的估计值"""
+        try:
+            pipe = self._client.pipeline()
+            pipe.hincrby(METRICS_KEY, "llm_calls", 1)
+            pipe.hincrby(METRICS_KEY, "input_tokens", int(input_tokens))
+            pipe.hincrby(METRICS_KEY, "output_tokens", int(output_tokens))
+            pipe.hincrby(METRICS_KEY, "verbose_input_tokens", int(verbose_tokens))
+            pipe.hincrby(METRICS_KEY, "latency_ms", int(latency_ms))
+            pipe.execute()
+        except Exception:
+            logging.exception("Agent call metrics write failed")
+
+    def stats(self) -> Dict[str, Any]:
+        raw = self._client.hgetall(METRICS_KEY)
+        counts = {
+            (k.decode("utf-8") if isinstance(k, bytes) else k): int(v) for k, v in raw.items()
+        }
+        hits = counts.get("exact_hit", 0) + counts.get("nn_hit", 0)
+        lookups = hits + counts.get("miss", 0)
+        return {
+            "exact_hit": counts.get("exact_hit", 0),
+            "nn_hit": counts.get("nn_hit", 0),
+            "miss": counts.get("miss", 0),
+            "error": counts.get("error", 0),
+            "hit_ratio": round(hits / lookups, 4) if lookups else None,
+            "indexed_entries": self._client.hlen(INDEX_KEY),
+            **self._call_stats(counts)
+        }
+
+    @staticmethod
+    def _call_stats(counts: Dict[str, int]) -> Dict[str, Any]:
+        calls = counts.get("llm_calls", 0)
+        if not calls:
+            return {"llm_calls": 0}
+        verbose = counts.get("verbose_input_tokens", 0)
+        return {
+            "llm_calls": calls,
+            "avg_input_tokens": round(counts.get("input_tokens", 0) / calls, 1),
+            "avg_output_tokens": round(counts.get("output_tokens", 0) / calls, 1),
+            "avg_latency_ms": round(counts.get("latency_ms", 0) / calls, 1),
+            "input_token_savings": round(1 - counts.get("input_tokens", 0) / verbose, 4) if verbose else None
+        }
+
+agent_cache = AgentCache()
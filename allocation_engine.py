@@ -1,8 +1,11 @@
 import logging
+import numpy as np
 
-from decimal import Decimal
-from typing import Dict, List
-from models import AssetResults, SmartSuggestion
+from decimal import Decimal, ROUND_DOWN
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+from models import AssetResults, AssetSnapshot, SmartSuggestion, SimulationAction, ActionType
+from calculator import get_valuation_plan, holdings_matrix
+from config import ASSET_CONFIG, REBALANCE_LOCKED_FIELDS, REBALANCE_TARGET_MARGIN
 
 def evaluate_fx_status(
     currency: str,
@@ -107,3 +110,165 @@ def calculate_strategic_rebalancing(
                 reason=reason
             ))
     return suggestions
+
+def allocation_map(currencies: Sequence[str], target_map: Dict[str, Decimal]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    货币 -> 目标配置类别的映射矩阵(货币数×类别数)与目标占比向量。
+    不在 target_map 中的货币归入 OTHER, 与 calculate_strategic_rebalancing 一致。
+    """
+    classes = list(target_map)
+    mapping = np.zeros((len(currencies), len(classes)))
+    for i, currency in enumerate(currencies):
+        if currency in target_map:
+            mapping[i, classes.index(currency)] = 1.0
+        elif "OTHER" in target_map:
+            mapping[i, classes.index("OTHER")] = 1.0
+    targets = np.array([float(v) for v in target_map.values()])
+    return mapping, targets
+
+def allocation_drift_matrix(
+    distribution: np.ndarray,
+    currencies: Sequence[str],
+    target_map: Dict[str, Decimal]
+) -> np.ndarray:
+    """批量计算配置偏差: distribution 为 N×货币数 的占比(%), 返回 N×类别数 的 当前-目标 偏差(%)"""
+    mapping, targets = allocation_map(currencies, target_map)
+    return np.atleast_2d(distribution) @ mapping - targets
+
+# 划转数量精度: BTC 8 位, 其余 2 位
+_AMOUNT_QUANT = {"btc": Decimal("0.00000001")}
+_DEFAULT_QUANT = Decimal("0.01")
+
+# FX 估值对划出/划入优先级的影响: 高估的货币优先卖出, 低估的货币优先买入
+_SELL_PRIORITY = {"EXPENSIVE": 0, "FAIR": 1, "N/A": 1, "CHEAP": 2}
+_BUY_PRIORITY = {"CHEAP": 0, "FAIR": 1, "N/A": 1, "EXPENSIVE": 2}
+
+def _fill(required: List[float], caps: List[float], total: float, priority: List[tuple]) -> List[float]:
+    """先满足每个类别的最低流量, 剩余流量按优先级依次填充到上限"""
+    alloc = list(required)
+    extra = total - sum(required)
+    for k in sorted(range(len(caps)), key=lambda i: priority[i]):
+        if extra <= 0:
+            break
+        take = min(extra, caps[k] - alloc[k])
+        if take > 0:
+            alloc[k] += take
+            extra -= take
+    return alloc
+
+def optimize_rebalancing_transfers(
+    snapshot: AssetSnapshot,
+    current_rates: Mapping[str, Decimal],
+    target_map: Dict[str, Decimal],
+    threshold: Decimal,
+    fx_refs: Dict[str, Decimal],
+    locked_fields: Optional[set] = None,
+    margin: Decimal = REBALANCE_TARGET_MARGIN
+) -> List[SimulationAction]:
+    """
+    计算把各配置类别偏差压回阈值内所需的最少 TRANSFER 操作。
+    1. 每个超配类别必须划出 (偏差 - 带宽), 每个低配类别必须划入 (-偏差 - 带宽);
+       总流量取二者较大值, 多出的部分按 FX 估值优先级分配, 且不让任何类别越过另一侧带宽。
+    2. 划出/划入按类别贪心配对(西北角法), 最多 划出类别数 + 划入类别数 - 1 笔。
+    3. 类别内优先从流动性字段划出, 锁定字段(养老金/公积金)不参与; 划入该货币的流动性字段。
+    结果可直接作为 /simulate 的 actions。
+    """
+    locked_fields = REBALANCE_LOCKED_FIELDS if locked_fields is None else locked_fields
+    plan = get_valuation_plan()
+    holdings = holdings_matrix([snapshot], plan)[0]
+    rates = np.array([float(current_rates.get(c, 0)) for c in plan.currencies])
+    inverse = np.divide(1.0, rates, out=np.zeros_like(rates), where=rates != 0)
+    field_usd = holdings * plan.scale_vector * inverse[plan.bucket_vector]
+
+    total = float(field_usd.sum())
+    if total <= 0:
+        return []
+
+    mapping, targets = allocation_map(plan.currencies, target_map)
+    classes = list(target_map)
+    field_class = (plan.bucket_onehot @ mapping).argmax(axis=1)
+    field_mapped = (plan.bucket_onehot @ mapping).sum(axis=1) > 0
+
+    class_usd = field_usd @ plan.bucket_onehot @ mapping
+    drift_usd = class_usd - targets / 100 * total
+    band = max(float(threshold - margin), 0.0) / 100 * total
+
+    transferable = np.zeros(len(classes))
+    sink_field: Dict[int, str] = {}
+    for j, field in enumerate(plan.fields):
+        if not field_mapped[j]:
+            continue
+        k = field_class[j]
+        if field not in locked_fields and field_usd[j] > 0:
+            transferable[k] += field_usd[j]
+        # 划入字段: 与类别同币种, 优先流动性字段
+        currency = plan.currencies[plan.bucket_vector[j]]
+        if currency == classes[k] and field not in locked_fields:
+            if k not in sink_field or (plan.liquid_mask[j] and not ASSET_CONFIG[sink_field[k]]['liquid']):
+                sink_field[k] = field
+
+    out_min = [min(max(d - band, 0.0), t) for d, t in zip(drift_usd, transferable)]
+    out_cap = [min(max(d + band, 0.0), t) for d, t in zip(drift_usd, transferable)]
+    in_min = [max(-d - band, 0.0) if k in sink_field else 0.0 for k, d in enumerate(drift_usd)]
+    in_cap = [max(band - d, 0.0) if k in sink_field else 0.0 for k, d in enumerate(drift_usd)]
+
+    flow = max(sum(out_min), sum(in_min))
+    feasible = min(sum(out_cap), sum(in_cap))
+    if flow > feasible:
+        logging.warning(f"Rebalancing limited by liquidity constraints: need {flow:.2f} USD, can move {feasible:.2f} USD")
+        flow = feasible
+    if flow <= 0:
+        return []
+
+    fx_status = [evaluate_fx_status(c, current_rates.get(c, Decimal(0)), fx_refs) for c in classes]
+    out_alloc = _fill(out_min, out_cap, flow, [(_SELL_PRIORITY.get(s, 1), -d) for s, d in zip(fx_status, drift_usd)])
+    in_alloc = _fill(in_min, in_cap, flow, [(_BUY_PRIORITY.get(s, 1), d) for s, d in zip(fx_status, drift_usd)])
+
+    # 类别内的划出字段顺序: 流动性字段优先, 其次按金额从大到小
+    source_fields: Dict[int, List[int]] = {}
+    for j in sorted(range(len(plan.fields)), key=lambda j: (not plan.liquid_mask[j], -field_usd[j])):
+        if field_mapped[j] and plan.fields[j] not in locked_fields and field_usd[j] > 0:
+            source_fields.setdefault(field_class[j], []).append(j)
+    remaining_usd = field_usd.copy()
+
+    sources = sorted((k for k in range(len(classes)) if out_alloc[k] > 0), key=lambda k: -out_alloc[k])
+    sinks = sorted((k for k in range(len(classes)) if in_alloc[k] > 0), key=lambda k: -in_alloc[k])
+    out_left = {k: out_alloc[k] for k in sources}
+    in_left = {k: in_alloc[k] for k in sinks}
+
+    actions = []
+    si = di = 0
+    while si < len(sources) and di < len(sinks):
+        src, dst = sources[si], sinks[di]
+        amount_usd = min(out_left[src], in_left[dst])
+        out_left[src] -= amount_usd
+        in_left[dst] -= amount_usd
+
+        for j in source_fields.get(src, []):
+            if amount_usd <= 1e-9:
+                break
+            take = min(amount_usd, remaining_usd[j])
+            if take <= 0:
+                continue
+            remaining_usd[j] -= take
+            amount_usd -= take
+
+            field = plan.fields[j]
+            rate = float(rates[plan.bucket_vector[j]])
+            native = Decimal(repr(float(take * rate / plan.scale_vector[j])))
+            native = native.quantize(_AMOUNT_QUANT.get(field, _DEFAULT_QUANT), rounding=ROUND_DOWN)
+            if native > 0:
+                actions.append(SimulationAction(
+                    type=ActionType.TRANSFER,
+                    from_field=field,
+                    to_field=sink_field[dst],
+                    amount=native
+                ))
+
+        if out_left[src] <= 1e-9:
+            si += 1
+        if in_left[dst] <= 1e-9:
+            di += 1
+
+    return actions
+
@@ -0,0 +1,140 @@
+"""
+对比预编译估值计划与旧版 calculate_asset_metrics 的单次调用耗时。
+
+运行: python benchmarks/bench_calculator.py [--calls 20000]
+"""
+import os
+import sys
+import time
+import argparse
+
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import AssetSnapshot, AssetResults
+from config import ASSET_CONFIG
+from utils import get_usd_value
+from calculator import calculate_asset_metrics
+
+RATES = {
+    'XAU': Decimal('0.00038'), 'CNY': Decimal('7.12'), 'GBP': Decimal('0.79'), 'EUR': Decimal('0.92'),
+    'HKD': Decimal('7.81'), 'BTC': Decimal('0.0000155'), 'SGD': Decimal('1.34'), 'USD': Decimal('1')
+}
+
+def legacy_calculate_asset_metrics(data: AssetSnapshot, rates: dict, btc_risk_score: Decimal) -> AssetResults:
+    """优化前的实现(两次遍历 model_dump, 每次调用重建 Decimal 常量)"""
+    total_assets_usd = Decimal('0')
+    total_savings_usd = Decimal('0')
+    gold_val_usd = Decimal('0')
+    btc_val_usd = Decimal('0')
+    currency_exposure = {}
+
+    asset_dict = data.model_dump()
+
+    for field, amount in asset_dict.items():
+        if amount is None or field == 'id' or field == 'snapshot_date':
+            continue
+        amount_dec = Decimal(str(amount))
+        if amount_dec == 0:
+            continue
+        config = ASSET_CONFIG.get(field)
+        if not config:
+            continue
+        currency = config['currency']
+        unit_scale = Decimal(str(config.get('unit_scale', 1.0)))
+        rate = rates.get(currency, Decimal('0'))
+        usd_value = get_usd_value(amount_dec, unit_scale, rate)
+        total_assets_usd += usd_value
+        if config['liquid']:
+            total_savings_usd += usd_value
+        if 'gold' in field:
+            gold_val_usd += usd_value
+        if 'btc' in field:
+            btc_val_usd += usd_value
+        currency_exposure[currency] = currency_exposure.get(currency, Decimal('0')) + usd_value
+
+    available_liquidity_ratio = Decimal('0')
+    gold_ratio = Decimal('0')
+    btc_ratio = Decimal('0')
+    if total_assets_usd > 0:
+        available_liquidity_ratio = (total_savings_usd / total_assets_usd) * 100
+        gold_ratio = (gold_val_usd / total_assets_usd) * 100
+        btc_ratio = (btc_val_usd / total_assets_usd) * 100
+
+    weighted_risk_sum = Decimal('0')
+    speculative_sum = Decimal('0')
+    for field, amount in asset_dict.items():
+        if field not in ASSET_CONFIG or amount == 0:
+            continue
+        config = ASSET_CONFIG[field]
+        amount_dec = Decimal(str(amount))
+        rate = rates.get(config['currency'], Decimal('0'))
+        unit_scale = Decimal(str(config.get('unit_scale', 1.0)))
+        val_usd = get_usd_value(amount_dec, unit_scale, rate)
+        risk_score = Decimal(config['risk'])
+        if 'btc' in field and btc_risk_score > 0:
+            risk_score = btc_risk_score
+        weighted_risk_sum += val_usd * risk_score
+        if risk_score > 5:
+            speculative_sum += val_usd
+
+    weighted_risk_score = Decimal('0')
+    speculative_ratio = Decimal('0')
+    if total_assets_usd > 0:
+        weighted_risk_score = weighted_risk_sum / total_assets_usd
+        speculative_ratio = (speculative_sum / total_assets_usd) * 100
+
+    currency_dist_final = {}
+    if total_assets_usd > 0:
+        for curr, val in currency_exposure.items():
+            pct = (val / total_assets_usd) * 100
+            if pct > 0.01:
+                currency_dist_final[curr] = float(round(pct, 2))
+    return AssetResults(
+        total_assets_usd=total_assets_usd,
+        total_savings_usd=total_savings_usd,
+        available_liquidity_ratio=available_liquidity_ratio,
+        gold_ratio=gold_ratio,
+        btc_ratio=btc_ratio,
+        weighted_risk_score=weighted_risk_score,
+        speculative_ratio=speculative_ratio,
+        currency_distribution=currency_dist_final
+    )
+
+def sample_snapshot() -> AssetSnapshot:
+    return AssetSnapshot(
+        gold_g=Decimal("120.50"), gold_oz=Decimal("3"), btc=Decimal("0.42000000"),
+        btc_stock_usd=Decimal("5300"), deposit_gbp=Decimal("1200"),
+        retirement_funds_cny=Decimal("85000"), savings_cny=Decimal("120000"), funds_cny=Decimal("40000"),
+        housing_fund_cny=Decimal("60000"), funds_sgd=Decimal("8000"), savings_sgd=Decimal("12000"),
+        funds_eur=Decimal("3000"), savings_eur=Decimal("9000"), funds_hkd=Decimal("0"),
+        savings_hkd=Decimal("15000"), savings_usd=Decimal("25000"), stock_usd=Decimal("18000")
+    )
+
+def bench(func, snapshot, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        func(snapshot, RATES, Decimal("6.35"))
+    return (time.perf_counter() - started) / calls * 1e6
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    snapshot = sample_snapshot()
+    expected = legacy_calculate_asset_metrics(snapshot, RATES, Decimal("6.35"))
+    actual = calculate_asset_metrics(snapshot, RATES, Decimal("6.35"))
+    assert expected.model_dump() == actual.model_dump(), "valuation plan result differs from legacy"
+
+    legacy_us = bench(legacy_calculate_asset_metrics, snapshot, args.calls)
+    plan_us = bench(calculate_asset_metrics, snapshot, args.calls)
+
+    print(f"calls per implementation: {args.calls}")
+    print(f"legacy          : {legacy_us:8.2f} us/call")
+    print(f"valuation plan  : {plan_us:8.2f} us/call")
+    print(f"speedup         : {legacy_us / plan_us:8.2f}x")
+
+if __name__ == "__main__":
+    main()
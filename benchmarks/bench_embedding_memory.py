@@ -0,0 +1,82 @@
+"""
+嵌入模型内存占用: 每个 worker 各自加载模型(local) vs 共享一个 embedding_service 进程(remote)。
+每个 worker 做一次查询嵌入后读取 /proc/<pid>/status 的 VmRSS(仅 Linux)。
+
+运行: python benchmarks/bench_embedding_memory.py [--workers 1 4 8]
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORKER_SCRIPT = (
+    "import sys\n"
+    "from vector_store import get_asset_vector_db\n"
+    "get_asset_vector_db().embed_query('warmup')\n"
+    "print('ready', flush=True)\n"
+    "sys.stdin.read()\n"
+)
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+def start_worker(env: dict) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, "-c", WORKER_SCRIPT], cwd=ROOT, env=env,
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+    )
+    if proc.stdout.readline().strip() != "ready":
+        raise SystemExit(f"worker {proc.pid} failed to start")
+    return proc
+
+def start_service(env: dict) -> subprocess.Popen:
+    from embedding_service import RemoteAssetVectorDB
+
+    proc = subprocess.Popen([sys.executable, "embedding_service.py"], cwd=ROOT, env=env)
+    client = RemoteAssetVectorDB(env["EMBEDDING_SERVICE_ADDRESS"])
+    deadline = time.time() + 300
+    while time.time() < deadline:
+        try:
+            client.embed_query("warmup")
+            return proc
+        except Exception:
+            time.sleep(0.5)
+    proc.kill()
+    raise SystemExit("embedding service did not start")
+
+def run(mode: str, n_workers: int, socket_path: str):
+    env = dict(os.environ, VECTOR_SERVICE=mode, EMBEDDING_SERVICE_ADDRESS=socket_path, PREWARM_ON_STARTUP="0")
+    service = start_service(env) if mode == "remote" else None
+    workers = [start_worker(env) for _ in range(n_workers)]
+    try:
+        per_worker = [rss_mb(p.pid) for p in workers]
+        service_rss = rss_mb(service.pid) if service else 0.0
+        return sum(per_worker) / n_workers, service_rss, sum(per_worker) + service_rss
+    finally:
+        for proc in workers + ([service] if service else []):
+            proc.kill()
+            proc.wait()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+
+    socket_path = os.path.join(tempfile.mkdtemp(), "embedding.sock")
+    print(f"{'mode':6s} {'workers':>7s} {'RSS/worker MB':>14s} {'service MB':>11s} {'total MB':>9s}")
+    for n in args.workers:
+        for mode in ("local", "remote"):
+            per_worker, service, total = run(mode, n, socket_path)
+            print(f"{mode:6s} {n:7d} {per_worker:14.1f} {service:11.1f} {total:9.1f}")
+
+if __name__ == "__main__":
+    main()
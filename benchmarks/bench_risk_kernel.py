@@ -0,0 +1,93 @@
+"""
+BTC 风险系数内核: 纯 NumPy 实现 vs 原 pandas 实现(参考副本), 校验结果一致并对比耗时与导入时间。
+
+运行: python benchmarks/bench_risk_kernel.py [--series 500] [--days 365]
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+import numpy as np
+import pandas as pd
+
+from decimal import Decimal, ROUND_HALF_UP
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import BTC_RISK_WEIGHTS, VOLATILITY_WINDOW, MOD_WINDOW
+from risk_engine import calculate_btc_risk_factor, calculate_risk_factors
+
+def legacy_btc_risk_factor(prices: pd.Series) -> Decimal:
+    """pandas 版本, 与改写前的 risk_engine.calculate_btc_risk_factor 相同"""
+    prices_numeric = prices.astype(float)
+    log_returns = np.log(prices_numeric / prices_numeric.shift(1)).dropna()
+    lower_bound = log_returns.quantile(0.01)
+    upper_bound = log_returns.quantile(0.99)
+    clipped_returns = log_returns.clip(lower=lower_bound, upper=upper_bound)
+
+    rolling_vol = clipped_returns.rolling(window=VOLATILITY_WINDOW).std()
+    current_vol = rolling_vol.iloc[-5:].mean()
+    valid_historyvols = rolling_vol.dropna()
+    if len(valid_historyvols) > 0:
+        vol_score = (valid_historyvols < current_vol).mean() * 10.0
+    else:
+        vol_score = 5.0
+
+    rolling_max = prices_numeric.rolling(window=MOD_WINDOW, min_periods=1).max()
+    daily_drawdown = (prices_numeric / rolling_max) - 1.0
+    current_mdd = abs(daily_drawdown.iloc[-5:].min())
+    mdd_score = min(10.0, (current_mdd / 0.70) * 10.0)
+
+    final_score = (
+        Decimal(str(vol_score)) * BTC_RISK_WEIGHTS['volatility'] +
+        Decimal(str(mdd_score)) * BTC_RISK_WEIGHTS['mdd']
+    )
+    final_score = max(Decimal('0'), min(Decimal('10'), final_score))
+    return final_score.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+def synthetic_prices(n_series: int, days: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    vol = rng.uniform(0.01, 0.06, size=(n_series, 1))
+    shocks = rng.standard_normal((n_series, days)) * vol
+    return 30000.0 * np.exp(np.cumsum(shocks, axis=1))
+
+def import_seconds(module: str) -> float:
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip())
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--series", type=int, default=500)
+    parser.add_argument("--days", type=int, default=365)
+    args = parser.parse_args()
+
+    prices = synthetic_prices(args.series, args.days)
+
+    start = time.perf_counter()
+    legacy = [legacy_btc_risk_factor(pd.Series(row)) for row in prices]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scalar = [calculate_btc_risk_factor(row) for row in prices]
+    scalar_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = calculate_risk_factors(prices)
+    batch_time = time.perf_counter() - start
+
+    max_diff = max(abs(a - b) for a, b in zip(legacy, batch))
+    assert scalar == batch, "scalar and batch kernels disagree"
+    assert max_diff <= Decimal("0.01"), f"numpy kernel deviates from pandas by {max_diff}"
+
+    print(f"{args.series} series x {args.days} days, max |numpy - pandas| = {max_diff}")
+    print(f"pandas (per series): {legacy_time * 1000:.1f} ms")
+    print(f"numpy  (per series): {scalar_time * 1000:.1f} ms ({legacy_time / scalar_time:.1f}x)")
+    print(f"numpy  (2-D batch):  {batch_time * 1000:.1f} ms ({legacy_time / batch_time:.1f}x)")
+    print(f"import pandas:       {import_seconds('pandas') * 1000:.0f} ms")
+    print(f"import risk_engine:  {import_seconds('risk_engine') * 1000:.0f} ms")
+
+if __name__ == "__main__":
+    main()
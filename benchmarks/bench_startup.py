@@ -0,0 +1,57 @@
+"""
+冷启动耗时: 每次在新的解释器进程中测量, 对比
+
+- lazy : 只导入应用模块(嵌入模型 / LLM 客户端在首次使用或后台预热时加载)
+- eager: 导入后立即加载嵌入模型与 LLM 客户端, 等同于改为懒加载之前的导入行为
+
+运行: python benchmarks/bench_startup.py [--module main] [--repeat 5]
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPTS = {
+    "lazy": "import {module}",
+    "eager": (
+        "import {module}\n"
+        "import vector_store, agent\n"
+        "vector_store.get_asset_vector_db()\n"
+        "agent.get_chain()"
+    ),
+}
+
+def measure(script: str) -> float:
+    code = (
+        "import time\n"
+        "_t = time.perf_counter()\n"
+        f"{script}\n"
+        "print(time.perf_counter() - _t)"
+    )
+    env = dict(os.environ, PREWARM_ON_STARTUP="0", OPENAI_KEY=os.environ.get("OPENAI_KEY", "sk-bench"))
+    proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, env=env)
+    if proc.returncode != 0:
+        raise SystemExit(proc.stderr[-2000:])
+    return float(proc.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    results = {}
+    for mode, template in SCRIPTS.items():
+        script = template.format(module=args.module)
+        measure(script)   # 预热文件系统缓存与 .pyc
+        samples = [measure(script) for _ in range(args.repeat)]
+        results[mode] = statistics.median(samples)
+        print(f"{mode:5s}: median {results[mode] * 1000:8.1f} ms  (min {min(samples) * 1000:.1f}, n={args.repeat})")
+
+    print(f"lazy import saves {(results['eager'] - results['lazy']) * 1000:.1f} ms per worker start")
+
+if __name__ == "__main__":
+    main()
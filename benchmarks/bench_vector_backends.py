@@ -0,0 +1,112 @@
+"""
+向量库后端对比: NumpyBackend vs ChromaBackend。
+使用随机的 384 维单位向量(与 MiniLM 相同维度), 不加载嵌入模型, 只测存储后端本身:
+- 写入吞吐(每批 1000 条)
+- 查询延迟 p50 / p95(无过滤 / 按日期范围过滤约 10%)
+- 冷启动: 新进程导入后端、打开目录并完成第一次查询的总耗时
+
+运行: python benchmarks/bench_vector_backends.py [--sizes 1000 10000 100000] [--backends numpy chroma]
+未安装 chromadb 时跳过 chroma。
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DIM = 384
+BATCH = 1000
+QUERIES = 200
+
+COLD_OPEN_SCRIPT = (
+    "import sys, time\n"
+    "t0 = time.perf_counter()\n"
+    "sys.path.insert(0, {root!r})\n"
+    "from vector_backends import ChromaBackend, NumpyBackend\n"
+    "backend = {cls}({path!r})\n"
+    "backend.search([1.0] + [0.0] * {dim}, k=5)\n"
+    "print(time.perf_counter() - t0)\n"
+)
+
+def make_backend(name: str, path: str):
+    from vector_backends import ChromaBackend, NumpyBackend
+    return NumpyBackend(path) if name == "numpy" else ChromaBackend(path)
+
+def synthetic_docs(n: int, rng: np.random.Generator):
+    vectors = rng.standard_normal((n, DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    days = rng.integers(0, 3650, n)
+    metadatas = [
+        {"report_date": f"{2016 + int(d) // 365}-{int(d) % 365 // 31 + 1:02d}-{int(d) % 28 + 1:02d}",
+         "report_ts": int(d) * 86400, "type": "market" if i % 2 else "onchain"}
+        for i, d in enumerate(days)
+    ]
+    texts = [f"synthetic report {i}" for i in range(n)]
+    ids = [f"doc-{i}" for i in range(n)]
+    return ids, texts, vectors, metadatas
+
+def run(name: str, n: int, rng: np.random.Generator) -> dict:
+    path = tempfile.mkdtemp(prefix=f"bench_{name}_")
+    try:
+        ids, texts, vectors, metadatas = synthetic_docs(n, rng)
+        backend = make_backend(name, path)
+
+        start = time.perf_counter()
+        for i in range(0, n, BATCH):
+            backend.add(ids[i:i + BATCH], texts[i:i + BATCH], vectors[i:i + BATCH].tolist(), metadatas[i:i + BATCH])
+        insert_seconds = time.perf_counter() - start
+
+        queries = rng.standard_normal((QUERIES, DIM)).astype(np.float32).tolist()
+        where = {"$and": [{"report_ts": {"$gte": 0}}, {"report_ts": {"$lt": 365 * 86400}}]}
+        latencies = {}
+        for label, flt in (("all", None), ("filtered", where)):
+            samples = []
+            for q in queries:
+                t0 = time.perf_counter()
+                backend.search(q, k=5, where=flt)
+                samples.append(time.perf_counter() - t0)
+            latencies[label] = (np.percentile(samples, 50) * 1000, np.percentile(samples, 95) * 1000)
+        del backend
+
+        cls = "NumpyBackend" if name == "numpy" else "ChromaBackend"
+        script = COLD_OPEN_SCRIPT.format(root=ROOT, cls=cls, path=path, dim=DIM - 1)
+        cold = float(subprocess.run([sys.executable, "-c", script], capture_output=True, text=True,
+                                    check=True).stdout.strip().splitlines()[-1])
+        return {"insert_docs_per_s": n / insert_seconds, "latency": latencies, "cold_open_s": cold}
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--backends", nargs="+", default=["numpy", "chroma"])
+    args = parser.parse_args()
+
+    backends = []
+    for name in args.backends:
+        if name == "chroma":
+            try:
+                import chromadb  # noqa: F401
+            except ImportError:
+                print("chromadb not installed, skipping chroma")
+                continue
+        backends.append(name)
+
+    rng = np.random.default_rng(42)
+    print(f"{'backend':<8} {'docs':>8} {'insert/s':>10} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'flt p50':>8} {'flt p95':>8} {'cold s':>8}")
+    for n in args.sizes:
+        for name in backends:
+            r = run(name, n, rng)
+            (p50, p95), (fp50, fp95) = r["latency"]["all"], r["latency"]["filtered"]
+            print(f"{name:<8} {n:>8} {r['insert_docs_per_s']:>10.0f} {p50:>8.2f} {p95:>8.2f} "
+                  f"{fp50:>8.2f} {fp95:>8.2f} {r['cold_open_s']:>8.3f}")
+
+if __name__ == "__main__":
+    main()
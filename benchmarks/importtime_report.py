@@ -0,0 +1,73 @@
+"""
+导入耗时报告: 运行 python -X importtime 导入目标模块, 汇总每个顶层包的累计耗时。
+
+运行: python benchmarks/importtime_report.py [--module main] [--top 20] [--output importtime.md]
+报告写到 stdout, 指定 --output 时同时写成 Markdown 文件。
+"""
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def profile(module: str):
+    """返回 [(self_us, cumulative_us, depth, name)], 按 -X importtime 的输出顺序"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        tail = "\n".join(l for l in proc.stderr.splitlines() if not l.startswith("import time:"))[-2000:]
+        raise SystemExit(f"import {module} failed:\n{tail}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((int(self_us), int(cumulative_us), len(indent) // 2, name))
+    return rows
+
+def summarize(rows):
+    """顶层包耗时 = 该包所有模块自身耗时之和; 总耗时取目标模块的累计耗时"""
+    by_package = defaultdict(int)
+    for self_us, _, _, name in rows:
+        by_package[name.split(".")[0]] += self_us
+    total = max((cumulative for _, cumulative, depth, _ in rows if depth == 0), default=0)
+    return total, sorted(by_package.items(), key=lambda item: item[1], reverse=True)
+
+def render(module: str, total: int, packages, top: int) -> str:
+    lines = [
+        f"# Import time: `import {module}`",
+        "",
+        f"Python {sys.version.split()[0]}, total {total / 1000:.1f} ms (self time summed per top-level package)",
+        "",
+        "| package | ms | share |",
+        "|---|---:|---:|",
+    ]
+    for name, us in packages[:top]:
+        share = us / total * 100 if total else 0.0
+        lines.append(f"| {name} | {us / 1000:.1f} | {share:.1f}% |")
+    return "\n".join(lines) + "\n"
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    total, packages = summarize(profile(args.module))
+    report = render(args.module, total, packages, args.top)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+
+if __name__ == "__main__":
+    main()
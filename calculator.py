@@ -1,103 +1,182 @@
 import logging
+import numpy as np
 
 from decimal import Decimal
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple, Union
 from models import AssetSnapshot, AssetResults
 from config import ASSET_CONFIG
-from utils import get_usd_value
+from risk_factors import RiskFactors, risk_factor_cache
+from risk_model import risk_model_cache
 
-def calculate_asset_metrics(data: AssetSnapshot, rates: dict, btc_risk_score: Decimal) -> AssetResults:
-    total_assets_usd = Decimal('0')
-    total_savings_usd = Decimal('0')
+ZERO = Decimal('0')
+ONE = Decimal('1')
+SPECULATIVE_RISK = Decimal('5')
 
-    gold_val_usd = Decimal('0')
-    btc_val_usd = Decimal('0')
-    currency_exposure = {} # 货币敞口计算
+class ValuationPlan:
+    """
+    由 ASSET_CONFIG 预编译的估值计划。
+    字段顺序、货币桶下标、unit_scale / risk 常量以及黄金 / BTC / 流动性掩码只在配置或风险因子版本变化时构建一次,
+    calculate_asset_metrics 每次调用只需一次遍历。
+    """
+    __slots__ = (
+        "fingerprint", "fields", "currencies", "entries",
+        "bucket_vector", "scale_vector", "risk_vector",
+        "liquid_mask", "gold_mask", "btc_mask", "bucket_onehot"
+    )
 
-    asset_dict = data.model_dump()
+    def __init__(self, asset_config: Dict[str, dict], field_order: Tuple[str, ...], fingerprint: tuple,
+                 risk_overrides: Optional[Dict[str, Decimal]] = None):
+        self.fingerprint = fingerprint
+        risk_overrides = risk_overrides or {}
+        currencies = []
+        entries = []
+        for field in field_order:
+            config = asset_config.get(field)
+            if not config:
+                continue
 
-    for field, amount in asset_dict.items():
-        if amount is None or field == 'id' or field == 'snapshot_date':
-            continue
+            currency = config['currency']
+            if currency not in currencies:
+                currencies.append(currency)
 
-        amount_dec = Decimal(str(amount))
-        if amount_dec == 0: 
-            continue
+            entries.append((
+                field,
+                currency,
+                currencies.index(currency),
+                Decimal(str(config.get('unit_scale', 1.0))),
+                risk_overrides.get(field, Decimal(config['risk'])),
+                bool(config['liquid']),
+                'gold' in field,
+                'btc' in field
+            ))
 
-        config = ASSET_CONFIG.get(field)
+        self.fields = tuple(e[0] for e in entries)
+        self.currencies = tuple(currencies)
+        self.entries = tuple(entries)
 
-        if not config:
-            continue
+        # 批量估值(NumPy)使用的向量形式
+        self.bucket_vector = np.array([e[2] for e in entries], dtype=np.intp)
+        self.scale_vector = np.array([float(e[3]) for e in entries], dtype=np.float64)
+        self.risk_vector = np.array([float(e[4]) for e in entries], dtype=np.float64)
+        self.liquid_mask = np.array([e[5] for e in entries], dtype=bool)
+        self.gold_mask = np.array([e[6] for e in entries], dtype=bool)
+        self.btc_mask = np.array([e[7] for e in entries], dtype=bool)
+        self.bucket_onehot = np.zeros((len(entries), len(currencies)), dtype=np.float64)
+        self.bucket_onehot[np.arange(len(entries)), self.bucket_vector] = 1.0
 
-        currency =  config['currency']
-        is_liquid_flag = config['liquid']
-        unit_scale = Decimal(str(config.get('unit_scale', 1.0)))
+    def inverse_rates(self, rates: dict) -> list:
+        """每个货币桶的 1/rate, 汇率缺失或为 0 时为 None"""
+        inverse = []
+        for currency in self.currencies:
+            rate = rates.get(currency, ZERO)
+            inverse.append(ONE / rate if rate != ZERO else None)
+        return inverse
 
-        rate = rates.get(currency, Decimal('0'))
-        usd_value = get_usd_value(amount_dec, unit_scale, rate)
+_plan: Optional[ValuationPlan] = None
 
-        total_assets_usd += usd_value
+def _config_fingerprint(asset_config: Dict[str, dict]) -> tuple:
+    return tuple(
+        (field, c['currency'], c['risk'], c['liquid'], c.get('unit_scale', 1.0))
+        for field, c in asset_config.items()
+    )
 
-        if is_liquid_flag:
-            total_savings_usd += usd_value
+def get_valuation_plan(risk_factors: Optional[RiskFactors] = None) -> ValuationPlan:
+    """返回当前的估值计划, ASSET_CONFIG 或动态风险因子版本变化时自动重建"""
+    global _plan
+    risk_factors = risk_factors or risk_factor_cache.get()
+    fingerprint = (_config_fingerprint(ASSET_CONFIG), risk_factors.version)
+    if _plan is None or _plan.fingerprint != fingerprint:
+        field_order = tuple(
+            f for f in AssetSnapshot.model_fields if f not in ('id', 'snapshot_date')
+        )
+        _plan = ValuationPlan(ASSET_CONFIG, field_order, fingerprint, risk_factors.field_risks(ASSET_CONFIG))
+        logging.info(f"Valuation plan built: {len(_plan.fields)} fields, {len(_plan.currencies)} currencies, "
+                     f"risk factors v{risk_factors.version}")
+    return _plan
 
-        if 'gold' in field:
-            gold_val_usd += usd_value
+def calculate_asset_metrics(data: AssetSnapshot, rates: dict, btc_risk_score: Decimal) -> AssetResults:
+    plan = get_valuation_plan()
+    inverse_rates = plan.inverse_rates(rates)
+    btc_risk = btc_risk_score if btc_risk_score > 0 else None
 
-        if 'btc' in field:
-            btc_val_usd += usd_value
+    total_assets_usd = ZERO
+    total_savings_usd = ZERO
 
-        currency_exposure[currency] = currency_exposure.get(currency, Decimal('0')) + usd_value
-    logging.info(f"total_assets_usd is {total_assets_usd}")
-    available_liquidity_ratio = Decimal('0')
-    if total_assets_usd > 0:
-        available_liquidity_ratio = (total_savings_usd / total_assets_usd) * 100
+    gold_val_usd = ZERO
+    btc_val_usd = ZERO
+    currency_exposure = {} # 货币敞口计算
 
-    gold_ratio = Decimal('0')
-    if total_assets_usd > 0:
-        gold_ratio = (gold_val_usd / total_assets_usd) * 100
+    weighted_risk_sum = ZERO
+    speculative_sum = ZERO
 
-    btc_ratio = Decimal('0')
-    if total_assets_usd > 0:
-        btc_ratio = (btc_val_usd / total_assets_usd) * 100
+    for field, currency, bucket, unit_scale, risk, is_liquid_flag, is_gold, is_btc in plan.entries:
+        amount = getattr(data, field)
+        if amount is None:
+            continue
+        if not isinstance(amount, Decimal):
+            amount = Decimal(str(amount))
+        if amount == 0:
+            continue
 
-    weighted_risk_sum = Decimal('0')
-    speculative_sum = Decimal('0')
+        inverse_rate = inverse_rates[bucket]
+        usd_value = inverse_rate * amount * unit_scale if inverse_rate is not None else ZERO
 
-    for field, amount in asset_dict.items():
-        if field not in ASSET_CONFIG or amount == 0:
-            continue
+        total_assets_usd += usd_value
+
+        if is_liquid_flag:
+            total_savings_usd += usd_value
 
-        config = ASSET_CONFIG[field]
-        amount_dec = Decimal(str(amount))
+        if is_gold:
+            gold_val_usd += usd_value
 
-        rate = rates.get(config['currency'], Decimal('0'))
-        unit_scale = Decimal(str(config.get('unit_scale', 1.0)))
-        val_usd = get_usd_value(amount_dec, unit_scale, rate)
+        if is_btc:
+            btc_val_usd += usd_value
 
-        risk_score = Decimal(config['risk'])
-        if 'btc' in field and btc_risk_score > 0:
-            risk_score = btc_risk_score
+        currency_exposure[currency] = currency_exposure.get(currency, ZERO) + usd_value
 
-        weighted_risk_sum += val_usd * risk_score
+        risk_score = btc_risk if is_btc and btc_risk is not None else risk
+        weighted_risk_sum += usd_value * risk_score
 
         # 投机资产
-        if risk_score > 5:
-            speculative_sum += val_usd
+        if risk_score > SPECULATIVE_RISK:
+            speculative_sum += usd_value
 
-    logging.info(f"weighted_risk_sum is {weighted_risk_sum}, speculative_sum is {speculative_sum}")
-    weighted_risk_score = Decimal('0')
-    speculative_ratio = Decimal('0')
+    logging.debug("total_assets_usd is %s, weighted_risk_sum is %s, speculative_sum is %s",
+                  total_assets_usd, weighted_risk_sum, speculative_sum)
+
+    available_liquidity_ratio = ZERO
+    gold_ratio = ZERO
+    btc_ratio = ZERO
+    weighted_risk_score = ZERO
+    speculative_ratio = ZERO
+    currency_dist_final = {}
+    portfolio_volatility = None
+    risk_contributions = {}
 
     if total_assets_usd > 0:
+        available_liquidity_ratio = (total_savings_usd / total_assets_usd) * 100
+        gold_ratio = (gold_val_usd / total_assets_usd) * 100
+        btc_ratio = (btc_val_usd / total_assets_usd) * 100
         weighted_risk_score = weighted_risk_sum / total_assets_usd
         speculative_ratio = (speculative_sum / total_assets_usd) * 100
 
-    currency_dist_final = {}
-    if total_assets_usd > 0:
         for curr, val in currency_exposure.items():
             pct = (val / total_assets_usd) * 100
             if pct > 0.01:
                 currency_dist_final[curr] = float(round(pct, 2))
+
+        risk_model = risk_model_cache.get()
+        if risk_model is not None:
+            currencies = tuple(currency_exposure)
+            vol, contributions = risk_model.evaluate(
+                [[float(currency_exposure[c]) for c in currencies]], currencies
+            )
+            portfolio_volatility = Decimal(repr(round(float(vol[0]), 4)))
+            risk_contributions = {
+                curr: float(round(pct, 2)) for curr, pct in zip(currencies, contributions[0].tolist())
+                if abs(pct) > 0.01
+            }
+
     return AssetResults(
         total_assets_usd=total_assets_usd,
         total_savings_usd=total_savings_usd,
@@ -106,5 +185,160 @@ def calculate_asset_metrics(data: AssetSnapshot, rates: dict, btc_risk_score: De
         btc_ratio=btc_ratio,
         weighted_risk_score=weighted_risk_score,
         speculative_ratio=speculative_ratio,
-        currency_distribution=currency_dist_final
-    )
\ No newline at end of file
+        currency_distribution=currency_dist_final,
+        portfolio_volatility=portfolio_volatility,
+        risk_contributions=risk_contributions
+    )
+
+# ===========================
+# 批量估值 (NumPy)
+# ===========================
+# 与 calculate_asset_metrics 的差异仅来自 float64 与 Decimal 的精度:
+# 金额字段相对误差 < 1e-9, 比例字段绝对误差 < 1e-6 个百分点;
+# currency_distribution 仍按 2 位小数四舍五入, 恰好落在 .xx5 边界的值可能相差 0.01。
+BATCH_RELATIVE_TOLERANCE = 1e-9
+BATCH_RATIO_TOLERANCE = 1e-6
+
+class BatchValuation:
+    """批量估值结果, 每个指标为长度 N 的 float64 数组, currency_exposure 为 N×货币数 的美元敞口"""
+    __slots__ = (
+        "currencies", "total_assets_usd", "total_savings_usd", "available_liquidity_ratio",
+        "gold_ratio", "btc_ratio", "weighted_risk_score", "speculative_ratio", "currency_exposure",
+        "portfolio_volatility", "risk_contributions"
+    )
+
+    def __init__(self, currencies: Tuple[str, ...], **metrics: np.ndarray):
+        self.currencies = currencies
+        # 协方差风险模型不可用时为 None
+        self.portfolio_volatility = None
+        self.risk_contributions = None
+        for name, values in metrics.items():
+            setattr(self, name, values)
+
+    def __len__(self) -> int:
+        return len(self.total_assets_usd)
+
+    def currency_distribution(self) -> np.ndarray:
+        """N×货币数 的货币占比(%)"""
+        total = self.total_assets_usd[:, None]
+        return np.where(total > 0, self.currency_exposure / np.where(total > 0, total, 1.0) * 100, 0.0)
+
+    def to_results(self) -> List[AssetResults]:
+        distribution = self.currency_distribution()
+        results = []
+        for i in range(len(self)):
+            currency_dist_final = {
+                curr: float(round(pct, 2))
+                for curr, pct in zip(self.currencies, distribution[i].tolist())
+                if pct > 0.01
+            }
+            risk_metrics = {}
+            if self.portfolio_volatility is not None and self.total_assets_usd[i] > 0:
+                risk_metrics = {
+                    "portfolio_volatility": Decimal(repr(round(float(self.portfolio_volatility[i]), 4))),
+                    "risk_contributions": {
+                        curr: float(round(pct, 2))
+                        for curr, pct in zip(self.currencies, self.risk_contributions[i].tolist())
+                        if abs(pct) > 0.01
+                    }
+                }
+            results.append(AssetResults(
+                total_assets_usd=Decimal(repr(float(self.total_assets_usd[i]))),
+                total_savings_usd=Decimal(repr(float(self.total_savings_usd[i]))),
+                available_liquidity_ratio=Decimal(repr(float(self.available_liquidity_ratio[i]))),
+                gold_ratio=Decimal(repr(float(self.gold_ratio[i]))),
+                btc_ratio=Decimal(repr(float(self.btc_ratio[i]))),
+                weighted_risk_score=Decimal(repr(float(self.weighted_risk_score[i]))),
+                speculative_ratio=Decimal(repr(float(self.speculative_ratio[i]))),
+                currency_distribution=currency_dist_final,
+                **risk_metrics
+            ))
+        return results
+
+def holdings_matrix(snapshots: Sequence[AssetSnapshot], plan: Optional[ValuationPlan] = None) -> np.ndarray:
+    """N 个快照 -> N×字段数 的持仓矩阵(字段顺序同 plan.fields, None 视为 0)"""
+    plan = plan or get_valuation_plan()
+    rows = [[getattr(snapshot, field) or 0 for field in plan.fields] for snapshot in snapshots]
+    return np.array(rows, dtype=np.float64).reshape(len(snapshots), len(plan.fields))
+
+def rates_matrix(rates: Union[Mapping, Sequence[Mapping], np.ndarray], n: int, plan: Optional[ValuationPlan] = None) -> np.ndarray:
+    """
+    汇率输入 -> N×货币数 矩阵(货币顺序同 plan.currencies)。
+    支持: 单个 dict / 汇率快照(所有快照共用) / 每个快照一个 dict / 已经排好列的 ndarray。
+    """
+    plan = plan or get_valuation_plan()
+    if isinstance(rates, np.ndarray):
+        matrix = np.asarray(rates, dtype=np.float64)
+        return np.broadcast_to(matrix if matrix.ndim == 2 else matrix[None, :], (n, len(plan.currencies)))
+
+    if isinstance(rates, Mapping):
+        row = np.array([float(rates.get(c, 0)) for c in plan.currencies], dtype=np.float64)
+        return np.broadcast_to(row, (n, len(plan.currencies)))
+
+    if len(rates) != n:
+        raise ValueError(f"Expected {n} rate rows, got {len(rates)}")
+    return np.array(
+        [[float(r.get(c, 0)) for c in plan.currencies] for r in rates],
+        dtype=np.float64
+    )
+
+def valuate_holdings(
+    holdings: np.ndarray,
+    rates: np.ndarray,
+    btc_risk_score: Union[float, Decimal, np.ndarray, None] = None,
+    plan: Optional[ValuationPlan] = None
+) -> BatchValuation:
+    """
+    批量估值核心: holdings 为 N×字段数, rates 为 N×货币数(或可广播), btc_risk_score 为标量或长度 N。
+    所有 AssetResults 指标都以数组运算得到。
+    """
+    plan = plan or get_valuation_plan()
+    holdings = np.atleast_2d(np.asarray(holdings, dtype=np.float64))
+    rates = np.asarray(rates, dtype=np.float64)
+
+    nonzero = rates != 0
+    inverse = np.divide(1.0, rates, out=np.zeros_like(rates), where=nonzero)
+    usd = holdings * plan.scale_vector * inverse[..., plan.bucket_vector]
+
+    risk = np.broadcast_to(plan.risk_vector, usd.shape)
+    if btc_risk_score is not None:
+        btc_risk = np.asarray(btc_risk_score, dtype=np.float64).reshape(-1, 1)
+        risk = np.where(plan.btc_mask & (btc_risk > 0), btc_risk, risk)
+
+    total = usd.sum(axis=1)
+    positive = total > 0
+    safe_total = np.where(positive, total, 1.0)
+
+    def ratio(values: np.ndarray) -> np.ndarray:
+        return np.where(positive, values / safe_total * 100, 0.0)
+
+    currency_exposure = usd @ plan.bucket_onehot
+    risk_model = risk_model_cache.get()
+    if risk_model is not None:
+        portfolio_volatility, risk_contributions = risk_model.evaluate(currency_exposure, plan.currencies)
+    else:
+        portfolio_volatility, risk_contributions = None, None
+
+    return BatchValuation(
+        plan.currencies,
+        total_assets_usd=total,
+        total_savings_usd=usd @ plan.liquid_mask,
+        available_liquidity_ratio=ratio(usd @ plan.liquid_mask),
+        gold_ratio=ratio(usd @ plan.gold_mask),
+        btc_ratio=ratio(usd @ plan.btc_mask),
+        weighted_risk_score=np.where(positive, (usd * risk).sum(axis=1) / safe_total, 0.0),
+        speculative_ratio=ratio((usd * (risk > float(SPECULATIVE_RISK))).sum(axis=1)),
+        currency_exposure=currency_exposure,
+        portfolio_volatility=portfolio_volatility,
+        risk_contributions=risk_contributions
+    )
+
+def calculate_asset_metrics_batch(
+    snapshots: Sequence[AssetSnapshot],
+    rates: Union[Mapping, Sequence[Mapping], np.ndarray],
+    btc_risk_score: Union[float, Decimal, np.ndarray, None] = None
+) -> BatchValuation:
+    """calculate_asset_metrics 的批量版本, 结果与逐个计算一致(误差见 BATCH_*_TOLERANCE)"""
+    plan = get_valuation_plan()
+    holdings = holdings_matrix(snapshots, plan)
+    return valuate_holdings(holdings, rates_matrix(rates, len(snapshots), plan), btc_risk_score, plan)
@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+import requests
+import numpy as np
+
+from collections import deque
+from typing import Callable, List, Optional, Tuple
+from config import (
+    BTC_PAIR,
+    BTC_INTERVAL_MINUTES,
+    BTC_CANDLE_DB,
+    BTC_CANDLE_MAX_AGE_SECONDS,
+    KRAKEN_OHLC_URL,
+    MOD_WINDOW
+)
+
+# (time, open, high, low, close, vwap, volume, count)
+Candle = Tuple[int, float, float, float, float, float, float, int]
+Fetcher = Callable[[str, int, Optional[int]], Tuple[List[Candle], Optional[int]]]
+
+def _parse_kraken_response(data: dict) -> Tuple[List[Candle], Optional[int]]:
+    if data.get('error'):
+        raise RuntimeError(f"Kraken API 错误: {data['error']}")
+    result = data['result']
+    asset_key = [k for k in result.keys() if k != 'last'][0]
+    candles = [
+        (int(r[0]), float(r[1]), float(r[2]), float(r[3]), float(r[4]), float(r[5]), float(r[6]), int(r[7]))
+        for r in result[asset_key]
+    ]
+    return candles, int(result['last']) if result.get('last') is not None else None
+
+def fetch_kraken_ohlc(pair: str, interval_minutes: int, since: Optional[int] = None,
+                      url: str = KRAKEN_OHLC_URL) -> Tuple[List[Candle], Optional[int]]:
+    """
+    请求 Kraken OHLC。返回 (K 线列表, last 游标)。
+    last 之后(time > last)的最后一根是尚未收盘的 K 线, 下次以 since=last 请求时会再次返回。
+    url 可通过 KRAKEN_OHLC_URL 指向本地桩服务。
+    """
+    params = {'pair': pair, 'interval': interval_minutes}
+    if since is not None:
+        params['since'] = since
+    resp = requests.get(url, params=params, timeout=15)
+    resp.raise_for_status()
+    return _parse_kraken_response(resp.json())
+
+def fixture_fetcher(path: str) -> Fetcher:
+    """从保存的 Kraken OHLC JSON 响应构造 fetcher, 供测试离线使用(按 since 过滤)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        candles, last = _parse_kraken_response(json.load(f))
+
+    def fetch(pair: str, interval_minutes: int, since: Optional[int] = None):
+        rows = [c for c in candles if since is None or c[0] > since]
+        return rows, last
+    return fetch
+
+class CandleStore:
+    """
+    本地持久化的 OHLC K 线存储(SQLite)。
+    以 Kraken 的 since 游标增量同步, 数据新鲜时不访问网络, 每次刷新只处理新增 K 线。
+    """
+    def __init__(self, path: str = BTC_CANDLE_DB, pair: str = BTC_PAIR,
+                 interval_minutes: int = BTC_INTERVAL_MINUTES, fetcher: Optional[Fetcher] = None,
+                 window: int = MOD_WINDOW):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.pair = pair
+        self.interval_minutes = interval_minutes
+        self.fetcher = fetcher or fetch_kraken_ohlc
+        self.window = window
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS candles (
+                pair TEXT NOT NULL, interval INTEGER NOT NULL, time INTEGER NOT NULL,
+                open REAL, high REAL, low REAL, close REAL, vwap REAL, volume REAL, count INTEGER,
+                PRIMARY KEY (pair, interval, time)
+            );
+            CREATE TABLE IF NOT EXISTS sync_state (
+                pair TEXT NOT NULL, interval INTEGER NOT NULL, cursor INTEGER, synced_at REAL,
+                PRIMARY KEY (pair, interval)
+            );
+        """)
+        self._cursor, self._synced_at = self._load_sync_state()
+        self._closes: deque = deque(maxlen=window)      # 已收盘 K 线
+        self._last_time: Optional[int] = None
+        self._provisional: Optional[Candle] = None      # 未收盘 K 线
+        self._load_window()
+
+    def _load_sync_state(self) -> Tuple[Optional[int], float]:
+        row = self._conn.execute(
+            "SELECT cursor, synced_at FROM sync_state WHERE pair = ? AND interval = ?",
+            (self.pair, self.interval_minutes)
+        ).fetchone()
+        return (row[0], row[1] or 0.0) if row else (None, 0.0)
+
+    def _load_window(self):
+        """启动时只加载最近一个窗口的收盘价"""
+        rows = self._conn.execute(
+            "SELECT time, open, high, low, close, vwap, volume, count FROM candles "
+            "WHERE pair = ? AND interval = ? ORDER BY time DESC LIMIT ?",
+            (self.pair, self.interval_minutes, self.window + 1)
+        ).fetchall()
+        for row in reversed(rows):
+            self._apply(tuple(row))
+
+    def _apply(self, candle: Candle):
+        committed = self._cursor is not None and candle[0] <= self._cursor
+        if not committed:
+            if self._provisional is None or candle[0] >= self._provisional[0]:
+                self._provisional = candle
+            return
+        if self._last_time is not None and candle[0] <= self._last_time:
+            return
+        if self._provisional is not None and self._provisional[0] <= candle[0]:
+            self._provisional = None
+        self._last_time = candle[0]
+        self._closes.append(candle[4])
+
+    def __len__(self) -> int:
+        return len(self._closes) + (1 if self._provisional else 0)
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        return len(self) > 0 and now - self._synced_at < BTC_CANDLE_MAX_AGE_SECONDS
+
+    def sync(self, force: bool = False) -> int:
+        """增量同步, 返回新收到的 K 线数量; 数据新鲜时直接返回 0"""
+        with self._lock:
+            if not force and self.is_fresh():
+                return 0
+
+            candles, last = self.fetcher(self.pair, self.interval_minutes, self._cursor)
+            now = time.time()
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO candles "
+                    "(pair, interval, time, open, high, low, close, vwap, volume, count) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(self.pair, self.interval_minutes) + tuple(c) for c in candles]
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sync_state (pair, interval, cursor, synced_at) VALUES (?, ?, ?, ?)",
+                    (self.pair, self.interval_minutes, last if last is not None else self._cursor, now)
+                )
+            if last is not None:
+                self._cursor = last
+            self._synced_at = now
+
+            for candle in sorted(candles):
+                self._apply(candle)
+            logging.info(f"Candle store {self.pair}: {len(candles)} candles synced, {len(self)} in window")
+            return len(candles)
+
+    def closes(self, n: Optional[int] = None) -> np.ndarray:
+        """最近 n 根收盘价(含未收盘 K 线), 升序"""
+        values = list(self._closes)
+        if self._provisional is not None:
+            values.append(self._provisional[4])
+        if n is not None:
+            values = values[-n:]
+        return np.array(values, dtype=np.float64)
+
+_btc_store: Optional[CandleStore] = None
+_btc_store_lock = threading.Lock()
+
+def get_btc_candle_store() -> CandleStore:
+    global _btc_store
+    with _btc_store_lock:
+        if _btc_store is None:
+            _btc_store = CandleStore()
+        return _btc_store
@@ -1,46 +1,153 @@
-import os
+"""
+向量库检查工具。
+
+    python check_vector_db.py stats                 # 文档数、磁盘占用、最近一次压缩
+    python check_vector_db.py list --limit 20 --source automated_update
+    python check_vector_db.py retention             # 按保留策略预览将被删除的文档(不修改)
+    python check_vector_db.py compact               # 执行保留策略并压缩
+    python check_vector_db.py search "BTC 回撤" -k 5 --since 2026-01-01
+
+stats / list / retention / compact 直接打开存储后端, 不加载嵌入模型; search 需要嵌入模型。
+"""
 import sys
-from langchain_chroma import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
+import json
+import argparse
+
+from collections import Counter
+from datetime import date, datetime
+from config import VECTOR_BACKEND
+
+def _format_bytes(n: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+def _policy(args):
+    from vector_retention import RetentionPolicy
+    policy = RetentionPolicy()
+    if args.daily_days is not None:
+        policy.daily_days = args.daily_days
+    if args.weekly_days is not None:
+        policy.weekly_days = args.weekly_days
+    return policy
+
+def cmd_stats(backend, args):
+    from vector_retention import vector_stats
+    stats = vector_stats(backend)
+    if args.json:
+        print(json.dumps(stats, ensure_ascii=False, indent=2))
+        return
+    print(f"📂 后端: {stats['backend']}")
+    print(f"📄 文档数: {stats['documents']}")
+    print(f"💾 磁盘占用: {_format_bytes(stats['disk_bytes'])}")
+    policy = stats["retention_policy"]
+    print(f"🗂  保留策略: {policy['daily_days']} 天内每天一份, {policy['weekly_days']} 天内每周一份, 更早每月一份")
+    last = stats["last_compaction"]
+    if last:
+        compacted_at = datetime.fromtimestamp(last["compacted_at"]).strftime("%Y-%m-%d %H:%M:%S")
+        print(f"🧹 最近压缩: {compacted_at} (删除 {last['deleted']} 条, "
+              f"{_format_bytes(last['disk_bytes_before'])} -> {_format_bytes(last['disk_bytes_after'])})")
+    else:
+        print("🧹 最近压缩: 无")
+
+def cmd_list(backend, args):
+    docs = backend.documents()
+    if args.source:
+        docs = [(i, m) for i, m in docs if m.get("source") == args.source]
+    if args.since:
+        docs = [(i, m) for i, m in docs if str(m.get("report_date", "")) >= args.since.isoformat()]
+    if args.until:
+        docs = [(i, m) for i, m in docs if str(m.get("report_date", "")) <= args.until.isoformat()]
+    docs.sort(key=lambda d: str(d[1].get("report_date", "")), reverse=True)
 
-try:
-    from vector_store import PERSIST_DIRECTORY
-except ImportError:
-    print("❌ 导入 vector_store 失败，请检查文件位置。")
-    sys.exit(1)
+    if args.json:
+        print(json.dumps([{"id": i, "metadata": m} for i, m in docs[:args.limit]], ensure_ascii=False, indent=2))
+        return
+    print(f"✅ 共 {len(docs)} 条记录 (展示前 {min(len(docs), args.limit)} 条):\n")
+    for doc_id, meta in docs[:args.limit]:
+        print(f"{meta.get('report_date', '?'):<10}  {str(meta.get('source', '-')):<18}  {doc_id[:12]}  {meta}")
+
+def cmd_retention(backend, args):
+    from vector_retention import plan_retention
+    policy = _policy(args)
+    docs = backend.documents()
+    keep, delete = plan_retention(docs, policy)
+    doomed = set(delete)
+    by_source = Counter(str(m.get("source", "-")) for i, m in docs if i in doomed)
+
+    if args.json:
+        print(json.dumps({"keep": len(keep), "delete": len(delete), "delete_by_source": by_source},
+                         ensure_ascii=False, indent=2))
+        return
+    print(f"保留 {len(keep)} 条, 删除 {len(delete)} 条")
+    for source, n in by_source.most_common():
+        print(f"  - {source}: {n}")
 
-def inspect_db():
-    ABSOLUTE_PATH = os.path.abspath(PERSIST_DIRECTORY)
-    print(f"📂 正在读取数据库路径: {ABSOLUTE_PATH}")
+def cmd_compact(backend, args):
+    from vector_retention import compact_vector_store
+    summary = compact_vector_store(backend, policy=_policy(args))
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
 
-    if not os.path.exists(PERSIST_DIRECTORY):
-        print("❌ 错误: 数据库目录不存在！请检查路径或先运行一次 update_assets")
+def cmd_search(backend, args):
+    from vector_store import AssetVectorDB
+    from report_retrieval import build_where, search_reports
+
+    db = AssetVectorDB(backend=backend)
+    where = build_where(date_from=args.since, date_to=args.until, source=args.source)
+    results, _ = search_reports(args.query, k=args.k, where=where, db=db)
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
         return
+    for i, hit in enumerate(results, 1):
+        print(f"--- {i}. {hit['report_date']} {hit['source']} (相似度 {hit['score']:.3f}) ---")
+        print(hit["content"][:300])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="检查资产报告向量库")
+    parser.add_argument("--backend", default=VECTOR_BACKEND, choices=["chroma", "numpy"])
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    sub = parser.add_subparsers(dest="command")
+
+    sub.add_parser("stats", help="文档数、磁盘占用、最近一次压缩")
+
+    p_list = sub.add_parser("list", help="按日期倒序列出文档元数据")
+    p_list.add_argument("--limit", type=int, default=10)
+    p_list.add_argument("--source")
+    p_list.add_argument("--since", type=date.fromisoformat)
+    p_list.add_argument("--until", type=date.fromisoformat)
 
-    embedding_function = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2"
-    )
-    
-    db = Chroma(
-        collection_name="asset_reports",
-        embedding_function=embedding_function,
-        persist_directory=PERSIST_DIRECTORY
-    )
+    for name, text in (("retention", "预览保留策略(不修改)"), ("compact", "执行保留策略并压缩")):
+        p = sub.add_parser(name, help=text)
+        p.add_argument("--daily-days", type=int)
+        p.add_argument("--weekly-days", type=int)
 
-    collection_data = db.get(limit=10)
+    p_search = sub.add_parser("search", help="语义检索(需要加载嵌入模型)")
+    p_search.add_argument("query")
+    p_search.add_argument("-k", type=int, default=3)
+    p_search.add_argument("--source")
+    p_search.add_argument("--since", type=date.fromisoformat)
+    p_search.add_argument("--until", type=date.fromisoformat)
 
-    ids = collection_data['ids']
-    metadatas = collection_data['metadatas']
-    documents = collection_data['documents']
+    args = parser.parse_args(argv)
+    command = args.command or "stats"
 
-    print(f"\n✅ 数据库中共有 {len(ids)} 条记录 (本次展示前 {len(ids)} 条):\n")
+    from vector_store import open_backend
+    try:
+        backend = open_backend(args.backend)
+    except ImportError as e:
+        print(f"❌ 无法打开 {args.backend} 后端: {e}")
+        return 1
 
-    for i in range(len(ids)):
-        print(f"--- 记录 {i+1} ---")
-        print(f"🆔 ID: {ids[i]}")
-        print(f"📅 Metadata (元数据): {metadatas[i]}")
-        print(f"📄 Content (前100字符): {documents[i][:100]}...")
-        print("-" * 30)
+    {
+        "stats": cmd_stats,
+        "list": cmd_list,
+        "retention": cmd_retention,
+        "compact": cmd_compact,
+        "search": cmd_search
+    }[command](backend, args)
+    return 0
 
 if __name__ == "__main__":
-    inspect_db()
\ No newline at end of file
+    sys.exit(main())
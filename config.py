@@ -141,4 +141,195 @@ ASSET_CONFIG = {
     "deposit_gbp": {
         "currency": "GBP", "risk": 0.5, "liquid": False, "unit_scale": 1.0, "name": "英镑存款"
     }
-}
\ No newline at end of file
+}
+
+# ===========================
+# 异步流水线各阶段超时(秒)
+# ===========================
+STAGE_TIMEOUTS = {
+    "cache": 2.0,
+    "rates": 3.0,
+    "btc_risk": 2.0,
+    "onchain_report": 12.0,
+    "vector_store": 30.0,
+    "report_search": 10.0,
+    "report_file": 5.0,
+    "db_commit": 10.0,
+    "enqueue": 2.0,
+    "monte_carlo": 10.0
+}
+
+# ===========================
+# 后台任务队列 (Redis)
+# ===========================
+JOB_QUEUE_KEY = 'jobs:queue'
+JOB_DELAYED_KEY = 'jobs:delayed'
+JOB_KEY_PREFIX = 'jobs:job:'
+JOB_IDEMPOTENCY_PREFIX = 'jobs:idem:'
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BACKOFF_SECONDS = 5
+JOB_TTL_SECONDS = 86400
+JOB_PROCESSING_PREFIX = 'jobs:processing:'      # 每个 worker 一个处理中列表, BLMOVE 取出的任务先放在这里
+JOB_WORKERS_KEY = 'jobs:workers'
+JOB_WORKER_HEARTBEAT_PREFIX = 'jobs:worker:'
+JOB_WORKER_HEARTBEAT_TTL = 30                  # worker 心跳过期后, 其处理中的任务由其他 worker 放回队列
+
+# ===========================
+# 汇率快照 (一次 MGET + pub/sub 版本通知)
+# ===========================
+RATE_CODES = ('XAU', 'CNY', 'GBP', 'EUR', 'HKD', 'BTC', 'SGD', 'USD')
+RATES_VERSION_KEY = 'fx:rates:version'
+RATES_CHANNEL = 'fx:rates:updates'
+RATES_POLL_SECONDS = 30   # pub/sub 消息丢失时的兜底版本检查间隔
+
+# ===========================
+# 汇率/价格历史 (Redis sorted set, score 为时间戳)
+# ===========================
+RATE_HISTORY_KEY = 'fx:rates:history'
+RATE_HISTORY_RETENTION_DAYS = 3 * 365
+
+# ===========================
+# 蒙特卡洛风险模拟
+# ===========================
+MC_DEFAULT_PATHS = 50000
+MC_MAX_PATHS = 1000000
+MC_DEFAULT_HORIZON_DAYS = 30
+MC_LOOKBACK_DAYS = 365
+MC_MIN_HISTORY_DAYS = 60
+MC_PARALLEL_MIN_PATHS = 200000   # 超过该路径数时拆分到进程池
+MC_MAX_WORKERS = int(os.getenv("MC_MAX_WORKERS", str(os.cpu_count() or 1)))
+
+# ===========================
+# 再平衡交易优化
+# ===========================
+# 不可划转的字段(养老金/公积金等锁定资金)
+REBALANCE_LOCKED_FIELDS = {"retirement_funds_cny", "housing_fund_cny"}
+# 目标是把偏差压到 阈值 - margin 以内, 避免落在阈值边界上
+REBALANCE_TARGET_MARGIN = Decimal('0.5')
+
+# ===========================
+# BTC K 线本地存储 (SQLite, Kraken since 游标增量同步)
+# ===========================
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+BTC_CANDLE_DB = os.getenv("BTC_CANDLE_DB", os.path.join(DATA_DIR, 'btc_ohlc.sqlite3'))
+KRAKEN_OHLC_URL = os.getenv("KRAKEN_OHLC_URL", "https://api.kraken.com/0/public/OHLC")
+BTC_CANDLE_MAX_AGE_SECONDS = 3600   # 距上次同步不足该时间视为新鲜, 不访问网络
+
+# ===========================
+# BTC 风险分缓存 (stale-while-revalidate)
+# ===========================
+BTC_RISK_SOFT_TTL = 6 * 3600        # 超过该年龄后台刷新, 期间继续返回旧值
+BTC_RISK_HARD_TTL = 43200           # Redis 中的过期时间
+BTC_RISK_LOCK_KEY = "btc_risk:refresh_lock"
+BTC_RISK_LOCK_TTL = 120
+BTC_RISK_REFRESH_INTERVAL = 600     # 后台刷新线程的检查间隔
+
+# ===========================
+# 多资产动态风险因子
+# ===========================
+# 字段 -> 价格序列代码(取自汇率历史, 价格为 1/rate)。
+# 美元计价字段(含美股)在本仓库中没有价格序列, 保持 ASSET_CONFIG 中的静态风险;
+# BTC 相关字段继续直接使用 BTC 风险分。
+RISK_FACTOR_SERIES = {
+    field: cfg["currency"]
+    for field, cfg in ASSET_CONFIG.items()
+    if cfg["currency"] != "USD" and "btc" not in field
+}
+RISK_FACTOR_BASE = Decimal('0.5')   # 动态风险 = 静态风险 × (0.5 + 因子分/10), 因子分 5 时不变
+RISK_FACTOR_MIN_DAYS = 60
+RISK_FACTORS_KEY = "risk:factors"
+RISK_FACTORS_VERSION_KEY = "risk:factors:version"
+RISK_FACTORS_POLL_SECONDS = 30
+
+# ===========================
+# 协方差风险模型 (Ledoit-Wolf 收缩)
+# ===========================
+RISK_MODEL_LOOKBACK_DAYS = 365
+RISK_MODEL_MIN_DAYS = 60
+RISK_MODEL_ANNUALIZATION = 365      # 按日历日网格, 年化因子
+RISK_MODEL_KEY = "risk:model"
+RISK_MODEL_VERSION_KEY = "risk:model:version"
+RISK_MODEL_POLL_SECONDS = 60
+
+# ===========================
+# Agent 语义缓存 (分桶特征向量 + 近邻回退)
+# ===========================
+# 比例类特征的分桶精度(百分点), 未列出的使用 default; 金额类特征按 log10 分桶
+AGENT_CACHE_PRECISION = {
+    "default": float(os.getenv("AGENT_CACHE_RATIO_PRECISION", "1.0")),
+    "weighted_risk_score": 0.1,
+    "btc_dynamic_risk": 0.1,
+    "portfolio_volatility": 0.5
+}
+AGENT_CACHE_AMOUNT_LOG_STEP = float(os.getenv("AGENT_CACHE_AMOUNT_LOG_STEP", "0.02"))   # 约 4.7% 一档
+AGENT_CACHE_NN_MAX_BUCKETS = float(os.getenv("AGENT_CACHE_NN_MAX_BUCKETS", "1.0"))      # 0 关闭近邻回退
+AGENT_CACHE_INDEX_MAX = 2000
+
+# ===========================
+# Agent 调用: 后端、截止时间与熔断
+# ===========================
+AGENT_BACKEND = os.getenv("AGENT_BACKEND", "openai")     # openai / offline(仅规则分析, 无网络)
+AGENT_DEADLINE_SECONDS = float(os.getenv("AGENT_DEADLINE_SECONDS", "8"))
+AGENT_BREAKER_FAILURES = 3
+AGENT_BREAKER_RESET_SECONDS = 60
+
+# ===========================
+# Agent 提示词压缩与 token 预算
+# ===========================
+AGENT_PROMPT_TOKEN_BUDGET = int(os.getenv("AGENT_PROMPT_TOKEN_BUDGET", "1200"))
+AGENT_REPORT_MAX_CHARS = 600            # 链上报告摘要的初始长度, 超预算时逐级缩短
+
+# ===========================
+# 启动: 重量级子系统在启动后由后台线程预热
+# ===========================
+PREWARM_ON_STARTUP = os.getenv("PREWARM_ON_STARTUP", "1") == "1"
+
+# ===========================
+# 向量服务: 单进程持有嵌入模型与 Chroma, 各 worker 通过本地 socket 访问
+# ===========================
+VECTOR_SERVICE = os.getenv("VECTOR_SERVICE", "local")      # local: 进程内加载 / remote: 连接 embedding_service
+EMBEDDING_SERVICE_ADDRESS = os.getenv("EMBEDDING_SERVICE_ADDRESS", os.path.join(DATA_DIR, 'embedding.sock'))
+# 连接使用 pickle, 密钥必须保密: 未设置时由 embedding_service 生成随机密钥写入 0600 文件
+EMBEDDING_SERVICE_AUTHKEY = os.getenv("EMBEDDING_SERVICE_AUTHKEY")
+EMBEDDING_SERVICE_KEY_FILE = os.getenv("EMBEDDING_SERVICE_KEY_FILE", os.path.join(DATA_DIR, 'embedding.key'))
+EMBEDDING_SERVICE_TIMEOUT = 30
+EMBEDDING_SERVICE_SLOW_TIMEOUT = 900     # compact / delete 在大集合上可能运行数分钟
+
+# ===========================
+# 向量库写入缓冲 (write-behind, 按内容去重)
+# ===========================
+VECTOR_FLUSH_BATCH_SIZE = 16         # 缓冲达到该数量时立即写入
+VECTOR_FLUSH_INTERVAL_SECONDS = 5.0  # 缓冲中最早的文档最多等待的时间
+VECTOR_SEEN_HASHES_MAX = 10000       # 进程内记住的已写入内容哈希数量
+
+# ===========================
+# 嵌入缓存 (memmap float32 + SQLite 索引, LRU)
+# ===========================
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", os.path.join(DATA_DIR, 'embedding_cache'))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "50000"))  # 384 维约 75MB
+
+# ===========================
+# 向量库存储后端
+# ===========================
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")   # chroma | numpy
+NUMPY_VECTOR_DIR = os.getenv("NUMPY_VECTOR_DIR", os.path.join(DATA_DIR, 'vector_index'))
+
+# ===========================
+# 历史报告检索 / Agent RAG 上下文
+# ===========================
+REPORT_NUMERIC_FIELDS = ("report_ts", "risk_score", "btc_ratio", "total_assets")
+REPORT_SEARCH_CACHE_SIZE = 256
+REPORT_SEARCH_CACHE_TTL = 300         # 秒; 新报告写入会改变文档数, 使旧键自然失效
+AGENT_RAG_TOP_K = 3
+AGENT_RAG_MAX_CHARS = 600             # 历史报告摘要的总字符上限, 之后还受 token 预算约束
+AGENT_RAG_MIN_SCORE = 0.3             # 低于该余弦相似度的历史报告不放入上下文
+
+# ===========================
+# 向量库保留策略与压缩
+# ===========================
+VECTOR_RETENTION_DAILY_DAYS = int(os.getenv("VECTOR_RETENTION_DAILY_DAYS", "30"))     # 这之内每天每个来源保留一份
+VECTOR_RETENTION_WEEKLY_DAYS = int(os.getenv("VECTOR_RETENTION_WEEKLY_DAYS", "180"))  # 这之内每周一份, 更早每月一份
+VECTOR_COMPACTION_INTERVAL_SECONDS = 86400     # 自动压缩的最小间隔
+VECTOR_COMPACTION_KEY = 'VECTOR_COMPACTION:last'
+VECTOR_COMPACTION_SCHEDULE_KEY = 'VECTOR_COMPACTION:scheduled'
@@ -0,0 +1,210 @@
+"""
+持久化的内容寻址嵌入缓存。
+
+键为 (模型名, 文本 sha256), 向量以 float32 存放在按模型划分的 memmap 文件中,
+SQLite 索引记录每个键所在的槽位和最近使用时间; 超过容量时按 LRU 复用最久未用的槽位。
+CachedEmbeddings 包装任意 embed_documents / embed_query 接口, 只把未命中的文本交给模型,
+因此重建或重新索引集合时, 已经见过的文本几乎没有成本。
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import numpy as np
+
+from typing import Dict, List, Optional
+from config import EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_MODEL_NAME
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingStore:
+    """
+    单个模型的向量存储: <dir>/<model>.f32 (capacity x dim 的 float32 memmap) + index.sqlite3
+    """
+    def __init__(self, model_name: str, directory: str = EMBEDDING_CACHE_DIR,
+                 max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        os.makedirs(directory, exist_ok=True)
+        self.model_name = model_name
+        self.capacity = max_entries
+        self.vectors_path = os.path.join(directory, hashlib.sha1(model_name.encode("utf-8")).hexdigest()[:16] + ".f32")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, "index.sqlite3"), check_same_thread=False, timeout=30)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL, text_hash TEXT NOT NULL, slot INTEGER NOT NULL, last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            );
+            CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings (model, last_used);
+            CREATE INDEX IF NOT EXISTS embeddings_slot ON embeddings (model, slot);
+            CREATE TABLE IF NOT EXISTS models (
+                model TEXT PRIMARY KEY, dim INTEGER NOT NULL, capacity INTEGER NOT NULL
+            );
+        """)
+        self._vectors: Optional[np.memmap] = None
+        row = self._conn.execute("SELECT dim, capacity FROM models WHERE model = ?", (model_name,)).fetchone()
+        if row and os.path.exists(self.vectors_path):
+            self._open(dim=row[0], capacity=row[1])
+        self.hits = 0
+        self.misses = 0
+
+    def _open(self, dim: int, capacity: int):
+        mode = "r+" if os.path.exists(self.vectors_path) else "w+"
+        self.capacity = capacity
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode=mode, shape=(capacity, dim))
+
+    @property
+    def dim(self) -> Optional[int]:
+        return None if self._vectors is None else self._vectors.shape[1]
+
+    def _lookup(self, hashes: List[str]) -> Dict[str, int]:
+        slots: Dict[str, int] = {}
+        for start in range(0, len(hashes), 500):
+            chunk = hashes[start:start + 500]
+            slots.update(self._conn.execute(
+                f"SELECT text_hash, slot FROM embeddings WHERE model = ? AND text_hash IN ({','.join('?' * len(chunk))})",
+                (self.model_name, *chunk)
+            ).fetchall())
+        return slots
+
+    def get_many(self, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """返回命中的 {hash: 向量}, 并刷新它们的最近使用时间"""
+        if self._vectors is None or not hashes:
+            return {}
+        with self._lock:
+            # 在读事务中查槽位并复制向量: 持有 SHARED 锁期间, 其他进程的 put_many(BEGIN EXCLUSIVE)
+            # 无法淘汰并覆盖这些槽位
+            self._conn.execute("BEGIN")
+            try:
+                found = {h: np.array(self._vectors[slot]) for h, slot in self._lookup(hashes).items()}
+            finally:
+                self._conn.execute("COMMIT")
+            if found:
+                now = time.time()
+                with self._conn:
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                        [(now, self.model_name, h) for h in found]
+                    )
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        if not items:
+            return
+        with self._lock:
+            if self._vectors is None:
+                dim = len(next(iter(items.values())))
+                with self._conn:
+                    self._conn.execute("INSERT OR IGNORE INTO models (model, dim, capacity) VALUES (?, ?, ?)",
+                                       (self.model_name, dim, self.capacity))
+                dim, capacity = self._conn.execute("SELECT dim, capacity FROM models WHERE model = ?",
+                                                   (self.model_name,)).fetchone()
+                self._open(dim=dim, capacity=capacity)
+
+            now = time.time()
+            # BEGIN EXCLUSIVE: 多个进程共用同一个缓存时槽位分配需要串行,
+            # 并且在写 memmap 期间没有读事务正在读取将被覆盖的槽位
+            self._conn.execute("BEGIN EXCLUSIVE")
+            try:
+                # 已有的键向量相同, 只刷新最近使用时间
+                existing = self._lookup(list(items))
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, self.model_name, h) for h in existing]
+                )
+                items = {h: v for h, v in items.items() if h not in existing}
+                slots = self._allocate_slots(len(items))
+                rows = []
+                for (h, vector), slot in zip(items.items(), slots):
+                    self._vectors[slot] = np.asarray(vector, dtype=np.float32)
+                    rows.append((self.model_name, h, slot, now))
+                self._vectors.flush()
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, text_hash, slot, last_used) VALUES (?, ?, ?, ?)", rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _allocate_slots(self, n: int) -> List[int]:
+        """
+        先用最高已用槽位之后的空闲槽位, 不够时淘汰最久未使用的条目。
+        条目只会因淘汰而删除且槽位立即复用, 因此最高槽位以下没有空洞。
+        """
+        n = min(n, self.capacity)
+        high = self._conn.execute("SELECT MAX(slot) FROM embeddings WHERE model = ?", (self.model_name,)).fetchone()[0]
+        start = 0 if high is None else high + 1
+        slots = list(range(start, min(start + n, self.capacity)))
+        if len(slots) < n:
+            evicted = self._conn.execute(
+                "SELECT text_hash, slot FROM embeddings WHERE model = ? ORDER BY last_used LIMIT ?",
+                (self.model_name, n - len(slots))
+            ).fetchall()
+            self._conn.executemany("DELETE FROM embeddings WHERE model = ? AND text_hash = ?",
+                                   [(self.model_name, h) for h, _ in evicted])
+            slots.extend(slot for _, slot in evicted)
+            logging.info(f"Embedding cache evicted {len(evicted)} entries ({self.model_name})")
+        return slots
+
+    def stats(self) -> dict:
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM embeddings WHERE model = ?",
+                                       (self.model_name,)).fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "entries": count,
+            "capacity": self.capacity,
+            "dim": self.dim,
+            "disk_bytes": os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None
+        }
+
+class CachedEmbeddings:
+    """
+    带持久缓存的嵌入函数, 接口与 LangChain Embeddings 相同, 可直接传给 Chroma。
+    """
+    def __init__(self, underlying, model_name: str, store: Optional[EmbeddingStore] = None):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.store = store or EmbeddingStore(model_name)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [text_hash(t) for t in texts]
+        cached = self.store.get_many(list(dict.fromkeys(hashes)))
+
+        # 同一批次中重复的文本只计算一次
+        missing: Dict[str, str] = {}
+        for h, t in zip(hashes, texts):
+            if h not in cached and h not in missing:
+                missing[h] = t
+        self.store.hits += len(texts) - len(missing)
+        self.store.misses += len(missing)
+
+        if missing:
+            computed = self.underlying.embed_documents(list(missing.values()))
+            fresh = {h: [float(x) for x in v] for h, v in zip(missing.keys(), computed)}
+            try:
+                self.store.put_many(fresh)
+            except Exception as e:
+                logging.warning(f"Failed to persist embeddings: {e}")
+            for h, v in fresh.items():
+                cached[h] = np.asarray(v, dtype=np.float32)
+
+        return [cached[h].tolist() for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> dict:
+        return self.store.stats()
+
+def load_embedding_function(model_name: str = EMBEDDING_MODEL_NAME) -> CachedEmbeddings:
+    """加载 HuggingFace 嵌入模型并包上持久缓存, vector_store 与 check_vector_db 共用"""
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return CachedEmbeddings(HuggingFaceEmbeddings(model_name=model_name), model_name)
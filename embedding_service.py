@@ -0,0 +1,195 @@
+"""
+向量服务: 单个进程持有嵌入模型与 Chroma 客户端, uvicorn / gunicorn / job worker 通过本地 Unix socket 调用。
+内存中只有一份模型, 所有写入串行经过同一个 Chroma 客户端。
+
+运行: python embedding_service.py, 各进程设置 VECTOR_SERVICE=remote。
+连接密钥取自 EMBEDDING_SERVICE_AUTHKEY, 未设置时共用 EMBEDDING_SERVICE_KEY_FILE 中随机生成的密钥。
+"""
+import os
+import logging
+import secrets
+import threading
+
+from multiprocessing.connection import Client, Listener
+from typing import Any, Dict, List, Optional
+from config import (
+    EMBEDDING_SERVICE_ADDRESS,
+    EMBEDDING_SERVICE_AUTHKEY,
+    EMBEDDING_SERVICE_KEY_FILE,
+    EMBEDDING_SERVICE_TIMEOUT,
+    EMBEDDING_SERVICE_SLOW_TIMEOUT
+)
+
+# 服务端允许调用的方法
+OPERATIONS = (
+    "add_report", "flush", "ingest_stats", "count", "documents", "delete", "compact", "storage_stats",
+    "similarity_search", "embed_documents", "embed_query", "ping"
+)
+# 使用 EMBEDDING_SERVICE_SLOW_TIMEOUT 的操作
+SLOW_OPERATIONS = ("delete", "compact")
+
+def load_authkey(path: str = EMBEDDING_SERVICE_KEY_FILE) -> bytes:
+    """
+    连接密钥: 优先使用 EMBEDDING_SERVICE_AUTHKEY; 否则读取密钥文件, 不存在时生成 32 字节随机密钥
+    并以 0600 权限创建(O_EXCL, 多个进程同时启动时只有一个会写入)。
+    """
+    if EMBEDDING_SERVICE_AUTHKEY:
+        return EMBEDDING_SERVICE_AUTHKEY.encode("utf-8")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(path, "rb") as f:
+            key = f.read().strip()
+        if not key:
+            raise RuntimeError(f"Embedding service key file {path} is empty")
+        return key
+    key = secrets.token_hex(32).encode("ascii")
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+class EmbeddingServer:
+    def __init__(self, address: str = EMBEDDING_SERVICE_ADDRESS):
+        from vector_store import AssetVectorDB
+
+        self.address = address
+        self.db = AssetVectorDB()
+        self._lock = threading.Lock()
+
+    def handle(self, op: str, args: tuple, kwargs: dict) -> Any:
+        if op == "ping":
+            return os.getpid()
+        if op in ("embed_documents", "embed_query"):
+            return getattr(self.db, op)(*args, **kwargs)
+        # 向量库读写串行执行, 避免多个客户端并发写同一个 chroma_db 目录
+        with self._lock:
+            return getattr(self.db, op)(*args, **kwargs)
+
+    def _serve_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    op, args, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if op not in OPERATIONS:
+                        raise ValueError(f"Unsupported operation: {op}")
+                    conn.send(("ok", self.handle(op, args, kwargs)))
+                except Exception as e:
+                    logging.error(f"Embedding service {op} failed: {e}", exc_info=True)
+                    conn.send(("error", str(e)))
+
+    def serve_forever(self):
+        os.makedirs(os.path.dirname(self.address), exist_ok=True)
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        # socket 创建时即为 0600, 只有同一用户的进程可以连接
+        old_umask = os.umask(0o177)
+        try:
+            listener = Listener(self.address, family="AF_UNIX", authkey=load_authkey())
+        finally:
+            os.umask(old_umask)
+        os.chmod(self.address, 0o600)
+        with listener:
+            logging.info(f"Embedding service listening on {self.address} (pid {os.getpid()})")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    logging.warning(f"Embedding service rejected a connection: {e}")
+                    continue
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+class RemoteAssetVectorDB:
+    """
+    与 AssetVectorDB 接口相同的客户端代理, 每个进程(线程安全地)复用一条连接, 发送前发现连接断开时自动重连一次。
+    """
+    def __init__(self, address: str = EMBEDDING_SERVICE_ADDRESS):
+        self.address = address
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _call(self, op: str, *args, **kwargs) -> Any:
+        """
+        只有请求没有发出去(连接失败, 或旧连接已断开导致 send 失败)时才重连重试一次;
+        send 成功后的超时或断开直接抛出, 避免重复执行 add_report / delete / compact 等非幂等操作。
+        """
+        timeout = EMBEDDING_SERVICE_SLOW_TIMEOUT if op in SLOW_OPERATIONS else EMBEDDING_SERVICE_TIMEOUT
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._conn is None:
+                        self._conn = Client(self.address, family="AF_UNIX", authkey=load_authkey())
+                    self._conn.send((op, args, kwargs))
+                    break
+                except (EOFError, OSError):
+                    self._close()
+                    if attempt == 1:
+                        raise
+            try:
+                if not self._conn.poll(timeout):
+                    raise TimeoutError(f"Embedding service did not answer {op} in {timeout}s")
+                status, result = self._conn.recv()
+            except (EOFError, OSError, TimeoutError):
+                # 连接上可能还有迟到的响应, 丢弃这条连接
+                self._close()
+                raise
+        if status != "ok":
+            raise RuntimeError(f"Embedding service error: {result}")
+        return result
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except OSError:
+                pass
+            self._conn = None
+
+    def add_report(self, report_text: str, metadata: Dict[str, Any]):
+        try:
+            self._call("add_report", report_text, metadata)
+        except Exception as e:
+            logging.error(f"Failed to store report via embedding service: {e}")
+
+    def flush(self) -> int:
+        return self._call("flush")
+
+    def ingest_stats(self) -> Dict[str, Any]:
+        return self._call("ingest_stats")
+
+    def count(self) -> int:
+        return self._call("count")
+
+    def documents(self):
+        return self._call("documents")
+
+    def delete(self, ids) -> int:
+        return self._call("delete", ids)
+
+    def compact(self) -> Dict[str, Any]:
+        return self._call("compact")
+
+    def storage_stats(self) -> Dict[str, Any]:
+        return self._call("storage_stats")
+
+    def similarity_search(self, query: str, k: int = 3, where: Optional[Dict[str, Any]] = None):
+        return self._call("similarity_search", query, k=k, where=where)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._call("embed_documents", texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._call("embed_query", text)
+
+    def ping(self) -> int:
+        return self._call("ping")
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    EmbeddingServer().serve_forever()
+
+if __name__ == "__main__":
+    main()
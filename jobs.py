@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+import threading
+import contextvars
+import redis
+
+from typing import Any, Callable, Dict, Optional
+from config import (
+    JOB_QUEUE_KEY,
+    JOB_DELAYED_KEY,
+    JOB_KEY_PREFIX,
+    JOB_IDEMPOTENCY_PREFIX,
+    JOB_MAX_ATTEMPTS,
+    JOB_RETRY_BACKOFF_SECONDS,
+    JOB_TTL_SECONDS,
+    JOB_PROCESSING_PREFIX,
+    JOB_WORKERS_KEY,
+    JOB_WORKER_HEARTBEAT_PREFIX,
+    JOB_WORKER_HEARTBEAT_TTL
+)
+from redis_pool import get_redis
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_RETRYING = "retrying"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+# 任务类型
+POST_UPDATE_JOB = "post_update"
+VECTOR_COMPACTION_JOB = "vector_compaction"
+
+JOB_REDIS_CLIENT = get_redis(decode_responses=True)
+STEP_FIELD_PREFIX = "step:"
+
+_handlers: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {}
+_current_job: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_job", default=None)
+
+def job_handler(job_type: str):
+    """注册任务处理函数, 处理函数接收 payload, 返回可 JSON 序列化的结果"""
+    def decorator(func):
+        _handlers[job_type] = func
+        return func
+    return decorator
+
+def _job_key(job_id: str) -> str:
+    return JOB_KEY_PREFIX + job_id
+
+def _processing_key(worker_id: str) -> str:
+    return JOB_PROCESSING_PREFIX + worker_id
+
+def _heartbeat_key(worker_id: str) -> str:
+    return JOB_WORKER_HEARTBEAT_PREFIX + worker_id
+
+def run_step(name: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    执行任务中的一个步骤, 结果(需可 JSON 序列化)记录在任务哈希中;
+    任务重试时已完成的步骤直接返回记录的结果, 不再执行。不在任务中调用时直接执行。
+    """
+    job_id = _current_job.get()
+    if job_id is None:
+        return func(*args, **kwargs)
+    field = STEP_FIELD_PREFIX + name
+    raw = JOB_REDIS_CLIENT.hget(_job_key(job_id), field)
+    if raw is not None:
+        logging.info(f"Job {job_id} step {name} already completed, skip")
+        return json.loads(raw)
+    result = func(*args, **kwargs)
+    JOB_REDIS_CLIENT.hset(_job_key(job_id), field, json.dumps(result, default=str, ensure_ascii=False))
+    return result
+
+def enqueue_job(job_type: str, payload: Dict[str, Any], idempotency_key: Optional[str] = None) -> str:
+    """
+    创建任务并放入队列, 返回 job_id。
+    相同 idempotency_key 的任务在未失败前只会创建一次, 重复提交返回已有的 job_id。
+    """
+    job_id = uuid.uuid4().hex
+
+    if idempotency_key:
+        idem_key = JOB_IDEMPOTENCY_PREFIX + idempotency_key
+        if not JOB_REDIS_CLIENT.set(idem_key, job_id, nx=True, ex=JOB_TTL_SECONDS):
+            existing_id = JOB_REDIS_CLIENT.get(idem_key)
+            existing = get_job(existing_id) if existing_id else None
+            if existing and existing["status"] != JOB_FAILED:
+                logging.info(f"Job {existing_id} already exists for key {idempotency_key}")
+                return existing_id
+            JOB_REDIS_CLIENT.set(idem_key, job_id, ex=JOB_TTL_SECONDS)
+
+    now = time.time()
+    pipe = JOB_REDIS_CLIENT.pipeline(transaction=True)
+    pipe.hset(_job_key(job_id), mapping={
+        "id": job_id,
+        "type": job_type,
+        "payload": json.dumps(payload, default=str, ensure_ascii=False),
+        "status": JOB_QUEUED,
+        "attempts": 0,
+        "created_at": now,
+        "updated_at": now
+    })
+    pipe.expire(_job_key(job_id), JOB_TTL_SECONDS)
+    pipe.lpush(JOB_QUEUE_KEY, job_id)
+    pipe.execute()
+    return job_id
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    raw = JOB_REDIS_CLIENT.hgetall(_job_key(job_id))
+    if not raw:
+        return None
+    return {
+        "job_id": raw["id"],
+        "type": raw["type"],
+        "status": raw["status"],
+        "attempts": int(raw.get("attempts", 0)),
+        "result": json.loads(raw["result"]) if raw.get("result") else None,
+        "error": raw.get("error") or None,
+        "created_at": float(raw["created_at"]),
+        "updated_at": float(raw["updated_at"])
+    }
+
+def _update_job(job_id: str, **fields):
+    fields["updated_at"] = time.time()
+    JOB_REDIS_CLIENT.hset(_job_key(job_id), mapping=fields)
+
+def _promote_delayed_jobs():
+    """将到期的重试任务移回主队列, ZREM 保证多个 worker 下只移动一次"""
+    now = time.time()
+    for job_id in JOB_REDIS_CLIENT.zrangebyscore(JOB_DELAYED_KEY, 0, now):
+        if JOB_REDIS_CLIENT.zrem(JOB_DELAYED_KEY, job_id):
+            JOB_REDIS_CLIENT.lpush(JOB_QUEUE_KEY, job_id)
+
+def process_job(job_id: str):
+    raw = JOB_REDIS_CLIENT.hgetall(_job_key(job_id))
+    if not raw:
+        logging.warning(f"Job {job_id} expired or missing, skip")
+        return
+    if raw["status"] == JOB_SUCCEEDED:
+        return
+
+    handler = _handlers.get(raw["type"])
+    if handler is None:
+        _update_job(job_id, status=JOB_FAILED, error=f"No handler for job type {raw['type']}")
+        return
+
+    attempts = int(raw.get("attempts", 0))
+    if raw["status"] == JOB_RUNNING and attempts >= JOB_MAX_ATTEMPTS:
+        # 从失联 worker 回收的任务, 不再重试
+        _update_job(job_id, status=JOB_FAILED, error="Worker lost while running the job")
+        return
+    attempts += 1
+    _update_job(job_id, status=JOB_RUNNING, attempts=attempts)
+
+    started = time.perf_counter()
+    token = _current_job.set(job_id)
+    try:
+        result = handler(json.loads(raw["payload"]))
+        _update_job(
+            job_id,
+            status=JOB_SUCCEEDED,
+            result=json.dumps(result, default=str, ensure_ascii=False),
+            error=""
+        )
+        logging.info(f"Job {job_id} ({raw['type']}) succeeded in {time.perf_counter() - started:.2f}s")
+    except Exception as e:
+        logging.error(f"Job {job_id} ({raw['type']}) attempt {attempts} failed: {e}", exc_info=True)
+        if attempts < JOB_MAX_ATTEMPTS:
+            delay = JOB_RETRY_BACKOFF_SECONDS * (2 ** (attempts - 1))
+            _update_job(job_id, status=JOB_RETRYING, error=str(e))
+            JOB_REDIS_CLIENT.zadd(JOB_DELAYED_KEY, {job_id: time.time() + delay})
+        else:
+            _update_job(job_id, status=JOB_FAILED, error=str(e))
+    finally:
+        _current_job.reset(token)
+
+def _requeue_processing(worker_id: str) -> int:
+    """把 worker 处理中列表里的任务逐条 LMOVE 回队列(原子, 多个 worker 同时回收时每个任务只放回一次)"""
+    requeued = 0
+    while True:
+        job_id = JOB_REDIS_CLIENT.lmove(_processing_key(worker_id), JOB_QUEUE_KEY, "RIGHT", "LEFT")
+        if job_id is None:
+            return requeued
+        requeued += 1
+        logging.warning(f"Job {job_id} requeued from worker {worker_id}")
+
+def requeue_orphaned_jobs() -> int:
+    """心跳已过期(崩溃或被杀)的 worker 的处理中任务放回队列, 返回放回的数量"""
+    requeued = 0
+    for worker_id in JOB_REDIS_CLIENT.smembers(JOB_WORKERS_KEY):
+        if JOB_REDIS_CLIENT.exists(_heartbeat_key(worker_id)):
+            continue
+        requeued += _requeue_processing(worker_id)
+        JOB_REDIS_CLIENT.srem(JOB_WORKERS_KEY, worker_id)
+    return requeued
+
+def _heartbeat(worker_id: str):
+    JOB_REDIS_CLIENT.set(_heartbeat_key(worker_id), time.time(), ex=JOB_WORKER_HEARTBEAT_TTL)
+
+def _heartbeat_loop(worker_id: str):
+    # 独立线程: 长任务执行期间心跳也不会过期
+    while True:
+        time.sleep(JOB_WORKER_HEARTBEAT_TTL / 3)
+        try:
+            _heartbeat(worker_id)
+        except redis.RedisError as e:
+            logging.warning(f"Job worker heartbeat failed: {e}")
+
+def run_worker(poll_timeout: int = 5):
+    """
+    阻塞式消费任务队列, 供 worker.py 使用。
+    BLMOVE 把任务移入本 worker 的处理中列表, 处理结束后才删除;
+    worker 崩溃时任务留在列表中, 心跳过期后由其他 worker 放回队列。
+    """
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    processing = _processing_key(worker_id)
+    _heartbeat(worker_id)
+    JOB_REDIS_CLIENT.sadd(JOB_WORKERS_KEY, worker_id)
+    threading.Thread(target=_heartbeat_loop, args=(worker_id,), name="job-heartbeat", daemon=True).start()
+    logging.info(f"Job worker {worker_id} started, handlers: {sorted(_handlers)}")
+    while True:
+        try:
+            # 上一轮因 Redis 错误没有处理完的任务
+            _requeue_processing(worker_id)
+            _promote_delayed_jobs()
+            requeue_orphaned_jobs()
+            job_id = JOB_REDIS_CLIENT.blmove(JOB_QUEUE_KEY, processing, poll_timeout, "RIGHT", "LEFT")
+            if job_id:
+                process_job(job_id)
+                JOB_REDIS_CLIENT.lrem(processing, 1, job_id)
+        except redis.RedisError as e:
+            logging.error(f"Job worker Redis error: {e}")
+            time.sleep(poll_timeout)
@@ -1,47 +1,68 @@
 import os
-import redis
+import json
+import time
+import asyncio
+import threading
+import hashlib
 import logging
 import uvicorn
+import numpy as np
 
 from fastapi import FastAPI, Depends, HTTPException, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlmodel import Session, select, desc
 from decimal import Decimal
-from datetime import datetime
+from typing import Optional
 from models import (
     AssetSnapshot, 
     AssetResults, 
     AdvancedSimulationRequest, 
     SimulationResponse,
-    ActionType
+    JobStatus,
+    BatchMetricsRequest,
+    BatchMetricsResponse,
+    MonteCarloConfig,
+    MonteCarloRiskReport,
+    BatchSimulationRequest,
+    BatchSimulationResponse,
+    CandidateScore,
+    RebalancePlanResponse,
+    AnalyzeStreamRequest,
+    ReportSearchRequest,
+    ReportSearchResponse
 )
-from vector_store import asset_vector_db
 from database import get_db, create_db_and_tables
-from risk_engine import update_and_cache_btc_risk
-from agent import analyze_snapshot_and_results, snapshot_to_dict
-from calculator import calculate_asset_metrics
-from allocation_engine import calculate_strategic_rebalancing
+from risk_engine import get_btc_risk_score, btc_risk_cache
+from agent import get_chain, analyze_snapshot_and_results_async, stream_agent_events, snapshot_to_dict, results_to_agent_dict
+from agent_cache import agent_cache
+from calculator import calculate_asset_metrics, calculate_asset_metrics_batch, get_valuation_plan
+from allocation_engine import calculate_strategic_rebalancing, optimize_rebalancing_transfers
 from config import (
     REPORT_DIR,
-    REDIS_HOST,
-    REDIS_DB,
-    REDIS_PORT,
-    BTC_RISK_KEY,
     TARGET_ALLOCATION,
     REBALANCE_THRESHOLD,
-    FX_REFERENCE
-)
-from onchain_analyzer import generate_btc_onchain_report
-from utils import (
-    get_asset_info,
-    get_usd_value
+    FX_REFERENCE,
+    STAGE_TIMEOUTS,
+    AGENT_BACKEND,
+    PREWARM_ON_STARTUP
 )
+from redis_pool import get_redis
+from pipeline import run_stage
+from rates import rates_cache
+from risk_model import risk_model_cache
+from risk_factors import risk_factor_cache
+from report_retrieval import build_where, search_reports
+from vector_retention import vector_stats
+from rate_history import rate_history_cache, rates_for_snapshots
+from monte_carlo import compare_portfolios
+from jobs import enqueue_job, get_job, POST_UPDATE_JOB, VECTOR_COMPACTION_JOB
+from simulation import apply_actions, evaluate_candidates, allocation_drift_before_after
 from demo import demo_asset_snapshot
 from middleware.app_mode import AppModeMiddleware
 
 app = FastAPI()
-redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB)
+redis_client = get_redis()
 
 origins = [
     "https://asset.yanlongzhu.space",
@@ -61,16 +82,6 @@ app.add_middleware(
 def get_cache_key(request: Request):
     return "asset_data_private" if request.state.app_mode == "private" else "asset_data_public"
 
-def get_btc_risk_score(redis_client) -> Decimal:
-    """从Redis获取风险分, 如果失败, 则计算并存入Redis"""
-    cached_risk = redis_client.get(BTC_RISK_KEY)
-    if cached_risk:
-        try:
-            return Decimal(cached_risk.decode('utf-8'))
-        except Exception:
-            logging.warning("Cached BTC risk factor is corrupted. Recalculating.")
-    return update_and_cache_btc_risk()
-
 def save_to_redis(data: AssetSnapshot, request: Request):
     try: 
         serializable_data = data.model_dump_json()
@@ -92,17 +103,42 @@ def load_from_redis(request: Request) -> AssetSnapshot:
         logging.error(f"Error loading from Redis: {str(e)}", exc_info=True)
         return None
 
-def get_exchange_rate(code: str):
+def current_rates():
+    """进程内汇率快照(热路径无网络 I/O), 不可用时返回 503"""
     try:
-        rate = redis_client.get(code)
-        return Decimal(rate.decode('utf-8')) if rate else Decimal('0')
+        return rates_cache.get().rates
     except Exception as e:
-        logging.error(f"Error getting exchange rate for {code}: {str(e)}")
-        return Decimal('0')
+        logging.error(f"Error loading exchange rates: {str(e)}")
+        raise HTTPException(status_code=503, detail="Exchange rates unavailable.")
 
 @app.on_event("startup")
 def on_startup():
     create_db_and_tables()
+    try:
+        rates_cache.refresh()
+    except Exception as e:
+        logging.error(f"Initial rates snapshot load failed: {str(e)}")
+    rates_cache.start_listener()
+    btc_risk_cache.start_refresher()
+    risk_factor_cache.start_refresher()
+    risk_model_cache.start_refresher()
+    if PREWARM_ON_STARTUP:
+        threading.Thread(target=prewarm, name="prewarm", daemon=True).start()
+
+def prewarm():
+    """启动后在后台加载 LLM 客户端与估值计划(风险模型由刷新线程加载), 不阻塞 worker 开始接收请求"""
+    started = time.perf_counter()
+    for name, func in (
+        ("valuation plan", get_valuation_plan),
+        ("agent chain", get_chain if AGENT_BACKEND != "offline" else None),
+    ):
+        if func is None:
+            continue
+        try:
+            func()
+        except Exception as e:
+            logging.warning(f"Prewarm of {name} failed: {e}")
+    logging.info(f"Prewarm finished in {(time.perf_counter() - started) * 1000:.0f} ms")
 
 @app.get("/", response_model=AssetSnapshot)
 def get_latest_asset_data(
@@ -118,8 +154,7 @@ def get_latest_asset_data(
     if cached_data:
         return cached_data
     
-    statement = select(AssetSnapshot).order_by(desc(AssetSnapshot.id)).limit(1)
-    db_snapshot = db.exec(statement).first()
+    db_snapshot = load_latest_snapshot(db)
 
     if not db_snapshot:
         raise HTTPException(status_code=404, detail="No asset data found in the database.")
@@ -133,36 +168,14 @@ async def update_assets(
     db: Session = Depends(get_db)
 ):
     try:
-        # save data to redis
-        save_to_redis(data, request)
-        rates = {
-            'XAU': get_exchange_rate('XAU'),
-            'CNY': get_exchange_rate('CNY'),
-            'GBP': get_exchange_rate('GBP'),
-            'EUR': get_exchange_rate('EUR'),
-            'HKD': get_exchange_rate('HKD'),
-            'BTC': get_exchange_rate('BTC'),
-            'SGD': get_exchange_rate('SGD'),
-            'USD': get_exchange_rate('USD')
-        }
-        btc_risk_score = get_btc_risk_score(redis_client)
-        results = calculate_asset_metrics(data, rates, btc_risk_score)
-
-        market_report_text = generate_btc_onchain_report()
-        logging.info(f"Market Report Generatedd: {market_report_text.strip()}")
+        # 1. 同一份进程内汇率快照用于本次请求的全部计算; 缓存写入与 BTC 风险分并发执行
+        rates = current_rates()
+        _, btc_risk_score = await asyncio.gather(
+            run_stage("cache", save_to_redis, data, request, default=False),
+            run_stage("btc_risk", get_btc_risk_score, default=Decimal('0')),
+        )
 
-        try:
-            vector_metadata = {
-                "report_date": data.snapshot_date.strftime("%Y-%m-%d"),
-                "source": "market_sentiment",
-                "type": "btc_fng"
-            }
-            if request.state.app_mode == "private":
-                asset_vector_db.add_report(report_text=market_report_text, metadata=vector_metadata)
-            else:
-                logging.info("Public mode: skip vector storage")
-        except Exception as e:
-            logging.error(f"Vector DB storage failed: {e}")
+        results = calculate_asset_metrics(data, rates, btc_risk_score)
 
         strategic_suggestions = calculate_strategic_rebalancing(
             results=results,
@@ -171,80 +184,159 @@ async def update_assets(
             current_rates=rates,
             fx_refs=FX_REFERENCE
         )
+        formatted_strategy_text = format_strategy_text(strategic_suggestions)
+        results.rebalance_actions = optimize_rebalancing_transfers(
+            data, rates, TARGET_ALLOCATION, REBALANCE_THRESHOLD, FX_REFERENCE
+        )
+        app_mode = request.state.app_mode
 
-        strategy_msg = []
-
-        if not strategic_suggestions:
-            strategy_msg.append("资产配置与汇率估值均在健康区间")
-        else:
-            for item in strategic_suggestions:
-                icon = "🚨" if "STRONG" in item.action else "💡"
-                strategy_msg.append(
-                    f"{icon} {item.asset_class}: {item.action} | 偏差:{item.drift:+.1f}% | 汇率:{item.fx_status} | {item.reason}"
-                )
-
-        formatted_strategy_text = "\n".join(strategy_msg)
-
-        snapshot_dict = snapshot_to_dict(data)
-        results_dict = {
-            "total_assets_usd": float(results.total_assets_usd),
-            "total_savings_usd": float(results.total_savings_usd),
-            "available_liquidity_ratio": float(results.available_liquidity_ratio),
-            "gold_ratio": float(results.gold_ratio),
-            "btc_ratio": float(results.btc_ratio),
-            "weighted_risk_score": float(results.weighted_risk_score),
-            "speculative_ratio": float(results.speculative_ratio),
-            "btc_dynamic_risk": float(btc_risk_score),
-            "currency_distribution": results.currency_distribution,
-            "strategic_advice": formatted_strategy_text,
-        }
-
-        context = {
-            "note": "automated analysis", 
-            "date": datetime.utcnow().isoformat(),
-            "market_sentiment_analysis": market_report_text,
-            "user_intent": "User is actively DCAing into BTC.",
-            "fx_market_status": "Analyst provided strategic rebalancing advice based on FX valuation."
-        }
-        agent_out = analyze_snapshot_and_results(snapshot_dict, results_dict, context=context)
-
-        report_content = generate_report(data, results)
-
-        try:
-            vector_metadata = {
-                "report_date": data.snapshot_date.strftime("%Y-%m-%d"),
-                "total_assets": float(results.total_assets_usd),
-                "risk_score": float(results.weighted_risk_score),
-                "btc_ratio": float(results.btc_ratio),
-                "source": "automated_update"
-            }
-            if request.state.app_mode == "private":
-                asset_vector_db.add_report(report_text=report_content, metadata=vector_metadata)
-            else:
-                logging.info("Public mode: skip vector storage")
-
-        except Exception as e:
-            logging.error(f"Vector DB storage failed: {e}")
-        
-        filepath = save_report(report_content)
-
-        filename_only = os.path.basename(filepath)
-        results.report_path = filename_only
-        results.message = f"{agent_out.summary}\n\n【量化策略建议】:\n{formatted_strategy_text}"
-
-        if request.state.app_mode == "public":
+        if app_mode == "public":
             logging.info("Public mode: skip DB persistence")
         else:
-            db.add(data)
-            db.commit()
-            db.refresh(data)
+            await asyncio.wait_for(
+                asyncio.to_thread(persist_snapshot, db, data),
+                timeout=STAGE_TIMEOUTS["db_commit"]
+            )
+
+        # 2. 链上报告 / LLM / 向量库 / 报告文件 交给后台 worker, 结果通过 /jobs/{job_id} 查询
+        snapshot_json = data.model_dump_json()
+        job_payload = {
+            "snapshot": snapshot_json,
+            "results": results.model_dump_json(),
+            "btc_risk_score": str(btc_risk_score),
+            "strategy_text": formatted_strategy_text,
+            "app_mode": app_mode
+        }
+        idempotency_key = hashlib.sha256(
+            f"{app_mode}:{data.model_dump_json(exclude={'id'})}".encode("utf-8")
+        ).hexdigest()
+        results.job_id = await run_stage("enqueue", enqueue_job, POST_UPDATE_JOB, job_payload, idempotency_key)
+        results.message = f"【量化策略建议】:\n{formatted_strategy_text}"
+        if results.job_id is None:
+            # 快照已经保存, 不返回 503(客户端重试会重复写入快照); 明确告知后台分析没有排队
+            logging.error("Post-update job was not enqueued: on-chain report, LLM analysis, "
+                          "vector storage and report file will not be produced for this update")
+            results.message += "\n\n⚠️ 任务队列不可用, 本次更新的后台分析(链上报告、AI 分析、报告文件)未能排队。"
 
         return results
-    
+
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Asset calculation or DB error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
+@app.post("/metrics/batch", response_model=BatchMetricsResponse)
+async def calculate_metrics_batch(payload: BatchMetricsRequest):
+    """批量估值: 一次请求对 N 个快照(可各自带汇率)做向量化计算"""
+    if not payload.snapshots:
+        return BatchMetricsResponse(results=[])
+
+    rates = payload.rates
+    if payload.historical_rates:
+        history = await asyncio.to_thread(rate_history_cache.get, rates_cache.get().version)
+        rates = rates_for_snapshots(history, payload.snapshots, get_valuation_plan().currencies)
+        if np.isnan(rates).any():
+            raise HTTPException(status_code=422, detail="Some snapshots predate the stored rate history.")
+    elif rates is None:
+        rates = current_rates()
+    elif len(rates) != len(payload.snapshots):
+        raise HTTPException(status_code=422, detail="rates must contain one entry per snapshot.")
+
+    btc_risk = payload.btc_risk_score
+    if btc_risk is None:
+        btc_risk = await run_stage("btc_risk", get_btc_risk_score, default=Decimal('0'))
+
+    valuation = calculate_asset_metrics_batch(payload.snapshots, rates, btc_risk)
+    return BatchMetricsResponse(results=valuation.to_results())
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+def get_job_status(job_id: str):
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return JobStatus(**job)
+
+def format_strategy_text(strategic_suggestions) -> str:
+    strategy_msg = []
+
+    if not strategic_suggestions:
+        strategy_msg.append("资产配置与汇率估值均在健康区间")
+    else:
+        for item in strategic_suggestions:
+            icon = "🚨" if "STRONG" in item.action else "💡"
+            strategy_msg.append(
+                f"{icon} {item.asset_class}: {item.action} | 偏差:{item.drift:+.1f}% | 汇率:{item.fx_status} | {item.reason}"
+            )
+
+    return "\n".join(strategy_msg)
+
+def persist_snapshot(db: Session, data: AssetSnapshot):
+    db.add(data)
+    db.commit()
+    db.refresh(data)
+
+@app.get("/risk/btc")
+def get_btc_risk_status():
+    """BTC 风险分缓存状态: 当前值、年龄、最近一次刷新耗时"""
+    try:
+        return btc_risk_cache.status()
+    except Exception as e:
+        logging.error(f"Error reading BTC risk status: {str(e)}")
+        raise HTTPException(status_code=503, detail="BTC risk cache unavailable.")
+
+@app.get("/agent/cache/stats")
+def get_agent_cache_stats():
+    """Agent 语义缓存的命中 / 未命中统计"""
+    try:
+        return agent_cache.stats()
+    except Exception as e:
+        logging.error(f"Error reading agent cache stats: {str(e)}")
+        raise HTTPException(status_code=503, detail="Agent cache unavailable.")
+
+@app.post("/reports/search", response_model=ReportSearchResponse)
+async def search_past_reports(body: ReportSearchRequest, request: Request):
+    """
+    历史报告语义检索: 日期 / 来源 / 数值范围先在向量库中过滤, 再在剩余文档中取 top-k。
+    """
+    if request.state.app_mode == "public":
+        raise HTTPException(403, "Not available in public mode")
+    try:
+        where = build_where(
+            date_from=body.date_from,
+            date_to=body.date_to,
+            source=body.source,
+            ranges={name: (r.min, r.max) for name, r in body.ranges.items()}
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    found = await run_stage("report_search", search_reports, body.query, body.k, where)
+    if found is None:
+        raise HTTPException(status_code=503, detail="Report search unavailable.")
+    results, cached = found
+    return ReportSearchResponse(results=results, cached=cached)
+
+@app.get("/vector/stats")
+async def get_vector_stats(request: Request):
+    """向量库文档数、磁盘占用、保留策略与最近一次压缩结果"""
+    if request.state.app_mode == "public":
+        raise HTTPException(403, "Not available in public mode")
+    stats = await run_stage("vector_store", vector_stats)
+    if stats is None:
+        raise HTTPException(status_code=503, detail="Vector store unavailable.")
+    return stats
+
+@app.post("/vector/compact")
+async def trigger_vector_compaction(request: Request, dry_run: bool = False):
+    """手动触发保留策略清理与压缩(后台任务), 通过 /jobs/{job_id} 查看结果"""
+    if request.state.app_mode == "public":
+        raise HTTPException(403, "Not available in public mode")
+    job_id = await run_stage("enqueue", enqueue_job, VECTOR_COMPACTION_JOB, {"dry_run": dry_run})
+    if job_id is None:
+        raise HTTPException(status_code=503, detail="Job queue unavailable.")
+    return {"job_id": job_id}
+
 @app.get("/clear")
 async def clear_data(
     request: Request,
@@ -282,81 +374,23 @@ async def simulate_investment(
     request: Request,
     db: Session = Depends(get_db)
 ):
-    # 1. 获取基准数据
-    current_snapshot = load_from_redis(request)
+    # 1. 获取基准数据, 同时并发获取实时环境数据(进程内汇率快照 / BTC 风险分)
+    rates = current_rates()
+    current_snapshot, btc_risk = await asyncio.gather(
+        run_stage("cache", load_from_redis, request),
+        run_stage("btc_risk", get_btc_risk_score, default=Decimal('0')),
+    )
     if not current_snapshot:
-        statement = select(AssetSnapshot).order_by(desc(AssetSnapshot.id)).limit(1)
-        current_snapshot = db.exec(statement).first()
+        current_snapshot = await asyncio.to_thread(load_latest_snapshot, db)
         if not current_snapshot:
             raise HTTPException(status_code=404, detail="No baseline data found.")
-        
-    # 2. 获取实时环境数据
-    rates = {
-        'XAU': get_exchange_rate('XAU'),
-        'CNY': get_exchange_rate('CNY'),
-        'GBP': get_exchange_rate('GBP'),
-        'EUR': get_exchange_rate('EUR'),
-        'HKD': get_exchange_rate('HKD'),
-        'BTC': get_exchange_rate('BTC'),
-        'SGD': get_exchange_rate('SGD'),
-        'USD': get_exchange_rate('USD')
-    }
-    btc_risk = get_btc_risk_score(redis_client)
-    original_results = calculate_asset_metrics(current_snapshot, rates, btc_risk)
-
-    # 3. 拷贝
-    simulated_snapshot = current_snapshot.model_copy(deep=True)
 
-    simulation_logs = [] # 用于记录转换过程
-
-    for action in payload.actions:
-        if action.type == ActionType.ADJUST:
-            if hasattr(simulated_snapshot, action.from_field):
-                old_val = getattr(simulated_snapshot, action.from_field) or Decimal('0')
-                new_val = Decimal(old_val) + action.amount
-                if new_val < 0: new_val = Decimal('0')
-                setattr(simulated_snapshot, action.from_field, new_val)
-
-                name = get_asset_info(action.from_field)['name']
-                # :+ 是什么含义呢
-                simulation_logs.append(f"Adjusted {name} by {action.amount:+}")
-            else:
-                logging.warning(f"Field: {action.from_field} not found")
-        elif action.type == ActionType.TRANSFER:
-            if not action.to_field:
-                continue
-
-            field_src = action.from_field
-            field_dst = action.to_field
-
-            info_src = get_asset_info(field_src)
-            info_dst = get_asset_info(field_dst)
-
-            src_balance = getattr(simulated_snapshot, field_src) or Decimal('0')
-            transfer_amount = Decimal(abs(action.amount))
-            src_balance = Decimal(src_balance)
-            logging.info(f"field_src: {field_src}, field_dst: {field_dst}, info_src: {info_src}, info_dst: {info_dst}, src_balance:{src_balance}, transfer_amount {transfer_amount}")
-
-            setattr(simulated_snapshot, field_src, src_balance - transfer_amount)
-
-            rate_src = rates.get(info_src['currency'], Decimal('0'))
-            rate_dst = rates.get(info_dst['currency'], Decimal('0'))
-
-            scale_src = Decimal(str(info_src['unit_scale']))
-            scale_dst = Decimal(str(info_dst['unit_scale']))
-
-            if rate_dst > 0:
-                value_in_usd = get_usd_value(transfer_amount, scale_src, rate_src)
+    # 2. 计算基准指标
+    original_results = calculate_asset_metrics(current_snapshot, rates, btc_risk)
 
-                amount_dst = value_in_usd * rate_dst / scale_dst
-                dst_balance = getattr(simulated_snapshot, field_dst) or Decimal('0')
-                setattr(simulated_snapshot, field_dst, Decimal(dst_balance) + Decimal(amount_dst))
+    # 3. 在拷贝上应用模拟操作
+    simulated_snapshot, simulation_logs = apply_actions(current_snapshot, payload.actions, rates)
 
-                log_msg = (
-                    f"划转: {info_src['name']} ({transfer_amount}) -> {info_dst['name']} ({amount_dst:.4f})"
-                )
-                simulation_logs.append(log_msg)
-            
     # 4. 重新计算模拟后的指标
     simulated_results = calculate_asset_metrics(simulated_snapshot, rates, btc_risk)
 
@@ -376,7 +410,18 @@ async def simulate_investment(
         "actions_log": "; ".join(simulation_logs)
     }
 
-    agent_feedback = analyze_snapshot_and_results(sim_snapshot_dict, sim_results_dict, context=sim_context)
+    # 有截止时间与熔断, 超时或熔断时由规则分析器给出结论
+    agent_stage = analyze_snapshot_and_results_async(sim_snapshot_dict, sim_results_dict, sim_context)
+
+    # 6. 可选: 蒙特卡洛风险模拟(与 Agent 调用并发)
+    monte_carlo_reports = None
+    if payload.monte_carlo:
+        agent_feedback, monte_carlo_reports = await asyncio.gather(
+            agent_stage,
+            run_monte_carlo_stage([current_snapshot, simulated_snapshot], rates, payload.monte_carlo)
+        )
+    else:
+        agent_feedback = await agent_stage
 
     diff_summary = {
         "total_assets": f"{original_results.total_assets_usd:.2f} -> {simulated_results.total_assets_usd:.2f}",
@@ -391,52 +436,191 @@ async def simulate_investment(
     return SimulationResponse(
         original=original_results,
         simulated=simulated_results,
-        diff_summary=diff_summary
+        diff_summary=diff_summary,
+        monte_carlo=monte_carlo_reports
     )
 
-def generate_report(data: AssetSnapshot, results: AssetResults) -> str:
-    """生成报告内容"""
-    timestamp = datetime.now().strftime("%Y-%m-%d")
-    report = f"""Asset Report - Generated at {timestamp}
-
-Original Asset Data:
--------------------
-黄金 {data.gold_g} g {data.gold_oz} oz
-养老金(CNY) {data.retirement_funds_cny}
-基金(CNY) {data.funds_cny}
-住房公积金(CNY) {data.housing_fund_cny}
-储蓄(CNY) {data.savings_cny}
-比特币(个) {data.btc}
-比特币股票(USD) {data.btc_stock_usd}
-基金(HDK) {data.funds_hkd}
-储蓄(HKD) {data.savings_hkd}
-基金(SGD) {data.funds_sgd}
-储蓄(SGD) {data.savings_sgd}
-基金(EUR) {data.funds_eur}
-储蓄(EUR) {data.savings_eur}
-存款(GBP) {data.deposit_gbp}
-股票(USD) {data.stock_usd}
-储蓄(USD) {data.savings_usd}
-
-美元计价:
-------------------
-总资产: {results.total_assets_usd:.2f} USD
-总储蓄: {results.total_savings_usd:.2f} USD
-黄金资产占比: {results.gold_ratio:.2f}%
-比特币资产占比: {results.btc_ratio:.2f}%
-"""
-    return report
-
-def save_report(report_content: str):
-    """保存报告到文件"""
-    filename = f"asset_report_{datetime.now().strftime('%Y%m%d')}.txt"
-    filepath = os.path.join(REPORT_DIR, filename)
+async def run_monte_carlo_stage(snapshots, rates, mc_config: MonteCarloConfig) -> dict:
+    history = await asyncio.to_thread(rate_history_cache.get, rates_cache.get().version)
+    try:
+        reports = await asyncio.wait_for(
+            asyncio.to_thread(
+                compare_portfolios,
+                snapshots, rates, history, TARGET_ALLOCATION, REBALANCE_THRESHOLD,
+                mc_config.paths, mc_config.horizon_days, mc_config.lookback_days,
+                mc_config.confidence_levels, mc_config.seed, mc_config.workers
+            ),
+            timeout=STAGE_TIMEOUTS["monte_carlo"]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Monte Carlo simulation timed out.")
+    return {
+        name: MonteCarloRiskReport(**report)
+        for name, report in zip(("original", "simulated"), reports)
+    }
+
+@app.get("/rebalance/plan", response_model=RebalancePlanResponse)
+async def get_rebalance_plan(
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """为当前快照计算最少的 TRANSFER 操作, 使各配置偏差回到 REBALANCE_THRESHOLD 以内"""
+    rates = current_rates()
+    snapshot = await run_stage("cache", load_from_redis, request)
+    if not snapshot:
+        snapshot = await asyncio.to_thread(load_latest_snapshot, db)
+        if not snapshot:
+            raise HTTPException(status_code=404, detail="No baseline data found.")
+
+    actions = optimize_rebalancing_transfers(
+        snapshot, rates, TARGET_ALLOCATION, REBALANCE_THRESHOLD, FX_REFERENCE
+    )
+    drift_before, drift_after = allocation_drift_before_after(snapshot, actions, rates, TARGET_ALLOCATION)
+    return RebalancePlanResponse(
+        actions=actions,
+        drift_before=drift_before,
+        drift_after=drift_after,
+        threshold=float(REBALANCE_THRESHOLD)
+    )
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str, ensure_ascii=False)}\n\n"
+
+@app.post("/analyze/stream")
+async def analyze_stream(
+    request: Request,
+    payload: Optional[AnalyzeStreamRequest] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Server-Sent Events: 先立即推送确定性的指标与再平衡划转(metrics),
+    再推送 Agent 的 summary 增量、已完成的字段, 最后是完整的 AgentOutput(agent) 与 done。
+    """
+    rates = current_rates()
+    snapshot = payload.snapshot if payload and payload.snapshot else None
+    if snapshot is None:
+        snapshot = await run_stage("cache", load_from_redis, request)
+    if snapshot is None:
+        snapshot = await asyncio.to_thread(load_latest_snapshot, db)
+        if not snapshot:
+            raise HTTPException(status_code=404, detail="No baseline data found.")
+
+    btc_risk = await run_stage("btc_risk", get_btc_risk_score, default=Decimal('0'))
+    results = calculate_asset_metrics(snapshot, rates, btc_risk)
+    strategy_text = format_strategy_text(calculate_strategic_rebalancing(
+        results=results,
+        target_map=TARGET_ALLOCATION,
+        threshold=REBALANCE_THRESHOLD,
+        current_rates=rates,
+        fx_refs=FX_REFERENCE
+    ))
+    results.rebalance_actions = optimize_rebalancing_transfers(
+        snapshot, rates, TARGET_ALLOCATION, REBALANCE_THRESHOLD, FX_REFERENCE
+    )
+    results.message = f"【量化策略建议】:\n{strategy_text}"
+    context = {
+        "note": (payload.notes if payload and payload.notes else "interactive analysis"),
+        "rebalance_actions": [action.model_dump(mode="json") for action in results.rebalance_actions]
+    }
 
-    os.makedirs(REPORT_DIR, exist_ok=True)
+    async def events():
+        yield _sse("metrics", json.loads(results.model_dump_json()))
+        async for event, data in stream_agent_events(
+            snapshot_to_dict(snapshot), results_to_agent_dict(results, btc_risk, strategy_text), context
+        ):
+            yield _sse(event, data)
+        yield _sse("done", {})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-    with open(filepath, 'w', encoding='utf-8') as f:
-        f.write(report_content)
-    return filepath
+@app.post("/simulate/batch", response_model=BatchSimulationResponse)
+async def simulate_batch(
+    payload: BatchSimulationRequest,
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """对多组候选操作做一次向量化评估并排序, 只为最优方案调用一次 Agent"""
+    if not payload.candidates:
+        raise HTTPException(status_code=422, detail="At least one candidate is required.")
+
+    rates = current_rates()
+    base_snapshot, btc_risk = await asyncio.gather(
+        run_stage("cache", load_from_redis, request),
+        run_stage("btc_risk", get_btc_risk_score, default=Decimal('0')),
+    )
+    if not base_snapshot:
+        base_snapshot = await asyncio.to_thread(load_latest_snapshot, db)
+        if not base_snapshot:
+            raise HTTPException(status_code=404, detail="No baseline data found.")
+
+    valuation, max_drift, scores = evaluate_candidates(
+        base_snapshot,
+        [c.actions for c in payload.candidates],
+        rates,
+        btc_risk,
+        payload.objective,
+        TARGET_ALLOCATION
+    )
+
+    def candidate_score(row: int) -> CandidateScore:
+        return CandidateScore(
+            index=row - 1,
+            label="baseline" if row == 0 else payload.candidates[row - 1].label,
+            score=float(scores[row]),
+            total_assets_usd=float(valuation.total_assets_usd[row]),
+            weighted_risk_score=float(valuation.weighted_risk_score[row]),
+            available_liquidity_ratio=float(valuation.available_liquidity_ratio[row]),
+            btc_ratio=float(valuation.btc_ratio[row]),
+            speculative_ratio=float(valuation.speculative_ratio[row]),
+            portfolio_volatility=(
+                float(valuation.portfolio_volatility[row]) if valuation.portfolio_volatility is not None else None
+            ),
+            max_drift=float(max_drift[row])
+        )
+
+    order = np.argsort(scores[1:], kind="stable")[:payload.top_k] + 1
+    ranked = [candidate_score(int(row)) for row in order]
+    best = payload.candidates[ranked[0].index]
+
+    response = BatchSimulationResponse(
+        objective=payload.objective,
+        baseline=candidate_score(0),
+        ranked=ranked,
+        best_actions=best.actions
+    )
+
+    if payload.explain_best:
+        best_snapshot, best_logs = apply_actions(base_snapshot, best.actions, rates)
+        best_results = calculate_asset_metrics(best_snapshot, rates, btc_risk)
+        agent_feedback = await analyze_snapshot_and_results_async(
+            snapshot_to_dict(best_snapshot),
+            {
+                "total_assets_usd": float(best_results.total_assets_usd),
+                "weighted_risk_score": float(best_results.weighted_risk_score),
+                "btc_ratio": float(best_results.btc_ratio),
+                "available_liquidity_ratio": float(best_results.available_liquidity_ratio)
+            },
+            {
+                "note": f"SIMULATION ONLY: {payload.notes}",
+                "objective": payload.objective.value,
+                "candidates_evaluated": len(payload.candidates),
+                "actions_log": "; ".join(best_logs)
+            }
+        )
+        response.agent_verdict = agent_feedback.verdict
+        response.agent_advice = agent_feedback.summary
+
+    return response
+
+def load_latest_snapshot(db: Session) -> AssetSnapshot | None:
+    statement = select(AssetSnapshot).order_by(desc(AssetSnapshot.id)).limit(1)
+    return db.exec(statement).first()
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
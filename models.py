@@ -1,9 +1,15 @@
 from sqlmodel import SQLModel, Field
 from decimal import Decimal
-from datetime import datetime
-from typing import Optional, Dict, List
+from datetime import date, datetime
+from typing import Optional, Dict, List, Any
 from pydantic import BaseModel
 from enum import Enum
+from config import (
+    MC_DEFAULT_PATHS,
+    MC_MAX_PATHS,
+    MC_DEFAULT_HORIZON_DAYS,
+    MC_LOOKBACK_DAYS
+)
 
 class AssetDataModelConfig(SQLModel):
     pass
@@ -48,9 +54,13 @@ class AssetResults(SQLModel):
     speculative_ratio: Decimal
 
     currency_distribution: Dict[str, Decimal] = {}
+    portfolio_volatility: Optional[Decimal] = None      # 年化组合波动率(%), 协方差风险模型不可用时为空
+    risk_contributions: Dict[str, Decimal] = {}         # 各货币桶对组合方差的贡献(%), 合计 100
 
     report_path: Optional[str] = None
     message: Optional[str] = None
+    job_id: Optional[str] = None            # 后台任务 id, 通过 /jobs/{job_id} 获取 Agent 分析与报告
+    rebalance_actions: List["SimulationAction"] = []   # 可直接提交给 /simulate 的再平衡划转
 
     projected_monthly_income_usd: Decimal = Field(default=0, max_digits=20, decimal_places=2)
 
@@ -61,14 +71,44 @@ class AgentOutput(BaseModel):
     explanations: Dict[str, str]
     confidence: float
 
+class BatchMetricsRequest(SQLModel):
+    snapshots: List[AssetSnapshot]
+    rates: Optional[List[Dict[str, Decimal]]] = None   # 每个快照一组汇率, 缺省使用当前汇率
+    btc_risk_score: Optional[Decimal] = None           # 缺省使用当前缓存的 BTC 风险分
+    historical_rates: bool = False                     # True: 按各快照 snapshot_date 当时的汇率重估
+
+class BatchMetricsResponse(SQLModel):
+    results: List[AssetResults]
+
+class JobStatus(BaseModel):
+    job_id: str
+    type: str
+    status: str                              # queued / running / retrying / succeeded / failed
+    attempts: int
+    result: Optional[Dict[str, Any]] = None  # 成功时: message / report_path / agent
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+
 class SimulationRequest(BaseModel):
     target_field: str
     delta_amount: Decimal
 
+class MonteCarloRiskReport(BaseModel):
+    paths: int
+    horizon_days: int
+    initial_value_usd: float
+    expected_value_usd: float
+    var_usd: Dict[str, float]               # 置信水平 -> 损失(USD)
+    cvar_usd: Dict[str, float]
+    drawdown_percentiles: Dict[str, float]  # 路径最大回撤分位数(%)
+    rebalance_breach_probability: float     # 期末任一配置偏离超过 REBALANCE_THRESHOLD 的概率
+
 class SimulationResponse(BaseModel):
     original: AssetResults
     simulated: AssetResults
     diff_summary: Dict[str, str]
+    monte_carlo: Optional[Dict[str, MonteCarloRiskReport]] = None   # original / simulated
 
 class SmartSuggestion:
     def __init__(
@@ -101,6 +141,86 @@ class SimulationAction(SQLModel):
     to_field: Optional[str] = None           # 资金去向
     amount: Decimal                          # 变动数量
 
+class MonteCarloConfig(SQLModel):
+    paths: int = Field(default=MC_DEFAULT_PATHS, gt=0, le=MC_MAX_PATHS)
+    horizon_days: int = Field(default=MC_DEFAULT_HORIZON_DAYS, gt=0, le=365)
+    lookback_days: int = Field(default=MC_LOOKBACK_DAYS, gt=0)
+    confidence_levels: List[float] = [0.95, 0.99]
+    seed: Optional[int] = None
+    workers: Optional[int] = None            # 大规模模拟时使用的进程数
+
 class AdvancedSimulationRequest(SQLModel):
     actions: List[SimulationAction]
-    notes: Optional[str] = "Asset rebalancing silulation"
\ No newline at end of file
+    notes: Optional[str] = "Asset rebalancing silulation"
+    monte_carlo: Optional[MonteCarloConfig] = None   # 提供时额外运行蒙特卡洛风险模拟
+
+class SimulationObjective(str, Enum):
+    RISK = "risk"             # 加权风险分越低越好
+    LIQUIDITY = "liquidity"   # 可用流动性比例越高越好
+    DRIFT = "drift"           # 与目标配置的最大偏差越小越好
+
+class CandidatePlan(SQLModel):
+    label: Optional[str] = None
+    actions: List[SimulationAction]
+
+class BatchSimulationRequest(SQLModel):
+    candidates: List[CandidatePlan]
+    objective: SimulationObjective = SimulationObjective.DRIFT
+    top_k: int = Field(default=10, gt=0)
+    explain_best: bool = True                # 是否为最优方案调用一次 Agent
+    notes: Optional[str] = "Batch rebalancing simulation"
+
+class CandidateScore(BaseModel):
+    index: int                               # 在 candidates 中的下标, 基准为 -1
+    label: Optional[str] = None
+    score: float
+    total_assets_usd: float
+    weighted_risk_score: float
+    available_liquidity_ratio: float
+    btc_ratio: float
+    speculative_ratio: float
+    portfolio_volatility: Optional[float] = None
+    max_drift: float                         # 各配置类别 |当前-目标| 的最大值(%)
+
+class BatchSimulationResponse(BaseModel):
+    objective: SimulationObjective
+    baseline: CandidateScore
+    ranked: List[CandidateScore]
+    best_actions: List[SimulationAction] = []
+    agent_verdict: Optional[str] = None
+    agent_advice: Optional[str] = None
+
+class AnalyzeStreamRequest(SQLModel):
+    snapshot: Optional[AssetSnapshot] = None   # 为空时分析当前快照
+    notes: Optional[str] = None
+
+class RebalancePlanResponse(BaseModel):
+    actions: List[SimulationAction]          # 可直接作为 /simulate 的 actions
+    drift_before: Dict[str, float]           # 各配置类别偏差(%)
+    drift_after: Dict[str, float]
+    threshold: float
+
+
+class NumericRange(BaseModel):
+    min: Optional[float] = None
+    max: Optional[float] = None
+
+class ReportSearchRequest(BaseModel):
+    query: str
+    k: int = Field(default=5, ge=1, le=50)
+    date_from: Optional[date] = None         # 含当天
+    date_to: Optional[date] = None           # 含当天
+    source: Optional[str] = None             # automated_update / market_sentiment
+    ranges: Dict[str, NumericRange] = {}     # risk_score / btc_ratio / total_assets 的数值范围
+
+class ReportHit(BaseModel):
+    id: str
+    score: float                             # 余弦相似度
+    report_date: Optional[str] = None
+    source: Optional[str] = None
+    metadata: Dict[str, Any] = {}
+    content: str
+
+class ReportSearchResponse(BaseModel):
+    results: List[ReportHit]
+    cached: bool = False
@@ -0,0 +1,187 @@
+import logging
+import multiprocessing
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence, Tuple
+from rate_history import RateHistory
+from allocation_engine import allocation_map
+from calculator import get_valuation_plan, holdings_matrix, rates_matrix, valuate_holdings
+from config import (
+    MC_LOOKBACK_DAYS,
+    MC_MIN_HISTORY_DAYS,
+    MC_PARALLEL_MIN_PATHS,
+    MC_MAX_WORKERS
+)
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+def estimate_return_model(
+    history: RateHistory,
+    currencies: Sequence[str],
+    lookback_days: int = MC_LOOKBACK_DAYS
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    由缓存的汇率历史估计各货币桶(以美元计价)日对数收益的均值与协方差。
+    汇率为 "每美元可兑换的单位数", 美元价值 = 1 / rate。
+    """
+    log_returns = history.usd_log_returns(lookback_days, currencies)
+    if len(log_returns) < MC_MIN_HISTORY_DAYS:
+        raise ValueError(
+            f"Insufficient price history: {len(log_returns)} daily returns, need {MC_MIN_HISTORY_DAYS}"
+        )
+
+    return log_returns.mean(axis=0), np.atleast_2d(np.cov(log_returns, rowvar=False))
+
+def _factor_loadings(cov: np.ndarray) -> np.ndarray:
+    """
+    协方差的平方根因子 C×r, 只保留正特征值方向(美元等零方差桶不消耗随机数),
+    每步只需生成 n×r 个正态随机数。
+    """
+    eigvals, eigvecs = np.linalg.eigh(cov)
+    keep = eigvals > eigvals.max(initial=0.0) * 1e-12
+    return eigvecs[:, keep] * np.sqrt(eigvals[keep])
+
+def _simulate_chunk(
+    exposures: np.ndarray,
+    mu: np.ndarray,
+    factor: np.ndarray,
+    mapping: np.ndarray,
+    targets: np.ndarray,
+    threshold: float,
+    n_paths: int,
+    horizon_days: int,
+    seed
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    对 P 个组合(exposures 为 P×C 的美元敞口)使用同一组随机路径重估。
+    返回 (终值 n×P, 最大回撤 n×P, 是否突破再平衡阈值 n×P)。
+    """
+    rng = np.random.default_rng(seed)
+    dtype = np.float32
+    loadings = factor.T.astype(dtype)
+    drift = mu.astype(dtype)
+    exposures_t = exposures.T.astype(dtype)
+    initial = exposures.sum(axis=1).astype(dtype)
+
+    cumulative = np.zeros((n_paths, exposures.shape[1]), dtype=dtype)
+    peak = np.broadcast_to(initial, (n_paths, len(initial))).copy()
+    max_drawdown = np.zeros_like(peak)
+
+    for _ in range(horizon_days):
+        shocks = rng.standard_normal((n_paths, loadings.shape[0]), dtype=dtype)
+        cumulative += drift
+        cumulative += shocks @ loadings
+        values = np.exp(cumulative) @ exposures_t
+        np.maximum(peak, values, out=peak)
+        drawdown = values
+        np.divide(values, peak, out=drawdown, where=peak > 0)
+        np.subtract(1.0, drawdown, out=drawdown)
+        np.maximum(max_drawdown, drawdown, out=max_drawdown)
+    max_drawdown[:, initial <= 0] = 0.0
+
+    growth = np.exp(cumulative, dtype=np.float64)
+    terminal = growth @ exposures.T
+    # 终点时各配置类别占比(%) 与目标的偏离
+    class_values = np.einsum('nc,pc,ck->npk', growth, exposures, mapping)
+    pct = class_values / np.where(terminal > 0, terminal, 1.0)[..., None] * 100
+    breach = (np.abs(pct - targets) > threshold).any(axis=2)
+    return terminal, max_drawdown.astype(np.float64), breach
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: 调用方(uvicorn 等)有后台线程和 Redis 连接时, fork 出的子进程可能继承被持有的锁而死锁
+        _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+def run_monte_carlo(
+    exposures: np.ndarray,
+    mu: np.ndarray,
+    cov: np.ndarray,
+    target_map: Dict[str, Decimal],
+    currencies: Sequence[str],
+    threshold: Decimal,
+    n_paths: int,
+    horizon_days: int,
+    confidence_levels: Sequence[float] = (0.95, 0.99),
+    seed: Optional[int] = None,
+    workers: Optional[int] = None
+) -> List[dict]:
+    """
+    向量化蒙特卡洛: 所有组合共享同一组相关收益路径(共同随机数), 便于对比模拟前后。
+    路径数超过 MC_PARALLEL_MIN_PATHS 时按块分发到进程池。
+    返回每个组合的 VaR / CVaR / 回撤分位数 / 再平衡阈值突破概率, 置信水平键为 "99.5%" 形式。
+    """
+    invalid = [level for level in confidence_levels if not 0 < level < 1]
+    if invalid:
+        raise ValueError(f"Confidence levels must be strictly between 0 and 1: {invalid}")
+
+    exposures = np.atleast_2d(np.asarray(exposures, dtype=np.float64))
+    factor = _factor_loadings(cov)
+    mapping, targets = allocation_map(currencies, target_map)
+    args = (exposures, mu, factor, mapping, targets, float(threshold))
+
+    workers = min(workers or MC_MAX_WORKERS, MC_MAX_WORKERS)
+    if n_paths >= MC_PARALLEL_MIN_PATHS and workers > 1:
+        chunks = np.array_split(np.arange(n_paths), workers)
+        seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+        futures = [
+            _get_executor(MC_MAX_WORKERS).submit(_simulate_chunk, *args, len(chunk), horizon_days, s)
+            for chunk, s in zip(chunks, seeds)
+        ]
+        parts = [f.result() for f in futures]
+        terminal, max_drawdown, breach = (np.concatenate(p) for p in zip(*parts))
+        logging.info(f"Monte Carlo: {n_paths} paths across {len(chunks)} processes")
+    else:
+        terminal, max_drawdown, breach = _simulate_chunk(*args, n_paths, horizon_days, seed)
+
+    reports = []
+    for p, initial in enumerate(exposures.sum(axis=1)):
+        losses = initial - terminal[:, p]
+        var, cvar = {}, {}
+        for level in confidence_levels:
+            key = f"{level:.1%}"
+            var[key] = float(np.quantile(losses, level))
+            tail = losses[losses >= var[key]]
+            cvar[key] = float(tail.mean()) if len(tail) else var[key]
+        reports.append({
+            "paths": int(n_paths),
+            "horizon_days": int(horizon_days),
+            "initial_value_usd": float(initial),
+            "expected_value_usd": float(terminal[:, p].mean()),
+            "var_usd": var,
+            "cvar_usd": cvar,
+            "drawdown_percentiles": {
+                f"p{q}": float(np.percentile(max_drawdown[:, p], q) * 100) for q in (50, 95, 99)
+            },
+            "rebalance_breach_probability": float(breach[:, p].mean())
+        })
+    return reports
+
+def compare_portfolios(
+    snapshots: Sequence,
+    rates,
+    history: RateHistory,
+    target_map: Dict[str, Decimal],
+    threshold: Decimal,
+    n_paths: int,
+    horizon_days: int,
+    lookback_days: int = MC_LOOKBACK_DAYS,
+    confidence_levels: Sequence[float] = (0.95, 0.99),
+    seed: Optional[int] = None,
+    workers: Optional[int] = None
+) -> List[dict]:
+    """按当前汇率把快照折算为各货币桶的美元敞口, 再在同一组路径上做蒙特卡洛"""
+    plan = get_valuation_plan()
+    mu, cov = estimate_return_model(history, plan.currencies, lookback_days)
+    valuation = valuate_holdings(
+        holdings_matrix(snapshots, plan),
+        rates_matrix(rates, len(snapshots), plan),
+        plan=plan
+    )
+    return run_monte_carlo(
+        valuation.currency_exposure, mu, cov, target_map, plan.currencies, threshold,
+        n_paths, horizon_days, confidence_levels, seed, workers
+    )
@@ -9,6 +9,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+ONCHAIN_REPORT_FALLBACK = "无法获取链上数据, 请检查数据源"
+
 def fetch_real_onchain_data() -> Dict[str, Any]:
     """
     当前能免费获取到的实时市场数据
@@ -44,7 +46,7 @@ def interpret_onchain_data(data: Dict[str, Any]) -> str:
     analysis_text = []
 
     if not data:
-        return "无法获取链上数据, 请检查数据源"
+        return ONCHAIN_REPORT_FALLBACK
     
     current_date = datetime.now().strftime("%Y-%m-%d")
 
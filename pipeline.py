@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import threading
+import time
+
+from typing import Any, Callable
+from config import STAGE_TIMEOUTS
+
+DEFAULT_STAGE_TIMEOUT = 10.0
+
+async def run_stage(name: str, func: Callable, *args, default: Any = None, timeout: float | None = None) -> Any:
+    """
+    在线程池中执行一个阻塞阶段(Redis / HTTP / LLM / 文件 / DB), 不阻塞事件循环。
+    超时或异常时记录日志并返回 default, 由调用方决定降级策略。
+    注意: 超时只会停止等待, 线程中的阻塞调用会在后台自行结束。
+    """
+    if timeout is None:
+        timeout = STAGE_TIMEOUTS.get(name, DEFAULT_STAGE_TIMEOUT)
+
+    started = time.perf_counter()
+    try:
+        return await asyncio.wait_for(asyncio.to_thread(func, *args), timeout=timeout)
+    except asyncio.TimeoutError:
+        logging.warning(f"Stage '{name}' timed out after {timeout}s, using fallback")
+    except Exception as e:
+        logging.error(f"Stage '{name}' failed: {e}", exc_info=True)
+    finally:
+        logging.info(f"Stage '{name}' finished in {(time.perf_counter() - started) * 1000:.1f} ms")
+    return default
+
+class CircuitBreaker:
+    """
+    连续失败 failure_threshold 次后断开, reset_timeout 秒内直接拒绝调用;
+    之后放行一次试探调用(half-open), 成功则闭合, 失败则重新断开。
+    allow() 为每个放行的调用返回一个令牌, 调用结束后把令牌交给 record_success / record_failure / release,
+    只有试探调用的令牌会释放试探名额。
+    """
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probe: object | None = None       # 当前试探调用的令牌
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> object | None:
+        """放行时返回令牌, 拒绝时返回 None"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return object()
+            if state == "half-open" and self._probe is None:
+                self._probe = object()
+                return self._probe
+            return None
+
+    def _end_probe(self, token: object):
+        if token is not None and token is self._probe:
+            self._probe = None
+
+    def release(self, token: object):
+        """
+        释放 half-open 试探名额(仅当 token 是试探调用的令牌)。调用方在 finally 中调用, 试探调用被取消
+        (CancelledError / GeneratorExit 不是 Exception)时断路器也不会永久拒绝;
+        断开前放行、在 half-open 期间才结束的调用不会放进第二个试探。
+        """
+        with self._lock:
+            self._end_probe(token)
+
+    def record_success(self, token: object):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._end_probe(token)
+
+    def record_failure(self, token: object):
+        with self._lock:
+            self._failures += 1
+            self._end_probe(token)
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logging.warning(f"Circuit '{self.name}' opened after {self._failures} failures")
+                self._opened_at = time.monotonic()
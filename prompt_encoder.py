@@ -0,0 +1,133 @@
+import re
+import json
+import logging
+
+from decimal import Decimal
+from typing import Any, Dict, List, Tuple
+from config import ASSET_CONFIG, AGENT_PROMPT_TOKEN_BUDGET, AGENT_REPORT_MAX_CHARS
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:   # tiktoken 未安装或编码表不可用时按字符数估算
+    _encoding = None
+
+# 与 AgentOutput 对应的精简输出格式, 取代 JsonOutputParser 冗长的 JSON Schema
+COMPACT_FORMAT_INSTRUCTIONS = (
+    '{"verdict":"ok|warning|danger","summary":str,'
+    '"suggested_adjustments":{field:float},"explanations":{field:str},"confidence":float}'
+)
+
+IDENTITY_FIELDS = {"id", "snapshot_date", "report_path", "message", "job_id"}
+# 超出预算时按顺序舍弃的上下文字段(越靠前越先舍弃)
+CONTEXT_DROP_ORDER = ("fx_market_status", "user_intent", "past_reports", "note", "date", "actions_log", "rebalance_actions")
+REPORT_STEPS = (1.0, 0.5, 0.25, 0.0)
+
+def count_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+def _compact(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+def _round(value: Any) -> Any:
+    """金额保留 2 位小数; 小于 1 的数(如 BTC 数量)保留 4 位有效数字"""
+    if isinstance(value, (Decimal, float, int)) and not isinstance(value, bool):
+        value = float(value)
+        if value == int(value):
+            return int(value)
+        return round(value, 2) if abs(value) >= 1 else float(f"{value:.4g}")
+    if isinstance(value, dict):
+        return {k: _round(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_round(v) for v in value]
+    return value
+
+def encode_snapshot(snapshot: Dict[str, Any]) -> str:
+    """去掉零值与标识字段, 按货币桶分组: {"CNY":{"savings_cny":1000},...}"""
+    buckets: Dict[str, Dict[str, Any]] = {}
+    for field, value in snapshot.items():
+        if field in IDENTITY_FIELDS or value in (None, 0) or field not in ASSET_CONFIG:
+            continue
+        currency = ASSET_CONFIG[field]["currency"]
+        buckets.setdefault(currency, {})[field] = _round(value)
+    return _compact(buckets)
+
+def encode_results(results: Dict[str, Any]) -> str:
+    compact = {}
+    for key, value in results.items():
+        if key in IDENTITY_FIELDS or value in (None, 0, {}, [], ""):
+            continue
+        compact[key] = _round(value)
+    return _compact(compact)
+
+def summarize_report(text: str, max_chars: int) -> str:
+    """
+    链上报告的抽取式摘要: 去掉标题与空白, 结论行优先, 其次是带数值的指标行, 直到长度上限。
+    """
+    if max_chars <= 0 or not text:
+        return ""
+    lines = []
+    for raw in text.splitlines():
+        line = re.sub(r"\s+", " ", raw).strip().lstrip("- ")
+        if not line or line.startswith("[") or line.endswith(":"):
+            continue
+        lines.append(line)
+    ranked = sorted(range(len(lines)), key=lambda i: (
+        0 if "阶段" in lines[i] or "Verdict" in lines[i] else 1 if re.search(r"\d", lines[i]) else 2, i
+    ))
+
+    picked: List[int] = []
+    used = 0
+    for i in ranked:
+        if used + len(lines[i]) + 1 > max_chars:
+            continue
+        picked.append(i)
+        used += len(lines[i]) + 1
+    return "; ".join(lines[i] for i in sorted(picked))
+
+def encode_context(context: Dict[str, Any], report_chars: int, dropped: Tuple[str, ...] = ()) -> str:
+    compact = {}
+    for key, value in context.items():
+        if key in dropped or value in (None, "", [], {}):
+            continue
+        if key == "market_sentiment_analysis":
+            value = summarize_report(str(value), report_chars)
+            if not value:
+                continue
+        compact[key] = _round(value)
+    return _compact(compact)
+
+def encode_prompt_inputs(
+    snapshot: Dict[str, Any],
+    results: Dict[str, Any],
+    context: Dict[str, Any],
+    template_tokens: int,
+    budget: int = AGENT_PROMPT_TOKEN_BUDGET
+) -> Tuple[Dict[str, str], int]:
+    """
+    生成精简的提示词输入并执行 token 预算:
+    先逐级缩短市场报告摘要, 再按 CONTEXT_DROP_ORDER 舍弃次要上下文。
+    返回 (chain 输入, 估计的提示词 token 数); 快照与指标本身从不截断。
+    """
+    inputs = {
+        "snapshot": encode_snapshot(snapshot),
+        "results": encode_results(results),
+        "format_instructions": COMPACT_FORMAT_INSTRUCTIONS
+    }
+    fixed = template_tokens + sum(count_tokens(v) for v in inputs.values())
+
+    dropped: Tuple[str, ...] = ()
+    steps = [(AGENT_REPORT_MAX_CHARS * s, ()) for s in REPORT_STEPS]
+    steps += [(0, CONTEXT_DROP_ORDER[:i + 1]) for i in range(len(CONTEXT_DROP_ORDER))]
+    for report_chars, dropped in steps:
+        encoded_context = encode_context(context, int(report_chars), dropped)
+        tokens = fixed + count_tokens(encoded_context)
+        if tokens <= budget:
+            break
+    else:
+        logging.warning(f"Agent prompt exceeds token budget: {tokens} > {budget}")
+
+    inputs["context"] = encoded_context
+    return inputs, tokens
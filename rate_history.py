@@ -0,0 +1,169 @@
+import json
+import logging
+import threading
+import numpy as np
+import redis
+
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Sequence
+from config import (
+    RATE_CODES,
+    RATE_HISTORY_KEY,
+    RATE_HISTORY_RETENTION_DAYS
+)
+from redis_pool import get_redis
+
+HISTORY_REDIS_CLIENT = get_redis()
+
+DAY_SECONDS = 86400
+
+def to_timestamp(value) -> float:
+    """datetime(无时区视为 UTC) / ISO 字符串 / 数字 -> Unix 秒"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+def append_rates_entry(pipe, timestamp: float, rates: Dict[str, float]):
+    """
+    在调用方的事务 pipeline 中追加一条带时间戳的汇率记录, 并清理超出保留期的记录。
+    只记录 RATE_CODES 中的币种, 保持历史矩阵紧凑。
+    """
+    entry = {"ts": timestamp, "rates": {c: float(rates[c]) for c in RATE_CODES if c in rates}}
+    pipe.zadd(RATE_HISTORY_KEY, {json.dumps(entry, sort_keys=True): timestamp})
+    pipe.zremrangebyscore(RATE_HISTORY_KEY, 0, timestamp - RATE_HISTORY_RETENTION_DAYS * DAY_SECONDS)
+
+class RateHistory:
+    """
+    内存中的紧凑汇率矩阵: times 为 T 个升序时间戳(秒), matrix 为 T×len(codes) 的 float64,
+    缺失值为 NaN。支持按时间区间切片和向量化的 "t 时刻汇率" 查询。
+    """
+    __slots__ = ("codes", "times", "matrix", "_columns")
+
+    def __init__(self, times: np.ndarray, matrix: np.ndarray, codes: Sequence[str] = RATE_CODES):
+        self.codes = tuple(codes)
+        self.times = np.asarray(times, dtype=np.float64)
+        self.matrix = np.asarray(matrix, dtype=np.float64).reshape(len(self.times), len(self.codes))
+        self._columns = {c: i for i, c in enumerate(self.codes)}
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[dict], codes: Sequence[str] = RATE_CODES) -> "RateHistory":
+        entries = sorted(entries, key=lambda e: e["ts"])
+        times = np.array([e["ts"] for e in entries], dtype=np.float64)
+        matrix = np.array(
+            [[e["rates"].get(c, np.nan) for c in codes] for e in entries],
+            dtype=np.float64
+        ).reshape(len(entries), len(codes))
+        return cls(times, matrix, codes)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def extend(self, other: "RateHistory") -> "RateHistory":
+        """追加更新的记录(时间戳需晚于当前最后一条), 返回新的对象"""
+        if len(other) == 0:
+            return self
+        if len(self) and other.times[0] <= self.times[-1]:
+            other = other.range(start=self.times[-1], inclusive_start=False)
+        return RateHistory(
+            np.concatenate([self.times, other.times]),
+            np.vstack([self.matrix, other.matrix]),
+            self.codes
+        )
+
+    def columns(self, codes: Optional[Sequence[str]] = None) -> np.ndarray:
+        if codes is None:
+            return self.matrix
+        idx = [self._columns[c] if c in self._columns else None for c in codes]
+        result = np.full((len(self), len(idx)), np.nan)
+        for j, i in enumerate(idx):
+            if i is not None:
+                result[:, j] = self.matrix[:, i]
+        return result
+
+    def range(self, start: Optional[float] = None, end: Optional[float] = None,
+              inclusive_start: bool = True) -> "RateHistory":
+        lo = 0 if start is None else np.searchsorted(self.times, start, side='left' if inclusive_start else 'right')
+        hi = len(self) if end is None else np.searchsorted(self.times, end, side='right')
+        return RateHistory(self.times[lo:hi], self.matrix[lo:hi], self.codes)
+
+    def as_of(self, timestamps, codes: Optional[Sequence[str]] = None) -> np.ndarray:
+        """
+        向量化查询: 每个时间戳取不晚于它的最后一条记录。
+        返回 len(timestamps)×len(codes) 矩阵, 早于第一条记录的行为 NaN。
+        """
+        ts = np.atleast_1d(np.asarray(timestamps, dtype=np.float64))
+        data = self.columns(codes)
+        idx = np.searchsorted(self.times, ts, side='right') - 1
+        result = data[np.clip(idx, 0, None)] if len(self) else np.full((len(ts), data.shape[1]), np.nan)
+        result = np.array(result, dtype=np.float64)
+        result[idx < 0] = np.nan
+        return result
+
+    def daily(self, days: int, end: Optional[float] = None, codes: Optional[Sequence[str]] = None):
+        """以 end(默认最后一条记录)为终点的按日网格, 返回 (times, matrix)"""
+        if end is None:
+            end = self.times[-1] if len(self) else 0.0
+        grid = end - DAY_SECONDS * np.arange(days - 1, -1, -1, dtype=np.float64)
+        return grid, self.as_of(grid, codes)
+
+    def usd_log_returns(self, days: int, codes: Optional[Sequence[str]] = None) -> np.ndarray:
+        """
+        最近 days 天各代码以美元计价的日对数收益(汇率为每美元单位数, 美元价格 = 1 / rate),
+        含缺失或非正汇率的日期被丢弃。返回 (天数-1)×len(codes)。
+        """
+        _, rates = self.daily(days + 1, codes=codes)
+        rates = rates[np.isfinite(rates).all(axis=1) & (rates > 0).all(axis=1)]
+        return np.diff(-np.log(rates), axis=0)
+
+def rates_for_snapshots(history: RateHistory, snapshots: Sequence, codes: Sequence[str]) -> np.ndarray:
+    """每个快照按其 snapshot_date 取当时的汇率, 返回 N×len(codes), 可直接传给批量估值"""
+    timestamps = [to_timestamp(s.snapshot_date) for s in snapshots]
+    return history.as_of(timestamps, codes)
+
+def load_rate_history(start: Optional[float] = None, end: Optional[float] = None,
+                      client: redis.Redis = HISTORY_REDIS_CLIENT) -> RateHistory:
+    raw_entries = client.zrangebyscore(
+        RATE_HISTORY_KEY,
+        "-inf" if start is None else float(start),
+        "+inf" if end is None else float(end)
+    )
+    entries = []
+    for raw in raw_entries:
+        try:
+            entries.append(json.loads(raw))
+        except Exception as e:
+            logging.error(f"Corrupted rate history entry skipped: {e}")
+    return RateHistory.from_entries(entries)
+
+class RateHistoryCache:
+    """
+    进程内历史矩阵。汇率快照版本变化时只增量加载最后一条记录之后的新数据,
+    版本不变时不产生网络 I/O。
+    """
+    def __init__(self, client: redis.Redis = HISTORY_REDIS_CLIENT):
+        self._client = client
+        self._history: Optional[RateHistory] = None
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def get(self, version: Optional[int] = None) -> RateHistory:
+        history = self._history
+        if history is None or (version is not None and version != self._version):
+            history = self.refresh(version)
+        return history
+
+    def refresh(self, version: Optional[int] = None) -> RateHistory:
+        with self._lock:
+            if self._history is None or len(self._history) == 0:
+                self._history = load_rate_history(client=self._client)
+            else:
+                newer = load_rate_history(start=self._history.times[-1], client=self._client)
+                self._history = self._history.extend(newer)
+            self._version = version
+            return self._history
+
+rate_history_cache = RateHistoryCache()
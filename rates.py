@@ -0,0 +1,109 @@
+import time
+import logging
+import threading
+import redis
+
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Mapping, Optional
+from config import (
+    RATE_CODES,
+    RATES_VERSION_KEY,
+    RATES_CHANNEL,
+    RATES_POLL_SECONDS
+)
+from redis_pool import get_redis
+
+RATES_REDIS_CLIENT = get_redis()
+
+class RatesSnapshot:
+    """
+    不可变、带版本号的汇率快照。
+    一个请求内的所有计算使用同一份快照, 保证汇率一致。
+    """
+    __slots__ = ("version", "rates", "loaded_at")
+
+    def __init__(self, version: int, rates: Mapping[str, Decimal]):
+        self.version = version
+        self.rates = MappingProxyType(dict(rates))
+        self.loaded_at = time.time()
+
+    def get(self, code: str, default: Decimal = Decimal('0')) -> Decimal:
+        return self.rates.get(code, default)
+
+    def as_dict(self) -> dict:
+        return dict(self.rates)
+
+def load_rates_snapshot(client: redis.Redis = RATES_REDIS_CLIENT) -> RatesSnapshot:
+    """在一个 MULTI 事务中读取版本号与全部汇率(一次往返)"""
+    pipe = client.pipeline(transaction=True)
+    pipe.get(RATES_VERSION_KEY)
+    pipe.mget(RATE_CODES)
+    raw_version, raw_rates = pipe.execute()
+
+    rates = {}
+    for code, raw in zip(RATE_CODES, raw_rates):
+        try:
+            rates[code] = Decimal(raw.decode('utf-8')) if raw else Decimal('0')
+        except Exception as e:
+            logging.error(f"Error parsing exchange rate for {code}: {str(e)}")
+            rates[code] = Decimal('0')
+    return RatesSnapshot(int(raw_version or 0), rates)
+
+class RatesCache:
+    """
+    进程内汇率快照缓存。
+    update_rate.py 发布新版本时通过 pub/sub 刷新, 热路径上读取汇率不产生任何网络 I/O。
+    """
+    def __init__(self, client: redis.Redis = RATES_REDIS_CLIENT):
+        self._client = client
+        self._snapshot: Optional[RatesSnapshot] = None
+        self._lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+
+    def get(self) -> RatesSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self.refresh()
+        return snapshot
+
+    def refresh(self, force: bool = False) -> RatesSnapshot:
+        snapshot = load_rates_snapshot(self._client)
+        with self._lock:
+            # 并发刷新时不让旧版本覆盖新版本; force 用于 Redis 版本号被重置的情况
+            if force or self._snapshot is None or snapshot.version >= self._snapshot.version:
+                self._snapshot = snapshot
+            current = self._snapshot
+        logging.info(f"Rates snapshot loaded, version {current.version}")
+        return current
+
+    def start_listener(self):
+        if self._listener and self._listener.is_alive():
+            return
+        self._listener = threading.Thread(target=self._listen, name="rates-listener", daemon=True)
+        self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(RATES_CHANNEL)
+                # 订阅期间可能错过的更新
+                self.refresh()
+                while True:
+                    message = pubsub.get_message(timeout=RATES_POLL_SECONDS)
+                    if message:
+                        self.refresh()
+                    else:
+                        self._check_version()
+            except Exception as e:
+                logging.error(f"Rates listener error: {e}, reconnecting")
+                time.sleep(RATES_POLL_SECONDS)
+
+    def _check_version(self):
+        raw_version = self._client.get(RATES_VERSION_KEY)
+        current = self._snapshot
+        if current is None or int(raw_version or 0) != current.version:
+            self.refresh(force=True)
+
+rates_cache = RatesCache()
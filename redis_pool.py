@@ -0,0 +1,19 @@
+import threading
+import redis
+
+from config import REDIS_HOST, REDIS_PORT, REDIS_DB
+
+# 各模块共用的连接池: bytes 与 decode_responses=True 各一个
+_pools = {}
+_lock = threading.Lock()
+
+def get_redis(decode_responses: bool = False) -> redis.Redis:
+    """返回绑定到共享连接池的客户端; 创建客户端不会立即建立连接"""
+    with _lock:
+        pool = _pools.get(decode_responses)
+        if pool is None:
+            pool = redis.ConnectionPool(
+                host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=decode_responses
+            )
+            _pools[decode_responses] = pool
+    return redis.Redis(connection_pool=pool)
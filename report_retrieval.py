@@ -0,0 +1,157 @@
+"""
+历史报告检索: 把日期范围 / 数值范围转换成向量库的 where 过滤(后端先过滤再做向量扫描),
+缓存查询结果, 并为 Agent 生成限定长度的历史报告上下文。
+"""
+import json
+import time
+import logging
+import threading
+
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from prompt_encoder import summarize_report
+from config import (
+    REPORT_NUMERIC_FIELDS,
+    REPORT_SEARCH_CACHE_SIZE,
+    REPORT_SEARCH_CACHE_TTL,
+    AGENT_RAG_TOP_K,
+    AGENT_RAG_MAX_CHARS,
+    AGENT_RAG_MIN_SCORE
+)
+
+def report_ts(report_date: str) -> int:
+    """report_date(YYYY-MM-DD) -> 当天 0 点的 UTC 时间戳; 日期范围过滤使用这个数值字段"""
+    return int(datetime.strptime(report_date, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp())
+
+def backfill_report_ts(backend) -> int:
+    """
+    给缺少 report_ts 的旧文档按 report_date 补上(日期范围过滤只看 report_ts), 返回补写的数量。
+    已补过的文档不会再次写入, 可以在每次打开存储时调用。
+    """
+    ids, metadatas = [], []
+    for doc_id, metadata in backend.documents():
+        if "report_ts" in metadata or not metadata.get("report_date"):
+            continue
+        try:
+            ts = report_ts(str(metadata["report_date"]))
+        except ValueError:
+            continue
+        ids.append(doc_id)
+        metadatas.append({**metadata, "report_ts": ts})
+    if ids:
+        backend.update_metadata(ids, metadatas)
+        logging.info(f"Backfilled report_ts on {len(ids)} reports")
+    return len(ids)
+
+def build_where(date_from: Optional[date] = None, date_to: Optional[date] = None,
+                source: Optional[str] = None,
+                ranges: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None) -> Optional[Dict[str, Any]]:
+    """
+    组合成 Chroma 风格的 where: 多个条件放在 $and 中(Chroma 要求顶层只有一个键)。
+    ranges: 字段 -> (最小值, 最大值), 两端都包含, None 表示不限。
+    """
+    conditions: List[Dict[str, Any]] = []
+    if date_from is not None:
+        conditions.append({"report_ts": {"$gte": report_ts(date_from.isoformat())}})
+    if date_to is not None:
+        conditions.append({"report_ts": {"$lte": report_ts(date_to.isoformat())}})
+    if source:
+        conditions.append({"source": source})
+    for name, (low, high) in (ranges or {}).items():
+        if name not in REPORT_NUMERIC_FIELDS:
+            raise ValueError(f"Unsupported range field: {name}")
+        if low is not None:
+            conditions.append({name: {"$gte": float(low)}})
+        if high is not None:
+            conditions.append({name: {"$lte": float(high)}})
+
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+class ReportSearchCache:
+    """
+    查询结果 LRU 缓存。键包含集合文档数, 有新报告写入后旧结果自然失效。
+    """
+    def __init__(self, max_entries: int = REPORT_SEARCH_CACHE_SIZE, ttl: float = REPORT_SEARCH_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, list]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[list]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, value: list):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+report_search_cache = ReportSearchCache()
+
+def search_reports(query: str, k: int = 5, where: Optional[Dict[str, Any]] = None,
+                   db=None) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    返回 (结果列表, 是否命中缓存)。每条结果: id / score / report_date / source / metadata / content。
+    """
+    if db is None:
+        from vector_store import get_asset_vector_db
+        db = get_asset_vector_db()
+
+    key = json.dumps([query, k, where, db.count()], sort_keys=True, default=str)
+    cached = report_search_cache.get(key)
+    if cached is not None:
+        return cached, True
+
+    hits = db.similarity_search(query, k=k, where=where)
+    results = [
+        {
+            "id": hit.id,
+            "score": round(hit.score, 4),
+            "report_date": hit.metadata.get("report_date"),
+            "source": hit.metadata.get("source"),
+            "metadata": hit.metadata,
+            "content": hit.page_content
+        }
+        for hit in hits
+    ]
+    report_search_cache.put(key, results)
+    return results, False
+
+def retrieve_report_context(query: str, before: Optional[date] = None, k: int = AGENT_RAG_TOP_K,
+                            max_chars: int = AGENT_RAG_MAX_CHARS, db=None) -> List[Dict[str, Any]]:
+    """
+    Agent 的历史报告上下文: 取 before 之前最相关的 k 份自动更新报告,
+    每份压缩成抽取式摘要, 总长度不超过 max_chars(按相关度优先分配)。
+    """
+    date_to = before - timedelta(days=1) if before is not None else None
+    where = build_where(date_to=date_to, source="automated_update")
+    try:
+        hits, _ = search_reports(query, k=k, where=where, db=db)
+    except Exception as e:
+        logging.warning(f"Report retrieval failed, continuing without history: {e}")
+        return []
+
+    context = []
+    remaining = max_chars
+    for hit in hits:
+        if hit["score"] < AGENT_RAG_MIN_SCORE or remaining <= 0:
+            continue
+        excerpt = summarize_report(hit["content"], remaining)
+        if not excerpt:
+            continue
+        remaining -= len(excerpt)
+        context.append({"date": hit["report_date"], "similarity": hit["score"], "excerpt": excerpt})
+    return context
@@ -0,0 +1,49 @@
+import os
+
+from datetime import datetime
+from models import AssetSnapshot, AssetResults
+from config import REPORT_DIR
+
+def generate_report(data: AssetSnapshot, results: AssetResults) -> str:
+    """生成报告内容"""
+    timestamp = datetime.now().strftime("%Y-%m-%d")
+    report = f"""Asset Report - Generated at {timestamp}
+
+Original Asset Data:
+-------------------
+黄金 {data.gold_g} g {data.gold_oz} oz
+养老金(CNY) {data.retirement_funds_cny}
+基金(CNY) {data.funds_cny}
+住房公积金(CNY) {data.housing_fund_cny}
+储蓄(CNY) {data.savings_cny}
+比特币(个) {data.btc}
+比特币股票(USD) {data.btc_stock_usd}
+基金(HDK) {data.funds_hkd}
+储蓄(HKD) {data.savings_hkd}
+基金(SGD) {data.funds_sgd}
+储蓄(SGD) {data.savings_sgd}
+基金(EUR) {data.funds_eur}
+储蓄(EUR) {data.savings_eur}
+存款(GBP) {data.deposit_gbp}
+股票(USD) {data.stock_usd}
+储蓄(USD) {data.savings_usd}
+
+美元计价:
+------------------
+总资产: {results.total_assets_usd:.2f} USD
+总储蓄: {results.total_savings_usd:.2f} USD
+黄金资产占比: {results.gold_ratio:.2f}%
+比特币资产占比: {results.btc_ratio:.2f}%
+"""
+    return report
+
+def save_report(report_content: str):
+    """保存报告到文件"""
+    filename = f"asset_report_{datetime.now().strftime('%Y%m%d')}.txt"
+    filepath = os.path.join(REPORT_DIR, filename)
+
+    os.makedirs(REPORT_DIR, exist_ok=True)
+
+    with open(filepath, 'w', encoding='utf-8') as f:
+        f.write(report_content)
+    return filepath
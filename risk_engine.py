@@ -1,122 +1,272 @@
-import requests
-import pandas as pd
+import json
+import time
+import uuid
+import threading
 import numpy as np
 import redis
 import logging
 
 from decimal import Decimal, ROUND_HALF_UP
+from typing import List, Optional
 from config import (
-    REDIS_HOST,
-    REDIS_PORT,
-    REDIS_DB,
     BTC_RISK_KEY,
-    BTC_PAIR,
-    BTC_INTERVAL_MINUTES, BTC_RISK_WEIGHTS,
+    BTC_RISK_WEIGHTS,
+    BTC_RISK_SOFT_TTL,
+    BTC_RISK_HARD_TTL,
+    BTC_RISK_LOCK_KEY,
+    BTC_RISK_LOCK_TTL,
+    BTC_RISK_REFRESH_INTERVAL,
     VOLATILITY_WINDOW,
     MOD_WINDOW
 )
+from redis_pool import get_redis
+from candle_store import get_btc_candle_store
 
-RISK_REDIS_CLIENT = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB)
+RISK_REDIS_CLIENT = get_redis()
 
 def update_and_cache_btc_risk() -> Decimal:
     """
-    获取 BTC 历史数据，计算风险系数，并将结果存储到 Redis。
+    增量同步本地 BTC K 线存储, 计算风险系数，并将结果存储到 Redis。
+    存储数据新鲜时不访问网络; 同步失败时沿用已持久化的历史数据。
+    Redis 中保存 {score, computed_at, duration_ms}, 供 stale-while-revalidate 判断年龄。
     """
-    df = fetch_btc_history_kraken(pair=BTC_PAIR, interval_minutes=BTC_INTERVAL_MINUTES)
-    if df is None or len(df) < MOD_WINDOW:
+    started = time.perf_counter()
+    store = get_btc_candle_store()
+    try:
+        store.sync()
+    except Exception as e:
+        logging.error(f"BTC K 线同步失败, 使用本地历史数据: {e}")
+
+    closes = store.closes(MOD_WINDOW)
+    if len(closes) < MOD_WINDOW:
         logging.warning("数据不足, 使用默认配置的静态权重")
         risk_score = 10.0
     else:
-        df_1y = df.tail(365).copy()
+        risk_score = calculate_btc_risk_factor(closes)
 
-        close_prices = df_1y['close']
-        risk_score = calculate_btc_risk_factor(close_prices)
-    
+    entry = {
+        "score": str(risk_score),
+        "computed_at": time.time(),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
     try:
-        RISK_REDIS_CLIENT.set(BTC_RISK_KEY, str(risk_score), ex=43200)
+        RISK_REDIS_CLIENT.set(BTC_RISK_KEY, json.dumps(entry), ex=BTC_RISK_HARD_TTL)
     except Exception as e:
         logging.error(f"Error saving to Redis: {str(e)}", exc_info=True)
-    return risk_score
+    return Decimal(str(risk_score))
 
-def fetch_btc_history_kraken(pair: str, interval_minutes: int) -> pd.DataFrame | None:
-    url = "https://api.kraken.com/0/public/OHLC"
-    params = {
-        'pair': pair,
-        'interval': interval_minutes,
-    }
+def _parse_risk_entry(raw) -> Optional[dict]:
+    if not raw:
+        return None
+    if isinstance(raw, bytes):
+        raw = raw.decode('utf-8')
     try:
-        resp = requests.get(url, params=params, timeout=15)
-        resp.raise_for_status()
-        data = resp.json()
+        entry = json.loads(raw)
+        if not isinstance(entry, dict):
+            # 旧格式: 只有分数, 年龄未知, 视为已过软过期
+            entry = {"score": raw, "computed_at": 0.0, "duration_ms": None}
+        entry["score"] = Decimal(str(entry["score"]))
+        return entry
+    except Exception:
+        logging.warning("Cached BTC risk factor is corrupted. Recalculating.")
+        return None
+
+class BtcRiskCache:
+    """
+    BTC 风险分的 single-flight 缓存:
+    - 请求路径只读 Redis, 从不同步计算(不包含 Kraken 下载)
+    - 超过软过期后返回旧值, 同时只有一个 worker 在后台重算(Redis SET NX 锁, Redis 不可用时退化为进程内锁)
+    - 后台线程在硬过期之前主动刷新
+    """
+    def __init__(self, client: redis.Redis = RISK_REDIS_CLIENT):
+        self._client = client
+        self._local_lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+        self.last_error: Optional[str] = None
+        self.last_refresh_at: Optional[float] = None
+
+    def read(self) -> Optional[dict]:
+        return _parse_risk_entry(self._client.get(BTC_RISK_KEY))
 
-        if data['error']:
-            logging.error(f"Kraken API 错误: {data['error']}")
+    def get(self) -> Decimal:
+        """返回当前风险分; 缓存为空时返回 0 (静态风险兜底) 并触发后台刷新"""
+        try:
+            entry = self.read()
+        except Exception as e:
+            logging.error(f"Error reading BTC risk from Redis: {str(e)}")
+            entry = None
+
+        if entry is None:
+            self.refresh_async()
+            return Decimal('0')
+        if time.time() - entry["computed_at"] > BTC_RISK_SOFT_TTL:
+            self.refresh_async()
+        return entry["score"]
+
+    @property
+    def refreshing(self) -> bool:
+        return self._local_lock.locked()
+
+    def refresh_async(self) -> bool:
+        """非阻塞地触发一次后台刷新; 本进程已有刷新在进行时直接返回 False"""
+        if not self._local_lock.acquire(blocking=False):
+            return False
+        threading.Thread(target=self._refresh_locked, name="btc-risk-refresh", daemon=True).start()
+        return True
+
+    def refresh(self) -> Optional[Decimal]:
+        """同步刷新(供后台线程和脚本使用); 其他进程持有锁时返回 None"""
+        if not self._local_lock.acquire(blocking=False):
             return None
-        
-        asset_key = [k for k in data['result'].keys() if k != 'last'][0]
-        ohlc_data = data['result'][asset_key]
-        df = pd.DataFrame(ohlc_data, columns=[
-            'time', 'open', 'high', 'low', 'close', 'vwap', 'volume', 'count'
-        ])
-        df['close'] = df['close'].astype(float)
-        df['date'] = pd.to_datetime(df['time'], unit='s', utc=True)
-
-        df = df.sort_values('date').reset_index(drop=True)
-
-        return df
-    
-    except requests.exceptions.RequestException as e:
-        print(f"Kraken API 请求失败: {e}")
-        return None
-    except Exception as e:
-        print(f"数据处理失败: {e}")
-        return None
+        return self._refresh_locked()
+
+    def _refresh_locked(self) -> Optional[Decimal]:
+        token = uuid.uuid4().hex
+        have_redis_lock = False
+        try:
+            try:
+                if not self._client.set(BTC_RISK_LOCK_KEY, token, nx=True, ex=BTC_RISK_LOCK_TTL):
+                    return None
+                have_redis_lock = True
+            except Exception as e:
+                logging.warning(f"BTC risk Redis lock unavailable, using local lock: {e}")
+
+            score = update_and_cache_btc_risk()
+            self.last_error = None
+            self.last_refresh_at = time.time()
+            return score
+        except Exception as e:
+            self.last_error = str(e)
+            logging.error(f"BTC risk refresh failed: {e}", exc_info=True)
+            return None
+        finally:
+            if have_redis_lock:
+                try:
+                    raw = self._client.get(BTC_RISK_LOCK_KEY)
+                    if raw is not None and (raw.decode('utf-8') if isinstance(raw, bytes) else raw) == token:
+                        self._client.delete(BTC_RISK_LOCK_KEY)
+                except Exception:
+                    pass
+            self._local_lock.release()
+
+    def start_refresher(self):
+        if self._refresher and self._refresher.is_alive():
+            return
+        self._refresher = threading.Thread(target=self._refresh_loop, name="btc-risk-refresher", daemon=True)
+        self._refresher.start()
 
-def calculate_btc_risk_factor(prices: pd.Series) -> Decimal:
+    def _refresh_loop(self):
+        while True:
+            try:
+                entry = self.read()
+                if entry is None or time.time() - entry["computed_at"] > BTC_RISK_SOFT_TTL:
+                    self.refresh()
+            except Exception as e:
+                logging.error(f"BTC risk refresher error: {e}")
+            time.sleep(BTC_RISK_REFRESH_INTERVAL)
+
+    def status(self) -> dict:
+        entry = self.read()
+        now = time.time()
+        return {
+            "score": str(entry["score"]) if entry else None,
+            "computed_at": entry["computed_at"] if entry and entry["computed_at"] else None,
+            "age_seconds": round(now - entry["computed_at"], 1) if entry and entry["computed_at"] else None,
+            "refresh_duration_ms": entry.get("duration_ms") if entry else None,
+            "stale": entry is None or now - entry["computed_at"] > BTC_RISK_SOFT_TTL,
+            "refreshing": self.refreshing,
+            "last_refresh_at": self.last_refresh_at,
+            "last_error": self.last_error
+        }
+
+btc_risk_cache = BtcRiskCache()
+
+def get_btc_risk_score() -> Decimal:
+    """从缓存读取风险分, 不在请求路径上重算"""
+    return btc_risk_cache.get()
+
+def _rolling_max(values: np.ndarray, window: int) -> np.ndarray:
     """
-    根据价格序列(close prices)计算BTC风险系数(0-10)
+    沿最后一维的滚动最大值(等价 rolling(window, min_periods=1).max()),
+    van Herk/Gil-Werman 分块前缀/后缀最大值, 对整个二维数组一次完成, O(n) 与窗口长度无关。
     """
-    prices_numeric = prices.astype(float)
-    # 1. 计算收益率并去极端值
-    # 计算对数收益率
-    log_returns = np.log(prices_numeric / prices_numeric.shift(1)).dropna()
-    # 去除1%和99%分位数的极端值
-    lower_bound = log_returns.quantile(0.01)
-    upper_bound = log_returns.quantile(0.99)
-    clipped_returns = log_returns.clip(lower=lower_bound, upper=upper_bound)
-
-    # 2. 动态波动率评分
-    # 计算滚动波动率
-    rolling_vol = clipped_returns.rolling(window=VOLATILITY_WINDOW).std()
-
-    current_vol = rolling_vol.iloc[-5:].mean()
-
-    # 基于历史分位数打分
-    valid_historyvols = rolling_vol.dropna()
-    if len(valid_historyvols) > 0:
-        vol_percentile = (valid_historyvols < current_vol).mean()
-        vol_score = vol_percentile * 10.0
+    n = values.shape[-1]
+    if window >= n:
+        return np.maximum.accumulate(values, axis=-1)
+    pad = (-n) % window
+    padded = np.concatenate([values, np.full(values.shape[:-1] + (pad,), -np.inf)], axis=-1)
+    blocks = padded.reshape(values.shape[:-1] + (-1, window))
+    prefix = np.maximum.accumulate(blocks, axis=-1).reshape(padded.shape)
+    suffix = np.flip(np.maximum.accumulate(np.flip(blocks, -1), axis=-1), -1).reshape(padded.shape)
+
+    result = np.empty_like(values)
+    result[..., :window - 1] = prefix[..., :window - 1]
+    result[..., window - 1:] = np.maximum(suffix[..., :n - window + 1], prefix[..., window - 1:n])
+    return result
+
+def _rolling_std(values: np.ndarray, window: int) -> np.ndarray:
+    """沿最后一维的滚动样本标准差(ddof=1), 累计和实现; 先按行去均值以减小相消误差"""
+    centered = values - values.mean(axis=-1, keepdims=True)
+    zeros = np.zeros(values.shape[:-1] + (1,))
+    s1 = np.concatenate([zeros, np.cumsum(centered, axis=-1)], axis=-1)
+    s2 = np.concatenate([zeros, np.cumsum(centered * centered, axis=-1)], axis=-1)
+    win_sum = s1[..., window:] - s1[..., :-window]
+    win_sq = s2[..., window:] - s2[..., :-window]
+    var = (win_sq - win_sum * win_sum / window) / (window - 1)
+    return np.sqrt(np.maximum(var, 0.0))
+
+def _risk_components(prices: np.ndarray):
+    """
+    对二维价格矩阵(每行一条升序的收盘价序列)计算
+    (当前波动率, 波动率评分, 当前回撤, 回撤评分), 均为长度等于行数的数组。
+    """
+    # 1. 计算对数收益率并去除1%和99%分位数的极端值
+    log_returns = np.log(prices[:, 1:] / prices[:, :-1])
+    lower = np.quantile(log_returns, 0.01, axis=1, keepdims=True)
+    upper = np.quantile(log_returns, 0.99, axis=1, keepdims=True)
+    clipped = np.clip(log_returns, lower, upper)
+
+    # 2. 动态波动率评分: 近5日滚动波动率均值在历史滚动波动率中的分位
+    if clipped.shape[1] >= VOLATILITY_WINDOW:
+        rolling_vol = _rolling_std(clipped, VOLATILITY_WINDOW)
+        current_vol = rolling_vol[:, -5:].mean(axis=1)
+        vol_score = (rolling_vol < current_vol[:, None]).mean(axis=1) * 10.0
     else:
-        vol_score = 5.0
+        current_vol = np.full(prices.shape[0], np.nan)
+        vol_score = np.full(prices.shape[0], 5.0)
 
     # 3. 滚动最大回撤评分
-    rolling_max = prices_numeric.rolling(window=MOD_WINDOW, min_periods=1).max()
-    daily_drawdown = (prices_numeric / rolling_max) - 1.0
-    current_mdd = abs(daily_drawdown.iloc[-5:].min())
-
-    mdd_score = (current_mdd / 0.70) * 10.0
-    mdd_score = min(10.0, mdd_score)
+    drawdown = prices / _rolling_max(prices, MOD_WINDOW) - 1.0
+    current_mdd = np.abs(drawdown[:, -5:].min(axis=1))
+    mdd_score = np.minimum(10.0, current_mdd / 0.70 * 10.0)
+    return current_vol, vol_score, current_mdd, mdd_score
 
+def _weighted_score(vol_score: float, mdd_score: float) -> Decimal:
     # 4. 加权计算最终风险
     final_score = (
         Decimal(str(vol_score)) * BTC_RISK_WEIGHTS['volatility'] +
         Decimal(str(mdd_score)) * BTC_RISK_WEIGHTS['mdd']
     )
-
     final_score = max(Decimal('0'), min(Decimal('10'), final_score))
+    return final_score.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+def calculate_risk_factors(prices) -> List[Decimal]:
+    """
+    批量计算风险系数: prices 为二维数组, 每行一条等长的收盘价序列
+    """
+    matrix = np.atleast_2d(np.asarray(prices, dtype=np.float64))
+    _, vol_scores, _, mdd_scores = _risk_components(matrix)
+    return [_weighted_score(float(v), float(m)) for v, m in zip(vol_scores, mdd_scores)]
+
+def calculate_btc_risk_factor(prices) -> Decimal:
+    """
+    根据价格序列(close prices)计算BTC风险系数(0-10)
+    """
+    matrix = np.asarray(prices, dtype=np.float64).reshape(1, -1)
+    current_vol, vol_score, current_mdd, mdd_score = (float(x[0]) for x in _risk_components(matrix))
+    final_score = _weighted_score(vol_score, mdd_score)
 
     logging.info(f"BTC Risk Calc | Vol: {current_vol:.2%} (Score: {vol_score:.2f}) | "
                  f"MDD: {current_mdd:.2%} (Score: {mdd_score:.2f}) | "
                  f"Final: {final_score:.2f}")
-
-    return final_score.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
\ No newline at end of file
+    return final_score
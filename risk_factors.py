@@ -0,0 +1,155 @@
+import time
+import logging
+import threading
+import redis
+import numpy as np
+
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional
+from config import (
+    RATE_CODES,
+    MOD_WINDOW,
+    RISK_FACTOR_SERIES,
+    RISK_FACTOR_BASE,
+    RISK_FACTOR_MIN_DAYS,
+    RISK_FACTORS_KEY,
+    RISK_FACTORS_VERSION_KEY,
+    RISK_FACTORS_POLL_SECONDS
+)
+from redis_pool import get_redis
+from rate_history import RateHistory, load_rate_history, DAY_SECONDS
+from risk_engine import _risk_components, _weighted_score
+
+RISK_FACTORS_REDIS_CLIENT = get_redis()
+COMPUTED_AT_FIELD = "__computed_at__"
+
+class RiskFactors:
+    """带版本号的动态风险因子: 价格序列代码 -> 风险分(0-10)"""
+    __slots__ = ("version", "scores", "computed_at")
+
+    def __init__(self, version: int, scores: Mapping[str, Decimal], computed_at: Optional[float] = None):
+        self.version = version
+        self.scores = MappingProxyType(dict(scores))
+        self.computed_at = computed_at
+
+    def field_risks(self, asset_config: Dict[str, dict]) -> Dict[str, Decimal]:
+        """按 RISK_FACTOR_SERIES 缩放静态风险, 没有因子的字段不出现在结果中"""
+        risks = {}
+        for field, code in RISK_FACTOR_SERIES.items():
+            score = self.scores.get(code)
+            if score is None or field not in asset_config:
+                continue
+            risks[field] = Decimal(asset_config[field]['risk']) * (RISK_FACTOR_BASE + score / 10)
+        return risks
+
+EMPTY_RISK_FACTORS = RiskFactors(0, {})
+
+def compute_risk_factors(history: RateHistory, days: int = MOD_WINDOW) -> Dict[str, Decimal]:
+    """
+    在一次向量化计算中对所有价格序列复用 BTC 的波动率 + 回撤评分方法。
+    历史不足 RISK_FACTOR_MIN_DAYS 天或含无效价格的序列被跳过。
+    """
+    codes = [c for c in RATE_CODES if c in set(RISK_FACTOR_SERIES.values())]
+    if not codes or len(history) == 0:
+        return {}
+
+    _, matrix = history.daily(days, codes=codes)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        prices = 1.0 / matrix.T          # 每行一条美元价格序列
+
+    valid = np.isfinite(prices) & (prices > 0)
+    # 去掉历史开始之前的列, 再去掉中途缺失报价的序列
+    start = int(np.argmax(valid.any(axis=0))) if valid.any() else prices.shape[1]
+    rows = valid[:, start:].all(axis=1)
+    if prices.shape[1] - start < RISK_FACTOR_MIN_DAYS or not rows.any():
+        return {}
+
+    _, vol_scores, _, mdd_scores = _risk_components(prices[rows, start:])
+    kept = [c for c, ok in zip(codes, rows) if ok]
+    return {code: _weighted_score(float(v), float(m)) for code, v, m in zip(kept, vol_scores, mdd_scores)}
+
+def refresh_risk_factors(client: redis.Redis = RISK_FACTORS_REDIS_CLIENT, now: Optional[float] = None) -> int:
+    """重算全部风险因子并以新版本写入 Redis 哈希, 返回版本号"""
+    now = time.time() if now is None else now
+    history = load_rate_history(start=now - (MOD_WINDOW + 1) * DAY_SECONDS, end=now, client=client)
+    scores = compute_risk_factors(history)
+
+    pipe = client.pipeline(transaction=True)
+    pipe.delete(RISK_FACTORS_KEY)
+    pipe.hset(RISK_FACTORS_KEY, mapping={
+        COMPUTED_AT_FIELD: str(now),
+        **{code: str(score) for code, score in scores.items()}
+    })
+    pipe.incr(RISK_FACTORS_VERSION_KEY)
+    version = pipe.execute()[-1]
+    logging.info(f"Risk factors refreshed, version {version}: {scores}")
+    return int(version)
+
+def _decode(value) -> str:
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+def load_risk_factors(client: redis.Redis = RISK_FACTORS_REDIS_CLIENT) -> RiskFactors:
+    pipe = client.pipeline(transaction=True)
+    pipe.get(RISK_FACTORS_VERSION_KEY)
+    pipe.hgetall(RISK_FACTORS_KEY)
+    raw_version, raw_hash = pipe.execute()
+
+    scores = {}
+    computed_at = None
+    for key, value in raw_hash.items():
+        key, value = _decode(key), _decode(value)
+        try:
+            if key == COMPUTED_AT_FIELD:
+                computed_at = float(value)
+            else:
+                scores[key] = Decimal(value)
+        except Exception as e:
+            logging.error(f"Error parsing risk factor {key}: {str(e)}")
+    return RiskFactors(int(raw_version or 0), scores, computed_at)
+
+class RiskFactorCache:
+    """
+    进程内风险因子缓存。每 RISK_FACTORS_POLL_SECONDS 检查一次版本号, 版本变化才重新读取哈希;
+    Redis 不可用时沿用已有因子(初始为空, 即全部使用静态风险)。
+    API 进程启动后台刷新线程, get() 只读内存, 不在事件循环上访问 Redis;
+    未启动刷新线程的进程(worker、脚本)在 get() 中按间隔同步检查。
+    """
+    def __init__(self, client: redis.Redis = RISK_FACTORS_REDIS_CLIENT):
+        self._client = client
+        self._factors = EMPTY_RISK_FACTORS
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+
+    def get(self) -> RiskFactors:
+        if self._refresher is None and time.time() - self._checked_at >= RISK_FACTORS_POLL_SECONDS:
+            self._check_version()
+        return self._factors
+
+    def start_refresher(self):
+        if self._refresher and self._refresher.is_alive():
+            return
+        self._refresher = threading.Thread(target=self._refresh_loop, name="risk-factors-refresher", daemon=True)
+        self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            self._check_version()
+            time.sleep(RISK_FACTORS_POLL_SECONDS)
+
+    def _check_version(self):
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._checked_at = time.time()
+            raw_version = self._client.get(RISK_FACTORS_VERSION_KEY)
+            if int(raw_version or 0) != self._factors.version:
+                self._factors = load_risk_factors(self._client)
+                logging.info(f"Risk factors loaded, version {self._factors.version}")
+        except Exception as e:
+            logging.error(f"Error loading risk factors: {str(e)}")
+        finally:
+            self._lock.release()
+
+risk_factor_cache = RiskFactorCache()
@@ -0,0 +1,180 @@
+import json
+import time
+import logging
+import threading
+import redis
+import numpy as np
+
+from typing import Dict, Optional, Sequence, Tuple
+from config import (
+    RATE_CODES,
+    RISK_MODEL_LOOKBACK_DAYS,
+    RISK_MODEL_MIN_DAYS,
+    RISK_MODEL_ANNUALIZATION,
+    RISK_MODEL_KEY,
+    RISK_MODEL_VERSION_KEY,
+    RISK_MODEL_POLL_SECONDS
+)
+from redis_pool import get_redis
+from rate_history import RateHistory, load_rate_history, DAY_SECONDS
+
+RISK_MODEL_REDIS_CLIENT = get_redis()
+
+def ledoit_wolf_correlation(returns: np.ndarray) -> Tuple[np.ndarray, float]:
+    """
+    对标准化后的收益做 Ledoit-Wolf 收缩(目标为单位阵), 返回 (相关系数矩阵, 收缩强度)。
+    在相关系数上收缩可保留各资产的样本方差, 不会把高波动的 BTC 与低波动的港币拉向同一方差。
+    """
+    n, p = returns.shape
+    x = returns - returns.mean(axis=0)
+    x = x / x.std(axis=0)
+    sample = x.T @ x / n
+    target_gap = sample - np.eye(p)
+    delta = (target_gap ** 2).sum() / p
+    x2 = x ** 2
+    beta = ((x2.T @ x2) / n - sample ** 2).sum() / (p * n)
+    shrinkage = 0.0 if delta == 0 else min(beta, delta) / delta
+    return (1.0 - shrinkage) * sample + shrinkage * np.eye(p), float(shrinkage)
+
+class RiskModel:
+    """
+    年化的货币桶(资产类别)收益协方差矩阵。
+    单个组合的波动率只是一次二次型 w'Σw, 批量时为一次 einsum。
+    """
+    __slots__ = ("version", "currencies", "cov", "shrinkage", "observations", "computed_at", "_aligned")
+
+    def __init__(self, version: int, currencies: Sequence[str], cov: np.ndarray,
+                 shrinkage: float = 0.0, observations: int = 0, computed_at: Optional[float] = None):
+        self.version = version
+        self.currencies = tuple(currencies)
+        self.cov = np.asarray(cov, dtype=np.float64)
+        self.shrinkage = shrinkage
+        self.observations = observations
+        self.computed_at = computed_at
+        self._aligned: Dict[Tuple[str, ...], np.ndarray] = {}
+
+    def aligned(self, currencies: Sequence[str]) -> np.ndarray:
+        """按给定货币顺序排列的协方差, 模型中没有的货币方差视为 0"""
+        key = tuple(currencies)
+        cov = self._aligned.get(key)
+        if cov is None:
+            index = {c: i for i, c in enumerate(self.currencies)}
+            pos = np.array([index.get(c, -1) for c in key], dtype=np.intp)
+            known = pos >= 0
+            cov = np.zeros((len(key), len(key)))
+            cov[np.ix_(known, known)] = self.cov[np.ix_(pos[known], pos[known])]
+            self._aligned[key] = cov
+        return cov
+
+    def evaluate(self, exposures: np.ndarray, currencies: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        exposures 为 N×C 的美元敞口。
+        返回 (年化组合波动率 %, 长度 N; 各桶风险贡献 % (合计 100), N×C)。
+        """
+        exposures = np.atleast_2d(np.asarray(exposures, dtype=np.float64))
+        cov = self.aligned(currencies)
+        total = exposures.sum(axis=1, keepdims=True)
+        weights = np.divide(exposures, total, out=np.zeros_like(exposures), where=total > 0)
+
+        marginal = weights @ cov
+        variance = np.einsum('ij,ij->i', marginal, weights)
+        contributions = np.divide(
+            weights * marginal, variance[:, None],
+            out=np.zeros_like(weights), where=variance[:, None] > 0
+        ) * 100
+        return np.sqrt(np.maximum(variance, 0.0)) * 100, contributions
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "currencies": list(self.currencies),
+            "cov": self.cov.tolist(),
+            "shrinkage": self.shrinkage,
+            "observations": self.observations,
+            "computed_at": self.computed_at
+        })
+
+    @classmethod
+    def from_json(cls, version: int, raw) -> "RiskModel":
+        data = json.loads(raw)
+        return cls(version, data["currencies"], np.array(data["cov"]), data.get("shrinkage", 0.0),
+                   data.get("observations", 0), data.get("computed_at"))
+
+def estimate_risk_model(history: RateHistory, currencies: Sequence[str] = RATE_CODES,
+                        lookback_days: int = RISK_MODEL_LOOKBACK_DAYS) -> RiskModel:
+    """由汇率历史估计收缩协方差; 零方差的桶(美元)不参与收缩, 方差与协方差均为 0"""
+    returns = history.usd_log_returns(lookback_days, currencies)
+    if len(returns) < RISK_MODEL_MIN_DAYS:
+        raise ValueError(f"Insufficient price history: {len(returns)} daily returns, need {RISK_MODEL_MIN_DAYS}")
+
+    std = returns.std(axis=0, ddof=1)
+    active = std > 0
+    cov = np.zeros((len(currencies), len(currencies)))
+    shrinkage = 0.0
+    if active.any():
+        corr, shrinkage = ledoit_wolf_correlation(returns[:, active])
+        scale = std[active] * np.sqrt(RISK_MODEL_ANNUALIZATION)
+        cov[np.ix_(active, active)] = corr * np.outer(scale, scale)
+    return RiskModel(0, currencies, cov, shrinkage, len(returns), time.time())
+
+def refresh_risk_model(client: redis.Redis = RISK_MODEL_REDIS_CLIENT, now: Optional[float] = None) -> int:
+    """重新估计风险模型并以新版本写入 Redis, 返回版本号"""
+    now = time.time() if now is None else now
+    history = load_rate_history(start=now - (RISK_MODEL_LOOKBACK_DAYS + 2) * DAY_SECONDS, end=now, client=client)
+    model = estimate_risk_model(history)
+
+    pipe = client.pipeline(transaction=True)
+    pipe.set(RISK_MODEL_KEY, model.to_json())
+    pipe.incr(RISK_MODEL_VERSION_KEY)
+    version = pipe.execute()[-1]
+    logging.info(f"Risk model refreshed, version {version}: {model.observations} days, "
+                 f"shrinkage {model.shrinkage:.3f}")
+    return int(version)
+
+class RiskModelCache:
+    """
+    进程内风险模型缓存, 与 RiskFactorCache 相同: 定期检查版本号, 变化时才重新读取,
+    API 进程由后台刷新线程检查, get() 只读内存;
+    Redis 不可用或尚未计算时返回 None, 调用方不输出组合波动率。
+    """
+    def __init__(self, client: redis.Redis = RISK_MODEL_REDIS_CLIENT):
+        self._client = client
+        self._model: Optional[RiskModel] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+
+    def get(self) -> Optional[RiskModel]:
+        if self._refresher is None and time.time() - self._checked_at >= RISK_MODEL_POLL_SECONDS:
+            self._check_version()
+        return self._model
+
+    def start_refresher(self):
+        if self._refresher and self._refresher.is_alive():
+            return
+        self._refresher = threading.Thread(target=self._refresh_loop, name="risk-model-refresher", daemon=True)
+        self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            self._check_version()
+            time.sleep(RISK_MODEL_POLL_SECONDS)
+
+    def _check_version(self):
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._checked_at = time.time()
+            pipe = self._client.pipeline(transaction=True)
+            pipe.get(RISK_MODEL_VERSION_KEY)
+            pipe.get(RISK_MODEL_KEY)
+            raw_version, raw_model = pipe.execute()
+            version = int(raw_version or 0)
+            if raw_model and (self._model is None or version != self._model.version):
+                self._model = RiskModel.from_json(version, raw_model)
+                logging.info(f"Risk model loaded, version {version}")
+        except Exception as e:
+            logging.error(f"Error loading risk model: {str(e)}")
+        finally:
+            self._lock.release()
+
+risk_model_cache = RiskModelCache()
@@ -0,0 +1,87 @@
+import numpy as np
+
+from typing import Any, Dict, List, Optional, Tuple
+from models import AgentOutput
+from allocation_engine import allocation_map
+from config import TARGET_ALLOCATION, REBALANCE_THRESHOLD
+
+# (指标, 警告阈值, 危险阈值, 方向): 方向为 1 表示越高越危险, -1 表示越低越危险
+RULES = (
+    ("weighted_risk_score", 5.0, 7.0, 1),
+    ("speculative_ratio", 30.0, 50.0, 1),
+    ("btc_ratio", 30.0, 45.0, 1),
+    ("available_liquidity_ratio", 10.0, 5.0, -1),
+)
+SEVERITY = {"ok": 0, "warning": 1, "danger": 2}
+RULE_CONFIDENCE = 0.6
+
+def _check_rules(results: Dict[str, Any]) -> List[Tuple[str, str]]:
+    findings = []
+    for metric, warn, danger, direction in RULES:
+        value = results.get(metric)
+        if value is None:
+            continue
+        value = float(value)
+        if direction * (value - danger) >= 0:
+            findings.append(("danger", f"{metric} is {value:.2f} (danger level {danger:g})"))
+        elif direction * (value - warn) >= 0:
+            findings.append(("warning", f"{metric} is {value:.2f} (warning level {warn:g})"))
+    return findings
+
+def _check_drift(results: Dict[str, Any]) -> List[Tuple[str, str]]:
+    distribution = results.get("currency_distribution") or {}
+    if not distribution:
+        return []
+    currencies = list(distribution)
+    mapping, targets = allocation_map(currencies, TARGET_ALLOCATION)
+    drift = np.array([float(distribution[c]) for c in currencies]) @ mapping - targets
+    worst = int(np.argmax(np.abs(drift)))
+    if abs(drift[worst]) <= float(REBALANCE_THRESHOLD):
+        return []
+    category = list(TARGET_ALLOCATION)[worst]
+    return [("warning", f"{category} allocation drifts {drift[worst]:+.2f}% from target")]
+
+def _suggest_from_actions(snapshot: Dict[str, Any], actions: List[Any]) -> Tuple[Dict[str, float], Dict[str, str]]:
+    """把再平衡划转换算成来源字段调整后的数值"""
+    adjustments: Dict[str, float] = {}
+    explanations: Dict[str, str] = {}
+    for action in actions:
+        if not isinstance(action, dict):
+            action = action.model_dump()
+        source, target, amount = action.get("from_field"), action.get("to_field"), float(action.get("amount", 0))
+        if not source or amount <= 0:
+            continue
+        # 划转数量以来源字段的单位计, 目标字段的增量取决于汇率, 这里只调整来源字段
+        adjustments[source] = adjustments.get(source, float(snapshot.get(source) or 0)) - amount
+        explanations[source] = (
+            f"Move {amount:g} out of {source}" + (f" into {target}" if target else "") +
+            " to bring allocation back within the rebalance threshold"
+        )
+    return {k: round(v, 2) for k, v in adjustments.items()}, explanations
+
+def analyze_rules(snapshot: Dict[str, Any], results: Dict[str, Any], context: Optional[Dict[str, Any]] = None) -> AgentOutput:
+    """
+    确定性的规则分析器, 与 LLM Agent 输出同样的 AgentOutput。
+    用于熔断 / 超时降级, 以及 AGENT_BACKEND=offline 时的离线后端。
+    """
+    context = context or {}
+    findings = _check_rules(results) + _check_drift(results)
+    verdict = max((f[0] for f in findings), key=SEVERITY.get, default="ok")
+
+    actions = results.get("rebalance_actions") or context.get("rebalance_actions") or []
+    adjustments, explanations = _suggest_from_actions(snapshot, actions)
+
+    if findings:
+        summary = "Rule-based check: " + "; ".join(text for _, text in findings[:3]) + "."
+    else:
+        summary = "Rule-based check: risk, liquidity and allocation are within configured limits."
+    if adjustments:
+        summary += f" {len(actions)} rebalancing transfer(s) suggested."
+
+    return AgentOutput(
+        verdict=verdict,
+        summary=summary,
+        suggested_adjustments=adjustments,
+        explanations=explanations,
+        confidence=RULE_CONFIDENCE
+    )
@@ -0,0 +1,168 @@
+import logging
+import numpy as np
+
+from decimal import Decimal
+from typing import Dict, List, Mapping, Sequence, Tuple
+from models import AssetSnapshot, ActionType, SimulationAction, SimulationObjective
+from calculator import (
+    BatchValuation,
+    ValuationPlan,
+    get_valuation_plan,
+    holdings_matrix,
+    rates_matrix,
+    valuate_holdings
+)
+from allocation_engine import allocation_drift_matrix
+from utils import get_asset_info, get_usd_value
+
+def apply_actions(
+    snapshot: AssetSnapshot,
+    actions: Sequence[SimulationAction],
+    rates: Mapping[str, Decimal]
+) -> Tuple[AssetSnapshot, List[str]]:
+    """在快照的深拷贝上依次应用 ADJUST / TRANSFER 操作, 返回模拟快照与操作日志"""
+    simulated_snapshot = snapshot.model_copy(deep=True)
+
+    simulation_logs = [] # 用于记录转换过程
+
+    for action in actions:
+        if action.type == ActionType.ADJUST:
+            if hasattr(simulated_snapshot, action.from_field):
+                old_val = getattr(simulated_snapshot, action.from_field) or Decimal('0')
+                new_val = Decimal(old_val) + action.amount
+                if new_val < 0: new_val = Decimal('0')
+                setattr(simulated_snapshot, action.from_field, new_val)
+
+                name = get_asset_info(action.from_field)['name']
+                # :+ 是什么含义呢
+                simulation_logs.append(f"Adjusted {name} by {action.amount:+}")
+            else:
+                logging.warning(f"Field: {action.from_field} not found")
+        elif action.type == ActionType.TRANSFER:
+            if not action.to_field:
+                continue
+
+            field_src = action.from_field
+            field_dst = action.to_field
+            missing = [f for f in (field_src, field_dst) if not hasattr(simulated_snapshot, f)]
+            if missing:
+                # 与 apply_actions_vector 一致: 未知字段的操作跳过并记录
+                logging.warning(f"Field: {', '.join(missing)} not found")
+                continue
+
+            info_src = get_asset_info(field_src)
+            info_dst = get_asset_info(field_dst)
+
+            src_balance = getattr(simulated_snapshot, field_src) or Decimal('0')
+            transfer_amount = Decimal(abs(action.amount))
+            src_balance = Decimal(src_balance)
+            logging.info(f"field_src: {field_src}, field_dst: {field_dst}, info_src: {info_src}, info_dst: {info_dst}, src_balance:{src_balance}, transfer_amount {transfer_amount}")
+
+            setattr(simulated_snapshot, field_src, src_balance - transfer_amount)
+
+            rate_src = rates.get(info_src['currency'], Decimal('0'))
+            rate_dst = rates.get(info_dst['currency'], Decimal('0'))
+
+            scale_src = Decimal(str(info_src['unit_scale']))
+            scale_dst = Decimal(str(info_dst['unit_scale']))
+
+            if rate_dst > 0:
+                value_in_usd = get_usd_value(transfer_amount, scale_src, rate_src)
+
+                amount_dst = value_in_usd * rate_dst / scale_dst
+                dst_balance = getattr(simulated_snapshot, field_dst) or Decimal('0')
+                setattr(simulated_snapshot, field_dst, Decimal(dst_balance) + Decimal(amount_dst))
+
+                log_msg = (
+                    f"划转: {info_src['name']} ({transfer_amount}) -> {info_dst['name']} ({amount_dst:.4f})"
+                )
+                simulation_logs.append(log_msg)
+
+    return simulated_snapshot, simulation_logs
+
+def apply_actions_vector(
+    base_holdings: np.ndarray,
+    actions: Sequence[SimulationAction],
+    rates: Mapping[str, Decimal],
+    plan: ValuationPlan
+) -> np.ndarray:
+    """
+    apply_actions 的向量版本: 把一组操作作为增量应用到持仓向量(字段顺序同 plan.fields)。
+    语义与 apply_actions 一致: ADJUST 结果不低于 0, TRANSFER 按汇率折算到目标字段。
+    """
+    holdings = np.array(base_holdings, dtype=np.float64)
+    columns = {field: i for i, field in enumerate(plan.fields)}
+
+    for action in actions:
+        src = columns.get(action.from_field)
+        if src is None:
+            logging.warning(f"Field: {action.from_field} not found")
+            continue
+
+        if action.type == ActionType.ADJUST:
+            holdings[src] = max(holdings[src] + float(action.amount), 0.0)
+        elif action.type == ActionType.TRANSFER:
+            if not action.to_field:
+                continue
+            dst = columns.get(action.to_field)
+            if dst is None:
+                logging.warning(f"Field: {action.to_field} not found")
+                continue
+
+            info_src = get_asset_info(action.from_field)
+            info_dst = get_asset_info(action.to_field)
+            transfer_amount = abs(float(action.amount))
+            holdings[src] -= transfer_amount
+
+            rate_src = float(rates.get(info_src['currency'], 0))
+            rate_dst = float(rates.get(info_dst['currency'], 0))
+            if rate_dst > 0 and rate_src != 0:
+                value_in_usd = transfer_amount * float(info_src['unit_scale']) / rate_src
+                holdings[dst] += value_in_usd * rate_dst / float(info_dst['unit_scale'])
+
+    return holdings
+
+def evaluate_candidates(
+    base_snapshot: AssetSnapshot,
+    candidate_actions: Sequence[Sequence[SimulationAction]],
+    rates: Mapping[str, Decimal],
+    btc_risk_score: Decimal,
+    objective: SimulationObjective,
+    target_map: Dict[str, Decimal]
+) -> Tuple[BatchValuation, np.ndarray, np.ndarray]:
+    """
+    一次向量化估值对比多组候选操作。
+    第 0 行为基准组合, 第 i 行为第 i-1 个候选方案。
+    返回 (批量估值, 最大配置偏差, 目标函数得分), 得分越小越好。
+    """
+    plan = get_valuation_plan()
+    base = holdings_matrix([base_snapshot], plan)[0]
+    holdings = np.vstack([base] + [apply_actions_vector(base, actions, rates, plan) for actions in candidate_actions])
+
+    valuation = valuate_holdings(holdings, rates_matrix(rates, len(holdings), plan), btc_risk_score, plan)
+    drift = allocation_drift_matrix(valuation.currency_distribution(), plan.currencies, target_map)
+    max_drift = np.abs(drift).max(axis=1)
+
+    if objective == SimulationObjective.RISK:
+        scores = valuation.weighted_risk_score
+    elif objective == SimulationObjective.LIQUIDITY:
+        scores = -valuation.available_liquidity_ratio
+    else:
+        scores = max_drift
+    return valuation, max_drift, scores
+
+def allocation_drift_before_after(
+    base_snapshot: AssetSnapshot,
+    actions: Sequence[SimulationAction],
+    rates: Mapping[str, Decimal],
+    target_map: Dict[str, Decimal]
+) -> Tuple[Dict[str, float], Dict[str, float]]:
+    """应用操作前后各配置类别的偏差(%), 用于校验再平衡方案"""
+    plan = get_valuation_plan()
+    base = holdings_matrix([base_snapshot], plan)[0]
+    holdings = np.vstack([base, apply_actions_vector(base, actions, rates, plan)])
+    valuation = valuate_holdings(holdings, rates_matrix(rates, 2, plan), plan=plan)
+    drift = allocation_drift_matrix(valuation.currency_distribution(), plan.currencies, target_map)
+    before, after = ({k: round(float(v), 2) for k, v in zip(target_map, row)} for row in drift)
+    return before, after
+
@@ -0,0 +1,94 @@
+import os
+import time
+import logging
+
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict
+from models import AssetSnapshot, AssetResults, AgentOutput
+from jobs import job_handler, enqueue_job, run_step, POST_UPDATE_JOB, VECTOR_COMPACTION_JOB
+from vector_store import get_asset_vector_db
+from report_retrieval import report_ts, retrieve_report_context
+from vector_retention import compact_vector_store, should_schedule_compaction
+from agent import analyze_snapshot_and_results, snapshot_to_dict, results_to_agent_dict
+from onchain_analyzer import generate_btc_onchain_report
+from report_writer import generate_report, save_report
+
+def store_vector_report(report_text: str, metadata: dict, app_mode: str):
+    if app_mode != "private":
+        logging.info("Public mode: skip vector storage")
+        return
+    # 写入时间: 保留策略在同一天的多份报告中保留最新写入的一份
+    metadata = {**metadata, "created_at": time.time()}
+    if "report_date" in metadata:
+        # 数值时间戳供日期范围过滤使用(Chroma 的 where 只支持数值比较)
+        metadata["report_ts"] = report_ts(metadata["report_date"])
+    # 异常向上抛出, 由任务重试; 写入缓冲后的 flush 失败由 AssetVectorDB 自行重试
+    get_asset_vector_db().add_report(report_text=report_text, metadata=metadata)
+
+@job_handler(POST_UPDATE_JOB)
+def post_update_task(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    /update_assets 响应之后的慢任务: 链上报告、向量库写入、LLM 分析、报告文件。
+    返回 message 与 report_path, 供 /jobs/{job_id} 查询。
+    每一步通过 run_step 记录完成状态, 重试时跳过已完成的步骤(不会重复调用 LLM)。
+    """
+    data = AssetSnapshot.model_validate_json(payload["snapshot"])
+    results = AssetResults.model_validate_json(payload["results"])
+    btc_risk_score = Decimal(payload["btc_risk_score"])
+    formatted_strategy_text = payload["strategy_text"]
+    app_mode = payload["app_mode"]
+
+    market_report_text = run_step("market_report", generate_btc_onchain_report)
+    logging.info(f"Market Report Generatedd: {market_report_text.strip()}")
+
+    run_step("store_market_report", store_vector_report, market_report_text, {
+        "report_date": data.snapshot_date.strftime("%Y-%m-%d"),
+        "source": "market_sentiment",
+        "type": "btc_fng"
+    }, app_mode)
+
+    report_content = generate_report(data, results)
+
+    snapshot_dict = snapshot_to_dict(data)
+    results_dict = results_to_agent_dict(results, btc_risk_score, formatted_strategy_text)
+    context = {
+        "note": "automated analysis", 
+        "date": datetime.utcnow().isoformat(),
+        "market_sentiment_analysis": market_report_text,
+        "user_intent": "User is actively DCAing into BTC.",
+        "fx_market_status": "Analyst provided strategic rebalancing advice based on FX valuation.",
+        "rebalance_actions": [action.model_dump(mode="json") for action in results.rebalance_actions]
+    }
+
+    def analyze() -> Dict[str, Any]:
+        if app_mode == "private":
+            # 与本次报告最相似的历史报告(不含当天), 供 Agent 对比趋势
+            context["past_reports"] = retrieve_report_context(report_content, before=data.snapshot_date.date())
+        return analyze_snapshot_and_results(snapshot_dict, results_dict, context=context).model_dump()
+
+    agent_out = AgentOutput.model_validate(run_step("agent", analyze))
+
+    run_step("store_report", store_vector_report, report_content, {
+        "report_date": data.snapshot_date.strftime("%Y-%m-%d"),
+        "total_assets": float(results.total_assets_usd),
+        "risk_score": float(results.weighted_risk_score),
+        "btc_ratio": float(results.btc_ratio),
+        "source": "automated_update"
+    }, app_mode)
+
+    filepath = run_step("save_report", save_report, report_content)
+
+    if app_mode == "private" and should_schedule_compaction():
+        enqueue_job(VECTOR_COMPACTION_JOB, {})
+
+    return {
+        "report_path": os.path.basename(filepath),
+        "message": f"{agent_out.summary}\n\n【量化策略建议】:\n{formatted_strategy_text}",
+        "agent": agent_out.model_dump()
+    }
+
+@job_handler(VECTOR_COMPACTION_JOB)
+def vector_compaction_task(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """按保留策略清理向量库并压缩, 由 post_update 每天最多触发一次, 或通过 /vector/compact 手动触发"""
+    return compact_vector_store(dry_run=bool(payload.get("dry_run", False)))
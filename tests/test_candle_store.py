@@ -0,0 +1,123 @@
+"""
+CandleStore 增量同步测试: 用保存的 Kraken 响应(fixture_fetcher)和本地桩 HTTP 服务代替 Kraken。
+
+    python -m pytest tests
+"""
+import json
+import threading
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from candle_store import CandleStore, fetch_kraken_ohlc, fixture_fetcher
+
+PAIR = "XBTUSD"
+
+def kraken_response(rows, last):
+    """Kraken OHLC 响应格式: 数值字段为字符串, 最后一行是未收盘 K 线"""
+    return {
+        "error": [],
+        "result": {
+            "XXBTZUSD": [[t, str(c), str(c), str(c), str(c), str(c), "1.0", 1] for t, c in rows],
+            "last": last
+        }
+    }
+
+class CountingFetcher:
+    def __init__(self, fetch):
+        self.fetch = fetch
+        self.calls = []
+
+    def __call__(self, pair, interval_minutes, since=None):
+        self.calls.append(since)
+        return self.fetch(pair, interval_minutes, since)
+
+@pytest.fixture
+def fixture_path(tmp_path):
+    path = tmp_path / "kraken_ohlc.json"
+    rows = [(60 * i, 100.0 + i) for i in range(1, 6)]
+    path.write_text(json.dumps(kraken_response(rows, last=240)), encoding="utf-8")
+    return str(path)
+
+def test_fixture_sync_keeps_open_candle_provisional(fixture_path):
+    store = CandleStore(":memory:", pair=PAIR, interval_minutes=1, fetcher=fixture_fetcher(fixture_path))
+
+    assert store.sync() == 5
+    assert store.closes().tolist() == [101.0, 102.0, 103.0, 104.0, 105.0]
+    assert store.closes(2).tolist() == [104.0, 105.0]
+    assert len(store) == 5
+
+def test_fresh_store_does_not_fetch(fixture_path):
+    fetcher = CountingFetcher(fixture_fetcher(fixture_path))
+    store = CandleStore(":memory:", pair=PAIR, interval_minutes=1, fetcher=fetcher)
+
+    store.sync()
+    assert store.is_fresh()
+    assert store.sync() == 0
+    assert fetcher.calls == [None]
+
+    assert store.sync(force=True) == 1          # since=240 只返回未收盘的那一根
+    assert fetcher.calls == [None, 240]
+    assert store.closes().tolist() == [101.0, 102.0, 103.0, 104.0, 105.0]
+
+def test_reopen_restores_window_without_network(tmp_path, fixture_path):
+    path = str(tmp_path / "candles.sqlite3")
+    CandleStore(path, pair=PAIR, interval_minutes=1, fetcher=fixture_fetcher(fixture_path)).sync()
+
+    def offline(*args):
+        raise AssertionError("fresh store must not call Kraken")
+
+    reopened = CandleStore(path, pair=PAIR, interval_minutes=1, fetcher=offline)
+    assert reopened.is_fresh()
+    assert reopened.sync() == 0
+    assert reopened.closes().tolist() == [101.0, 102.0, 103.0, 104.0, 105.0]
+
+@pytest.fixture
+def kraken_stub():
+    """按 since 返回不同页面的桩服务: 第二页把上一页未收盘的 K 线收盘并追加一根新的未收盘 K 线"""
+    pages = {
+        None: kraken_response([(60, 100.0), (120, 110.0), (180, 115.0)], last=120),
+        "120": kraken_response([(180, 120.0), (240, 125.0)], last=180)
+    }
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            since = query.get("since", [None])[0]
+            requests_seen.append(since)
+            body = json.dumps(pages[since]).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/0/public/OHLC", requests_seen
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_incremental_sync_against_stub_server(kraken_stub):
+    url, requests_seen = kraken_stub
+
+    def fetch(pair, interval_minutes, since=None):
+        return fetch_kraken_ohlc(pair, interval_minutes, since, url=url)
+
+    store = CandleStore(":memory:", pair=PAIR, interval_minutes=1, fetcher=fetch)
+    assert store.sync() == 3
+    assert store.closes().tolist() == [100.0, 110.0, 115.0]
+
+    assert store.sync(force=True) == 2
+    assert requests_seen == [None, "120"]
+    # 180 已收盘(115 -> 120), 240 成为新的未收盘 K 线
+    assert store.closes().tolist() == [100.0, 110.0, 120.0, 125.0]
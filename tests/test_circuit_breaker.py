@@ -0,0 +1,47 @@
+"""
+CircuitBreaker 测试: half-open 时只放行一个试探调用。
+
+    python -m pytest tests
+"""
+import time
+
+from pipeline import CircuitBreaker
+
+def opened_breaker(reset_timeout=0.05):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=reset_timeout)
+    breaker.record_failure(breaker.allow())
+    return breaker
+
+def test_open_breaker_rejects_until_reset_timeout():
+    breaker = opened_breaker(reset_timeout=60)
+    assert breaker.state == "open"
+    assert breaker.allow() is None
+
+def test_call_admitted_before_opening_cannot_release_the_probe():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+    early = breaker.allow()
+    breaker.record_failure(breaker.allow())
+    time.sleep(0.06)
+
+    probe = breaker.allow()
+    assert probe is not None
+    breaker.release(early)
+    assert breaker.allow() is None
+
+    breaker.release(probe)
+    assert breaker.allow() is not None
+
+def test_probe_outcome_closes_or_reopens():
+    breaker = opened_breaker()
+    time.sleep(0.06)
+    probe = breaker.allow()
+    breaker.record_failure(probe)
+    breaker.release(probe)
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    probe = breaker.allow()
+    breaker.record_success(probe)
+    breaker.release(probe)
+    assert breaker.state == "closed"
+    assert breaker.allow() is not None
@@ -0,0 +1,49 @@
+"""
+report_ts 补写测试: 没有 report_ts 的旧报告补写后能被日期范围过滤检索到。
+
+    python -m pytest tests
+"""
+from datetime import date
+
+from report_retrieval import backfill_report_ts, build_where, report_ts
+from vector_backends import NumpyBackend
+
+def legacy_store(path):
+    backend = NumpyBackend(str(path))
+    backend.add(
+        ids=["a", "b", "c"],
+        texts=["report a", "report b", "no date"],
+        embeddings=[[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]],
+        metadatas=[
+            {"report_date": "2026-01-05", "source": "automated_update"},
+            {"report_date": "2026-02-10", "source": "automated_update", "report_ts": report_ts("2026-02-10")},
+            {"source": "automated_update"}
+        ]
+    )
+    return backend
+
+def test_backfill_makes_legacy_reports_match_date_filters(tmp_path):
+    backend = legacy_store(tmp_path)
+    where = build_where(date_from=date(2026, 1, 1), date_to=date(2026, 1, 31))
+    assert backend.search([1.0, 0.0], k=3, where=where) == []
+
+    assert backfill_report_ts(backend) == 1
+    hits = backend.search([1.0, 0.0], k=3, where=where)
+    assert [(h.id, h.page_content, h.metadata["report_ts"]) for h in hits] == [
+        ("a", "report a", report_ts("2026-01-05"))
+    ]
+    assert backend.count() == 3
+    assert backfill_report_ts(backend) == 0
+
+def test_backfilled_rows_survive_reopen_and_compaction(tmp_path):
+    backfill_report_ts(legacy_store(tmp_path))
+
+    reopened = NumpyBackend(str(tmp_path))
+    assert reopened.count() == 3
+    assert sorted(i for i, _ in reopened.documents()) == ["a", "b", "c"]
+    assert reopened.compact() == {"removed": 1, "documents": 3}
+
+    hits = reopened.search([1.0, 0.0], k=1, where={"report_ts": {"$lte": report_ts("2026-01-31")}})
+    assert [(h.id, h.page_content) for h in hits] == [("a", "report a")]
+    assert reopened.delete(["a"]) == 1
+    assert reopened.count() == 2
@@ -0,0 +1,58 @@
+"""
+保留策略测试: 同一来源、同一时间桶内保留最新写入的报告。
+
+    python -m pytest tests
+"""
+from datetime import date
+
+from vector_retention import RetentionPolicy, plan_retention
+
+TODAY = date(2026, 3, 31)
+
+def report(report_date, created_at=None, source="automated_update"):
+    metadata = {"report_date": report_date, "source": source}
+    if created_at is not None:
+        metadata["created_at"] = created_at
+    return metadata
+
+def test_same_day_keeps_latest_write_regardless_of_id():
+    # id 是内容哈希, 与写入顺序无关
+    for first, second in (("ffff", "0000"), ("0000", "ffff")):
+        documents = [
+            (first, report("2026-03-30", created_at=1000.0)),
+            (second, report("2026-03-30", created_at=2000.0))
+        ]
+        keep, delete = plan_retention(documents, RetentionPolicy(), TODAY)
+        assert keep == [second]
+        assert delete == [first]
+
+def test_legacy_report_without_created_at_loses_to_stamped_one():
+    documents = [
+        ("ffff", report("2026-03-30")),
+        ("0000", report("2026-03-30", created_at=1000.0))
+    ]
+    keep, delete = plan_retention(documents, RetentionPolicy(), TODAY)
+    assert keep == ["0000"]
+    assert delete == ["ffff"]
+
+def test_buckets_are_per_source_and_undated_reports_are_kept():
+    documents = [
+        ("a", report("2026-03-30", created_at=1.0, source="market_sentiment")),
+        ("b", report("2026-03-30", created_at=2.0)),
+        ("c", {"source": "automated_update"})
+    ]
+    keep, delete = plan_retention(documents, RetentionPolicy(), TODAY)
+    assert sorted(keep) == ["a", "b", "c"]
+    assert delete == []
+
+def test_older_reports_collapse_to_latest_in_week_and_month():
+    policy = RetentionPolicy(daily_days=2, weekly_days=10)
+    documents = [
+        ("w1", report("2026-03-23", created_at=1.0)),      # 同一 ISO 周
+        ("w2", report("2026-03-25", created_at=2.0)),
+        ("m1", report("2026-01-05", created_at=3.0)),      # 同一个月
+        ("m2", report("2026-01-20", created_at=4.0))
+    ]
+    keep, delete = plan_retention(documents, policy, TODAY)
+    assert sorted(keep) == ["m2", "w2"]
+    assert sorted(delete) == ["m1", "w1"]
@@ -4,6 +4,11 @@ import schedule
 import time
 import os
 
+from config import RATES_VERSION_KEY, RATES_CHANNEL
+from rate_history import append_rates_entry, to_timestamp
+from risk_factors import refresh_risk_factors
+from risk_model import refresh_risk_model
+
 # Redis配置
 REDIS_HOST = 'localhost'
 REDIS_PORT = 6379
@@ -30,12 +35,35 @@ def fetch_and_store_rates():
             decode_responses=True  # 自动将响应解码为字符串
         )
         
-        # 存储/更新数据
+        # 存储/更新数据: 在一个事务中写入全部汇率并递增版本号, 读者不会看到一半更新的汇率
+        pipe = r.pipeline(transaction=True)
         for currency, details in data['data'].items():
             # 使用currency code作为key, value作为值
-            r.set(details['code'], details['value'])
+            pipe.set(details['code'], details['value'])
+        # 同一事务内追加带时间戳的历史记录, 供历史估值与回测使用
+        append_rates_entry(
+            pipe,
+            to_timestamp(data['meta']['last_updated_at']),
+            {details['code']: details['value'] for details in data['data'].values()}
+        )
+        pipe.incr(RATES_VERSION_KEY)
+        version = pipe.execute()[-1]
+
+        # 新汇率进入历史后重算全部资产的动态风险因子(一次向量化计算)
+        try:
+            refresh_risk_factors(r)
+        except Exception as e:
+            print(f"风险因子刷新失败: {e}")
+        # 协方差风险模型随汇率更新定期重新估计
+        try:
+            refresh_risk_model(r)
+        except Exception as e:
+            print(f"风险模型刷新失败: {e}")
+
+        # 通知各 worker 进程刷新进程内的汇率快照
+        r.publish(RATES_CHANNEL, version)
             
-        print(f"数据更新成功! 更新时间: {data['meta']['last_updated_at']}")
+        print(f"数据更新成功! 版本: {version} 更新时间: {data['meta']['last_updated_at']}")
         
     except requests.exceptions.RequestException as e:
         print(f"API请求失败: {e}")
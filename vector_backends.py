@@ -0,0 +1,597 @@
+"""
+AssetVectorDB 的存储后端。
+
+后端只负责存取已经算好的向量, 嵌入由 AssetVectorDB 统一计算(经过嵌入缓存):
+- ChromaBackend: 原来的 Chroma 持久化集合
+- NumpyBackend: 进程内 memmap 矩阵, 精确余弦 top-k, 先按元数据过滤再扫描, 只追加写入
+
+过滤条件使用 Chroma 的 where 语法子集: {"field": value}, {"field": {"$gte": x, "$lt": y}},
+以及 $and / $or, 两个后端行为一致。
+"""
+import gc
+import os
+import json
+import fcntl
+import threading
+import numpy as np
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+Where = Dict[str, Any]
+
+@dataclass
+class SearchHit:
+    # 字段名与 langchain Document 一致, 调用方可以按原来的方式读取
+    id: str
+    page_content: str
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    score: float = 0.0      # 余弦相似度
+
+class VectorBackend:
+    name = "base"
+
+    def existing_ids(self, ids: List[str]) -> Set[str]:
+        raise NotImplementedError
+
+    def add(self, ids: List[str], texts: List[str], embeddings: List[List[float]],
+            metadatas: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    def search(self, embedding: List[float], k: int = 3, where: Optional[Where] = None) -> List[SearchHit]:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def documents(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """所有文档的 (id, 元数据), 供保留策略挑选要删除的文档"""
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]) -> int:
+        raise NotImplementedError
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> int:
+        """替换已有文档的元数据(向量与正文不变), 返回更新的数量"""
+        raise NotImplementedError
+
+    def compact(self) -> Dict[str, Any]:
+        """删除之后回收空间 / 重建索引"""
+        raise NotImplementedError
+
+    def disk_bytes(self) -> int:
+        raise NotImplementedError
+
+    def storage_stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "documents": self.count(), "disk_bytes": self.disk_bytes()}
+
+class ChromaBackend(VectorBackend):
+    name = "chroma"
+
+    def __init__(self, directory: str, collection: str = "asset_reports"):
+        import chromadb
+
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.collection_name = collection
+        self.rebuild_name = collection + "__rebuild"
+        # 与 NumpyBackend 相同的跨进程写锁: 写入、删除、重建与启动恢复互斥,
+        # 其他进程打开存储时不会动正在进行的重建
+        self.lock_path = os.path.join(directory, ".lock")
+        self.client = chromadb.PersistentClient(path=directory)
+        with self._file_lock():
+            names = {c if isinstance(c, str) else c.name for c in self.client.list_collections()}
+            if self.rebuild_name in names:
+                if collection in names:
+                    # 上次重建未完成, 旧集合仍然完整
+                    self.client.delete_collection(self.rebuild_name)
+                else:
+                    # 旧集合已删除但改名前退出, 重建结果是完整的
+                    self.client.get_collection(self.rebuild_name).modify(name=collection)
+            # 与之前 langchain_chroma 创建的集合同名, 已有数据直接沿用
+            self.client.get_or_create_collection(collection)
+
+    def _file_lock(self):
+        return _FileLock(self.lock_path)
+
+    @property
+    def collection(self):
+        # 每次按名称获取: 其他进程重建集合后 id 会变化
+        try:
+            return self.client.get_collection(self.collection_name)
+        except Exception:
+            # 重建过程中旧集合删除到新集合改名之间的短暂窗口
+            return self.client.get_collection(self.rebuild_name)
+
+    def existing_ids(self, ids: List[str]) -> Set[str]:
+        return set(self.collection.get(ids=ids, include=[])["ids"])
+
+    def add(self, ids, texts, embeddings, metadatas):
+        with self._file_lock():
+            self.collection.add(ids=ids, embeddings=embeddings, metadatas=metadatas or None, documents=texts)
+
+    def search(self, embedding, k=3, where=None):
+        if self.count() == 0:
+            return []
+        res = self.collection.query(
+            query_embeddings=[embedding], n_results=k, where=where or None,
+            include=["documents", "metadatas", "distances"]
+        )
+        # 默认 l2 空间, 返回平方距离; MiniLM 输出已归一化, 余弦相似度 = 1 - d / 2
+        return [
+            SearchHit(id=i, page_content=doc, metadata=meta or {}, score=1.0 - float(dist) / 2.0)
+            for i, doc, meta, dist in zip(res["ids"][0], res["documents"][0], res["metadatas"][0], res["distances"][0])
+        ]
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def documents(self):
+        data = self.collection.get(include=["metadatas"])
+        return [(i, meta or {}) for i, meta in zip(data["ids"], data["metadatas"])]
+
+    def delete(self, ids):
+        with self._file_lock():
+            existing = list(self.existing_ids(ids)) if ids else []
+            for start in range(0, len(existing), 500):
+                self.collection.delete(ids=existing[start:start + 500])
+        return len(existing)
+
+    def update_metadata(self, ids, metadatas):
+        with self._file_lock():
+            for start in range(0, len(ids), 500):
+                self.collection.update(ids=ids[start:start + 500], metadatas=metadatas[start:start + 500])
+        return len(ids)
+
+    def compact(self, page_size: int = 1000):
+        """
+        删除只会在 HNSW 索引中打标记, 文件不会变小。把存活文档复制到新集合(重新建索引),
+        删除旧集合后改回原名。全程持有写锁, 复制期间其他进程的写入等待重建完成后写入新集合。
+        """
+        with self._file_lock():
+            old = self.client.get_collection(self.collection_name)
+            try:
+                self.client.delete_collection(self.rebuild_name)
+            except Exception:
+                pass
+            new = self.client.create_collection(self.rebuild_name, metadata=old.metadata or None)
+            offset = 0
+            while True:
+                page = old.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+                if not page["ids"]:
+                    break
+                new.add(ids=page["ids"], embeddings=page["embeddings"],
+                        documents=page["documents"], metadatas=page["metadatas"])
+                offset += len(page["ids"])
+            self.client.delete_collection(self.collection_name)
+            new.modify(name=self.collection_name)
+        return {"removed": 0, "documents": offset}
+
+    def disk_bytes(self) -> int:
+        return _directory_size(self.directory)
+
+class NumpyBackend(VectorBackend):
+    """
+    目录布局(同一代内全部只追加):
+    - vectors[.G].f32     N x dim 的 float32 行(写入前已归一化)
+    - texts[.G].bin       UTF-8 正文拼接
+    - records[.G].jsonl   每行 {"id", "metadata", "offset", "length", "dim"}; 写完这一行才算提交
+    - tombstones[.G].txt  已删除的行号, 每行一个(按行而不是按 id: 删除后重新写入的相同 id 是新的一行)
+    - CURRENT             当前代号 G(缺省为 0, 对应不带代号的文件名)
+
+    打开时只读取 records 并 memmap 向量文件, 正文按偏移按需读取。
+    删除只追加墓碑; 更新元数据把该文档作为新的一行重新追加, 同一 id 只有最新的一行存活;
+    compact() 把存活的行写成新一代文件, 再原子替换 CURRENT。
+    其他进程追加的记录、墓碑和新一代文件在下一次访问前增量加载。
+    """
+    name = "numpy"
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.current_path = os.path.join(directory, "CURRENT")
+        self.lock_path = os.path.join(directory, ".lock")
+        self._lock = threading.RLock()
+        self.generation = -1
+        with self._file_lock():
+            self._switch_generation(self._read_generation())
+            self._repair()
+        self._load_new_records()
+
+    def _file_lock(self):
+        return _FileLock(self.lock_path)
+
+    def _read_generation(self) -> int:
+        try:
+            with open(self.current_path, "r") as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _paths(self, generation: int) -> Dict[str, str]:
+        suffix = f".{generation}" if generation else ""
+        return {
+            "vectors": os.path.join(self.directory, f"vectors{suffix}.f32"),
+            "texts": os.path.join(self.directory, f"texts{suffix}.bin"),
+            "records": os.path.join(self.directory, f"records{suffix}.jsonl"),
+            "tombstones": os.path.join(self.directory, f"tombstones{suffix}.txt")
+        }
+
+    def _switch_generation(self, generation: int):
+        """切换到指定代的文件并清空内存中的状态(之后由 _load_new_records 重新加载)"""
+        paths = self._paths(generation)
+        for path in paths.values():
+            open(path, "ab").close()
+        self.generation = generation
+        self.vectors_path = paths["vectors"]
+        self.texts_path = paths["texts"]
+        self.records_path = paths["records"]
+        self.tombstones_path = paths["tombstones"]
+        self.dim: Optional[int] = None
+        self.ids: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self.spans: List[tuple] = []
+        self._index: Dict[str, int] = {}
+        self._deleted: Set[int] = set()        # 已删除的行号
+        self._records_offset = 0
+        self._tombstones_offset = 0
+        self._vectors: Optional[np.ndarray] = None
+        self._alive: Optional[np.ndarray] = None
+        self._columns: Dict[str, np.ndarray] = {}
+
+    def _repair(self):
+        """
+        截掉未提交的尾部(写入过程中进程退出): 以 records 中最后一个完整行为准。
+        """
+        with open(self.records_path, "rb") as f:
+            data = f.read()
+        committed = data.rfind(b"\n") + 1
+        if committed != len(data):
+            os.truncate(self.records_path, committed)
+        lines = data[:committed].splitlines()
+        rows, text_end, dim = len(lines), 0, None
+        if lines:
+            last = json.loads(lines[-1])
+            text_end = last["offset"] + last["length"]
+            dim = last.get("dim")
+        vector_end = rows * dim * 4 if dim else 0
+        if os.path.getsize(self.vectors_path) > vector_end:
+            os.truncate(self.vectors_path, vector_end)
+        if os.path.getsize(self.texts_path) > text_end:
+            os.truncate(self.texts_path, text_end)
+
+    def _load_new_records(self):
+        """读取上次之后新增的记录与墓碑, 并重新 memmap 向量文件; 其他进程完成压缩后切换到新一代"""
+        with self._lock:
+            generation = self._read_generation()
+            if generation != self.generation:
+                self._switch_generation(generation)
+
+            size = os.path.getsize(self.tombstones_path)
+            if size > self._tombstones_offset:
+                with open(self.tombstones_path, "rb") as f:
+                    f.seek(self._tombstones_offset)
+                    data = f.read(size - self._tombstones_offset)
+                data = data[:data.rfind(b"\n") + 1]
+                self._deleted.update(int(row) for row in data.split())
+                self._tombstones_offset += len(data)
+                self._alive = None
+
+            size = os.path.getsize(self.records_path)
+            if size <= self._records_offset:
+                return
+            with open(self.records_path, "rb") as f:
+                f.seek(self._records_offset)
+                data = f.read(size - self._records_offset)
+            data = data[:data.rfind(b"\n") + 1]
+            if not data:
+                return
+            # 整段作为一个 JSON 数组解析, 比逐行 json.loads 快数倍; 解析期间暂停 GC(大量小 dict)
+            gc.disable()
+            try:
+                records = json.loads(b"[" + data[:-1].replace(b"\n", b",") + b"]")
+            finally:
+                gc.enable()
+            self.dim = self.dim or records[0]["dim"]
+            start = len(self.ids)
+            self.ids.extend(rec["id"] for rec in records)
+            self.metadatas.extend(rec["metadata"] for rec in records)
+            self.spans.extend((rec["offset"], rec["length"]) for rec in records)
+            self._index.update((doc_id, start + i) for i, doc_id in enumerate(self.ids[start:]))
+            self._records_offset += len(data)
+            self._columns = {}
+            self._alive = None
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r",
+                                      shape=(len(self.ids), self.dim))
+
+    def _alive_mask(self) -> np.ndarray:
+        if self._alive is None:
+            # 同一 id 的旧行已被 update_metadata 取代
+            alive = np.zeros(len(self.ids), dtype=bool)
+            alive[np.fromiter(self._index.values(), dtype=np.intp, count=len(self._index))] = True
+            alive[[row for row in self._deleted if row < len(alive)]] = False
+            self._alive = alive
+        return self._alive
+
+    def _committed_text_end(self) -> int:
+        if not self.spans:
+            return 0
+        offset, length = self.spans[-1]
+        return offset + length
+
+    def _truncate_uncommitted(self):
+        """
+        持有文件锁且已加载全部已提交记录时调用: 截掉其他写入进程中途退出留下的向量 / 正文尾部,
+        否则之后追加的行会错位。
+        """
+        vector_end = len(self.ids) * self.dim * 4 if self.dim else 0
+        if os.path.getsize(self.vectors_path) > vector_end:
+            os.truncate(self.vectors_path, vector_end)
+        text_end = self._committed_text_end()
+        if os.path.getsize(self.texts_path) > text_end:
+            os.truncate(self.texts_path, text_end)
+        if os.path.getsize(self.records_path) > self._records_offset:
+            os.truncate(self.records_path, self._records_offset)
+
+    def _live_row(self, doc_id: str) -> Optional[int]:
+        """id 当前存活的行; _index 指向该 id 最新写入的行"""
+        row = self._index.get(doc_id)
+        return None if row is None or row in self._deleted else row
+
+    def existing_ids(self, ids):
+        self._load_new_records()
+        with self._lock:
+            return {i for i in ids if self._live_row(i) is not None}
+
+    def add(self, ids, texts, embeddings, metadatas):
+        if not ids:
+            return
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms > 0, norms, 1.0)
+
+        with self._lock, self._file_lock():
+            self._load_new_records()
+            if self.dim is not None and matrix.shape[1] != self.dim:
+                raise ValueError(f"Embedding dim {matrix.shape[1]} does not match index dim {self.dim}")
+            self._truncate_uncommitted()
+            # 其他进程可能已经写入了相同的 id
+            fresh, batch_ids = [], set()
+            for row, doc_id in enumerate(ids):
+                if self._live_row(doc_id) is None and doc_id not in batch_ids:
+                    fresh.append((row, doc_id))
+                    batch_ids.add(doc_id)
+            if not fresh:
+                return
+            matrix = matrix[[row for row, _ in fresh]]
+            # 偏移以已提交的记录为准, 而不是文件当前大小
+            offset = self._committed_text_end()
+            records = []
+            with open(self.texts_path, "ab") as f:
+                for row, doc_id in fresh:
+                    text, meta = texts[row], metadatas[row]
+                    encoded = text.encode("utf-8")
+                    f.write(encoded)
+                    records.append({"id": doc_id, "metadata": meta, "offset": offset,
+                                    "length": len(encoded), "dim": int(matrix.shape[1])})
+                    offset += len(encoded)
+            self._append_rows(matrix, records)
+        self._load_new_records()
+
+    def _append_rows(self, matrix: np.ndarray, records: List[Dict[str, Any]],
+                     paths: Optional[Dict[str, str]] = None):
+        paths = paths or self._paths(self.generation)
+        with open(paths["vectors"], "ab") as f:
+            f.write(matrix.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        with open(paths["records"], "ab") as f:
+            f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def delete(self, ids: List[str]) -> int:
+        with self._lock, self._file_lock():
+            self._load_new_records()
+            if os.path.getsize(self.tombstones_path) > self._tombstones_offset:
+                os.truncate(self.tombstones_path, self._tombstones_offset)
+            doomed = {row for row in map(self._live_row, ids) if row is not None}
+            if doomed:
+                with open(self.tombstones_path, "ab") as f:
+                    f.write("".join(f"{row}\n" for row in sorted(doomed)).encode("utf-8"))
+                    f.flush()
+                    os.fsync(f.fileno())
+        self._load_new_records()
+        return len(doomed)
+
+    def update_metadata(self, ids, metadatas):
+        with self._lock, self._file_lock():
+            self._load_new_records()
+            self._truncate_uncommitted()
+            # 正文也复制到末尾, 保持 records 中的偏移单调递增(_repair / 截断依赖最后一行的偏移)
+            rows, records = [], []
+            offset = self._committed_text_end()
+            with open(self.texts_path, "ab") as f:
+                for doc_id, meta in zip(ids, metadatas):
+                    row = self._live_row(doc_id)
+                    if row is None:
+                        continue
+                    encoded = self._text(row).encode("utf-8")
+                    f.write(encoded)
+                    rows.append(row)
+                    records.append({"id": doc_id, "metadata": meta, "offset": offset,
+                                    "length": len(encoded), "dim": self.dim})
+                    offset += len(encoded)
+            if records:
+                self._append_rows(np.asarray(self._vectors[rows]), records)
+        self._load_new_records()
+        return len(records)
+
+    def documents(self) -> List[Tuple[str, Dict[str, Any]]]:
+        self._load_new_records()
+        with self._lock:
+            alive = self._alive_mask()
+            return [(self.ids[row], dict(self.metadatas[row])) for row in np.flatnonzero(alive)]
+
+    def compact(self) -> Dict[str, Any]:
+        """
+        把存活的行按原顺序写入下一代文件, fsync 后原子替换 CURRENT, 再删除旧文件。
+        中途退出时 CURRENT 仍指向旧一代, 不完整的新文件会在下次压缩时被覆盖。
+        """
+        with self._lock, self._file_lock():
+            self._load_new_records()
+            before = len(self.ids)
+            rows = np.flatnonzero(self._alive_mask())
+            if len(rows) == before:
+                return {"removed": 0, "documents": before}
+
+            old_paths = self._paths(self.generation)
+            new_generation = self.generation + 1
+            new_paths = self._paths(new_generation)
+            for path in new_paths.values():
+                open(path, "wb").close()
+
+            records = []
+            offset = 0
+            with open(self.texts_path, "rb") as src, open(new_paths["texts"], "wb") as dst:
+                for row in rows:
+                    start, length = self.spans[row]
+                    src.seek(start)
+                    dst.write(src.read(length))
+                    records.append({"id": self.ids[row], "metadata": self.metadatas[row], "offset": offset,
+                                    "length": length, "dim": self.dim})
+                    offset += length
+                dst.flush()
+                os.fsync(dst.fileno())
+            self._append_rows(np.asarray(self._vectors[rows]), records, new_paths)
+
+            tmp = self.current_path + ".tmp"
+            with open(tmp, "w") as f:
+                f.write(str(new_generation))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.current_path)
+            # 其他进程已有的 memmap 仍引用旧文件的 inode, 删除目录项不影响它们
+            for path in old_paths.values():
+                os.remove(path)
+            self._load_new_records()
+            return {"removed": before - len(rows), "documents": len(rows)}
+
+    def disk_bytes(self) -> int:
+        return _directory_size(self.directory)
+
+    def _text(self, row: int) -> str:
+        offset, length = self.spans[row]
+        with open(self.texts_path, "rb") as f:
+            f.seek(offset)
+            return f.read(length).decode("utf-8")
+
+    def _column(self, name: str) -> np.ndarray:
+        col = self._columns.get(name)
+        if col is None:
+            values = [m.get(name) for m in self.metadatas]
+            if all(v is None or (isinstance(v, (int, float)) and not isinstance(v, bool)) for v in values):
+                col = np.array([np.nan if v is None else v for v in values], dtype=float)
+            else:
+                col = np.array(values, dtype=object)
+            self._columns[name] = col
+        return col
+
+    def _mask(self, where: Where) -> np.ndarray:
+        n = len(self.ids)
+        mask = np.ones(n, dtype=bool)
+        for key, cond in where.items():
+            if key == "$and":
+                for sub in cond:
+                    mask &= self._mask(sub)
+            elif key == "$or":
+                any_mask = np.zeros(n, dtype=bool)
+                for sub in cond:
+                    any_mask |= self._mask(sub)
+                mask &= any_mask
+            else:
+                col = self._column(key)
+                ops = cond if isinstance(cond, dict) else {"$eq": cond}
+                for op, value in ops.items():
+                    mask &= _compare(col, op, value)
+        return mask
+
+    def search(self, embedding, k=3, where=None):
+        self._load_new_records()
+        with self._lock:
+            if self._vectors is None:
+                return []
+            mask = self._alive_mask()
+            if where:
+                mask = mask & self._mask(where)
+            rows = np.flatnonzero(mask)
+            if len(rows) == 0:
+                return []
+            query = np.asarray(embedding, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1.0)
+            # 没有过滤条件时直接在 memmap 上计算, 不复制矩阵
+            if len(rows) == len(self.ids):
+                scores = self._vectors @ query
+            else:
+                scores = self._vectors[rows] @ query
+            k = min(k, len(rows))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [
+                SearchHit(id=self.ids[rows[i]], page_content=self._text(rows[i]),
+                          metadata=dict(self.metadatas[rows[i]]), score=float(scores[i]))
+                for i in top
+            ]
+
+    def count(self) -> int:
+        self._load_new_records()
+        with self._lock:
+            return int(self._alive_mask().sum())
+
+def _compare(col: np.ndarray, op: str, value: Any) -> np.ndarray:
+    numeric = col.dtype != object
+    if op == "$eq":
+        return col == value
+    if op == "$ne":
+        return col != value
+    if op in ("$in", "$nin"):
+        hit = np.isin(col, list(value))
+        return hit if op == "$in" else ~hit
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        if not numeric:
+            # 字符串比较(如 ISO 日期), 缺失值不匹配
+            return np.array([v is not None and _ORDER[op](v, value) for v in col], dtype=bool)
+        with np.errstate(invalid="ignore"):
+            return _ORDER[op](col, value)
+    raise ValueError(f"Unsupported where operator: {op}")
+
+_ORDER = {
+    "$gt": lambda a, b: a > b,
+    "$gte": lambda a, b: a >= b,
+    "$lt": lambda a, b: a < b,
+    "$lte": lambda a, b: a <= b,
+}
+
+def _directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+class _FileLock:
+    """跨进程写锁(flock), 多个进程可以安全地追加同一个索引目录"""
+    def __init__(self, path: str):
+        self.path = path
+
+    def __enter__(self):
+        self._f = open(self.path, "a")
+        fcntl.flock(self._f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._f, fcntl.LOCK_UN)
+        self._f.close()
@@ -0,0 +1,146 @@
+"""
+向量库保留策略: 最近 N 天每天保留一份报告, 之后每周一份, 更早的每月一份(按来源分别计算)。
+每个时间桶保留最新的一份作为代表, 其余删除, 然后由后端压缩(重建索引 / 回收磁盘空间)。
+"""
+import json
+import time
+import logging
+import redis
+
+from dataclasses import dataclass, asdict
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+from config import (
+    VECTOR_RETENTION_DAILY_DAYS,
+    VECTOR_RETENTION_WEEKLY_DAYS,
+    VECTOR_COMPACTION_INTERVAL_SECONDS,
+    VECTOR_COMPACTION_KEY,
+    VECTOR_COMPACTION_SCHEDULE_KEY
+)
+from redis_pool import get_redis
+
+VECTOR_RETENTION_REDIS_CLIENT = get_redis(decode_responses=True)
+
+@dataclass
+class RetentionPolicy:
+    daily_days: int = VECTOR_RETENTION_DAILY_DAYS
+    weekly_days: int = VECTOR_RETENTION_WEEKLY_DAYS     # 不大于 daily_days 时直接进入按月保留
+
+    def bucket(self, report_date: date, today: date) -> Tuple:
+        age = (today - report_date).days
+        if age <= self.daily_days:
+            return ("day", report_date.isoformat())
+        if age <= self.weekly_days:
+            year, week, _ = report_date.isocalendar()
+            return ("week", f"{year}-W{week:02d}")
+        return ("month", report_date.strftime("%Y-%m"))
+
+def _report_date(metadata: Dict[str, Any]) -> Optional[date]:
+    try:
+        return datetime.strptime(str(metadata.get("report_date")), "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+def plan_retention(documents: List[Tuple[str, Dict[str, Any]]], policy: RetentionPolicy,
+                   today: Optional[date] = None) -> Tuple[List[str], List[str]]:
+    """
+    返回 (保留的 id, 删除的 id)。同一来源、同一时间桶内只保留最新的一份(先比 report_date,
+    同一天再比写入时间 created_at); 没有有效 report_date 的文档一律保留。
+    """
+    today = today or datetime.utcnow().date()
+    keep: List[str] = []
+    representatives: Dict[Tuple, Tuple[Tuple, str]] = {}
+    delete: List[str] = []
+
+    for doc_id, metadata in documents:
+        report_date = _report_date(metadata)
+        if report_date is None:
+            keep.append(doc_id)
+            continue
+        group = (metadata.get("source"), policy.bucket(report_date, today))
+        # 同一天的报告 report_ts 相同; 没有 created_at 的旧文档视为最早写入
+        rank = (report_date, metadata.get("created_at") or 0, doc_id)
+        current = representatives.get(group)
+        if current is None:
+            representatives[group] = (rank, doc_id)
+        elif rank > current[0]:
+            delete.append(current[1])
+            representatives[group] = (rank, doc_id)
+        else:
+            delete.append(doc_id)
+
+    keep.extend(doc_id for _, doc_id in representatives.values())
+    return keep, delete
+
+def _default_store():
+    from vector_store import get_asset_vector_db
+    return get_asset_vector_db()
+
+def compact_vector_store(store=None, policy: Optional[RetentionPolicy] = None, today: Optional[date] = None,
+                         dry_run: bool = False, client: redis.Redis = VECTOR_RETENTION_REDIS_CLIENT) -> Dict[str, Any]:
+    """
+    按保留策略删除文档并压缩后端, 结果写入 Redis 供 /vector/stats 读取。
+    store 可以是 AssetVectorDB / RemoteAssetVectorDB / 存储后端本身。
+    """
+    store = store or _default_store()
+    policy = policy or RetentionPolicy()
+    started = time.perf_counter()
+
+    before = store.storage_stats()
+    keep, delete = plan_retention(store.documents(), policy, today)
+    summary: Dict[str, Any] = {
+        "policy": asdict(policy),
+        "documents_before": before["documents"],
+        "disk_bytes_before": before["disk_bytes"],
+        "to_delete": len(delete),
+        "dry_run": dry_run
+    }
+    if dry_run:
+        summary["documents_after"] = len(keep)
+        return summary
+
+    removed = store.delete(delete) if delete else 0
+    if removed:
+        store.compact()
+    after = store.storage_stats()
+    summary.update({
+        "deleted": removed,
+        "documents_after": after["documents"],
+        "disk_bytes_after": after["disk_bytes"],
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        "compacted_at": time.time()
+    })
+    try:
+        client.set(VECTOR_COMPACTION_KEY, json.dumps(summary))
+    except Exception as e:
+        logging.warning(f"Failed to record vector compaction: {e}")
+    logging.info(f"Vector store compacted: {removed} deleted, "
+                 f"{summary['disk_bytes_before']} -> {summary['disk_bytes_after']} bytes")
+    return summary
+
+def last_compaction(client: redis.Redis = VECTOR_RETENTION_REDIS_CLIENT) -> Optional[Dict[str, Any]]:
+    try:
+        raw = client.get(VECTOR_COMPACTION_KEY)
+    except Exception as e:
+        logging.warning(f"Failed to read vector compaction status: {e}")
+        return None
+    return json.loads(raw) if raw else None
+
+def vector_stats(store=None) -> Dict[str, Any]:
+    """文档数、磁盘占用与最近一次压缩, /vector/stats 与 check_vector_db.py 共用; 默认不加载嵌入模型"""
+    if store is None:
+        from vector_store import get_vector_storage
+        store = get_vector_storage()
+    stats = dict(store.storage_stats())
+    stats["retention_policy"] = asdict(RetentionPolicy())
+    stats["last_compaction"] = last_compaction()
+    return stats
+
+def should_schedule_compaction(client: redis.Redis = VECTOR_RETENTION_REDIS_CLIENT) -> bool:
+    """每个 VECTOR_COMPACTION_INTERVAL_SECONDS 最多返回一次 True(跨进程)"""
+    try:
+        return bool(client.set(VECTOR_COMPACTION_SCHEDULE_KEY, time.time(), nx=True,
+                               ex=VECTOR_COMPACTION_INTERVAL_SECONDS))
+    except Exception as e:
+        logging.warning(f"Failed to schedule vector compaction: {e}")
+        return False
@@ -1,40 +1,227 @@
 import os
+import time
+import atexit
+import hashlib
 import logging
-from typing import Dict, Any
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_core.documents import Document
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+from config import (
+    VECTOR_SERVICE,
+    VECTOR_BACKEND,
+    NUMPY_VECTOR_DIR,
+    VECTOR_FLUSH_BATCH_SIZE,
+    VECTOR_FLUSH_INTERVAL_SECONDS,
+    VECTOR_SEEN_HASHES_MAX
+)
 
 PERSIST_DIRECTORY = os.path.join(os.path.dirname(__file__), "chroma_db")
 
+def open_backend(name: str = VECTOR_BACKEND):
+    """按名称打开存储后端: chroma(默认) 或 numpy"""
+    from vector_backends import ChromaBackend, NumpyBackend
+
+    if name == "chroma":
+        return ChromaBackend(PERSIST_DIRECTORY)
+    if name == "numpy":
+        return NumpyBackend(NUMPY_VECTOR_DIR)
+    raise ValueError(f"Unknown VECTOR_BACKEND: {name}")
+
 class AssetVectorDB:
-    def __init__(self):
-        self.embedding_function = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
+    def __init__(self, backend=None, embedding_function=None):
+        # 嵌入模型与存储后端较重, 只在第一次使用时导入和加载
+        from embedding_cache import load_embedding_function
+
+        # 包了持久缓存的嵌入函数, 见过的文本不再重复计算; 嵌入统一在这里计算, 后端只存向量
+        self.embedding_function = embedding_function or load_embedding_function()
+        self.backend = backend or open_backend()
+        try:
+            # 旧报告写入时还没有 report_ts, 不补上的话会被所有日期范围过滤排除
+            from report_retrieval import backfill_report_ts
+            backfill_report_ts(self.backend)
+        except Exception as e:
+            logging.warning(f"report_ts backfill failed: {e}")
 
-        self.vector_store = Chroma(
-            collection_name="asset_reports",
-            embedding_function=self.embedding_function,
-            persist_directory=PERSIST_DIRECTORY
-        )
+        # write-behind 缓冲: 内容哈希 -> (文本, 元数据), 按大小或时间批量写入
+        self._pending: "OrderedDict[str, tuple]" = OrderedDict()
+        self._pending_since: Optional[float] = None
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._buffer_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._metrics = {
+            "submitted": 0, "duplicates": 0, "stored": 0,
+            "flushes": 0, "flush_seconds": 0.0, "errors": 0
+        }
+        self._flusher = threading.Thread(target=self._flush_loop, name="vector-flush", daemon=True)
+        self._flusher.start()
+        atexit.register(self.flush)
 
     def add_report(self, report_text: str, metadata: Dict[str, Any]):
-        try:
-            clean_metadata = {
-                k: v for k, v in metadata.items()
-                if isinstance(v, (str, int, float, bool))
-            }
+        """
+        放入写入缓冲后立即返回。文档以内容哈希作为 id, 与缓冲中或已写入的文档重复时直接跳过。
+        """
+        clean_metadata = {
+            k: v for k, v in metadata.items()
+            if isinstance(v, (str, int, float, bool))
+        }
+        doc_id = content_hash(report_text)
 
-            doc = Document(page_content=report_text, metadata=clean_metadata)
+        with self._buffer_lock:
+            self._metrics["submitted"] += 1
+            if doc_id in self._pending or doc_id in self._seen:
+                self._metrics["duplicates"] += 1
+                logging.info(f"Duplicate report skipped: {doc_id[:12]}")
+                return
+            self._pending[doc_id] = (report_text, clean_metadata)
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+            full = len(self._pending) >= VECTOR_FLUSH_BATCH_SIZE
 
-            self.vector_store.add_documents([doc])
-            logging.info(f"Report stored in Vector DB with ID: {clean_metadata.get('report_date')}")
+        if full:
+            self.flush()
 
-        except Exception as e:
-            logging.error(f"Failed to store report in Vector DB: {e}")
+    def flush(self) -> int:
+        """把缓冲中的文档一次性嵌入并写入 Chroma(一次批量前向计算), 返回写入数量"""
+        with self._flush_lock:
+            with self._buffer_lock:
+                batch = list(self._pending.items())
+                self._pending.clear()
+                self._pending_since = None
+            if not batch:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                ids = [doc_id for doc_id, _ in batch]
+                # 其他进程或之前的运行可能已经写入过相同内容
+                existing = self.backend.existing_ids(ids)
+                fresh = [(doc_id, doc) for doc_id, doc in batch if doc_id not in existing]
+                if fresh:
+                    texts = [doc[0] for _, doc in fresh]
+                    self.backend.add(
+                        ids=[doc_id for doc_id, _ in fresh],
+                        texts=texts,
+                        embeddings=self.embedding_function.embed_documents(texts),
+                        metadatas=[doc[1] for _, doc in fresh]
+                    )
+            except Exception as e:
+                logging.error(f"Failed to store reports in Vector DB: {e}")
+                with self._buffer_lock:
+                    self._metrics["errors"] += 1
+                    # 放回缓冲, 下次 flush 重试
+                    for doc_id, doc in batch:
+                        self._pending.setdefault(doc_id, doc)
+                    self._pending_since = self._pending_since or time.monotonic()
+                return 0
+
+            elapsed = time.perf_counter() - started
+            with self._buffer_lock:
+                self._metrics["duplicates"] += len(batch) - len(fresh)
+                self._metrics["stored"] += len(fresh)
+                self._metrics["flushes"] += 1
+                self._metrics["flush_seconds"] += elapsed
+                for doc_id in ids:
+                    self._seen[doc_id] = None
+                while len(self._seen) > VECTOR_SEEN_HASHES_MAX:
+                    self._seen.popitem(last=False)
+            logging.info(f"Vector DB flush: {len(fresh)} stored, {len(batch) - len(fresh)} already present, "
+                         f"{elapsed * 1000:.0f} ms")
+            return len(fresh)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(min(1.0, VECTOR_FLUSH_INTERVAL_SECONDS))
+            since = self._pending_since
+            if since is not None and time.monotonic() - since >= VECTOR_FLUSH_INTERVAL_SECONDS:
+                self.flush()
+
+    def ingest_stats(self) -> Dict[str, Any]:
+        with self._buffer_lock:
+            metrics = dict(self._metrics)
+            metrics["pending"] = len(self._pending)
+        submitted, seconds = metrics["submitted"], metrics["flush_seconds"]
+        metrics["dedup_rate"] = round(metrics["duplicates"] / submitted, 4) if submitted else None
+        metrics["docs_per_second"] = round(metrics["stored"] / seconds, 2) if seconds else None
+        metrics["backend"] = self.backend.name
+        if hasattr(self.embedding_function, "stats"):
+            metrics["embedding_cache"] = self.embedding_function.stats()
+        return metrics
+
+    def similarity_search(self, query: str, k: int = 3, where: Optional[Dict[str, Any]] = None) -> List:
+        """返回 SearchHit 列表(page_content / metadata / score), where 为 Chroma 风格的元数据过滤"""
+        self.flush()
+        return self.backend.search(self.embedding_function.embed_query(query), k=k, where=where)
+
+    def count(self) -> int:
+        self.flush()
+        return self.backend.count()
+
+    def documents(self):
+        self.flush()
+        return self.backend.documents()
+
+    def delete(self, ids) -> int:
+        self.flush()
+        removed = self.backend.delete(ids)
+        with self._buffer_lock:
+            # 删除后相同内容再次提交时应重新写入
+            for doc_id in ids:
+                self._seen.pop(doc_id, None)
+        return removed
+
+    def compact(self) -> Dict[str, Any]:
+        return self.backend.compact()
+
+    def storage_stats(self) -> Dict[str, Any]:
+        self.flush()
+        return self.backend.storage_stats()
+
+    def embed_documents(self, texts):
+        return self.embedding_function.embed_documents(texts)
+
+    def embed_query(self, text: str):
+        return self.embedding_function.embed_query(text)
+
+def content_hash(text: str) -> str:
+    """文档 id: 内容的 sha256, 相同文本只会存储一次"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+_asset_vector_db: Optional[AssetVectorDB] = None
+_asset_vector_db_lock = threading.Lock()
+
+def get_asset_vector_db() -> AssetVectorDB:
+    """
+    第一次调用时加载嵌入模型与向量库(线程安全), 之后复用同一实例。
+    VECTOR_SERVICE=remote 时返回连接 embedding_service 的代理, 本进程不加载模型。
+    """
+    global _asset_vector_db
+    if _asset_vector_db is None:
+        with _asset_vector_db_lock:
+            if _asset_vector_db is None:
+                if VECTOR_SERVICE == "remote":
+                    from embedding_service import RemoteAssetVectorDB
+                    _asset_vector_db = RemoteAssetVectorDB()
+                else:
+                    _asset_vector_db = AssetVectorDB()
+    return _asset_vector_db
+
+_storage_backend = None
 
-    def similarity_search(self, query: str, k: int = 3):
-        return self.vector_store.similarity_search(query, k=k)
+def get_vector_storage():
+    """
+    只读统计(文档数、磁盘占用)使用的存储: 本进程已加载 AssetVectorDB 或使用远程服务时直接复用,
+    否则只打开存储后端并复用, 与 check_vector_db 一样不加载嵌入模型。
+    """
+    global _storage_backend
+    if VECTOR_SERVICE == "remote" or _asset_vector_db is not None:
+        return get_asset_vector_db()
+    with _asset_vector_db_lock:
+        if _storage_backend is None:
+            _storage_backend = open_backend()
+    return _storage_backend
 
-asset_vector_db = AssetVectorDB()
\ No newline at end of file
+def __getattr__(name: str):
+    # 兼容 vector_store.asset_vector_db 的属性访问, 访问时才加载
+    if name == "asset_vector_db":
+        return get_asset_vector_db()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,22 @@
+import logging
+import threading
+
+from jobs import run_worker
+from vector_store import get_asset_vector_db
+from config import PREWARM_ON_STARTUP
+import tasks  # noqa: F401  注册任务处理函数
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+def main():
+    # 独立进程运行: python worker.py
+    # 嵌入模型在后台加载, worker 立即开始消费队列
+    if PREWARM_ON_STARTUP:
+        threading.Thread(target=get_asset_vector_db, name="prewarm-vector-db", daemon=True).start()
+    run_worker()
+
+if __name__ == "__main__":
+    main()